@@ -0,0 +1,70 @@
+"""
+Compare how many cached credentials fit in a MB as DynamoModel vs CachedCredential.
+
+    python -m benchmarks.bench_memory --records 100000
+"""
+import gc
+import tracemalloc
+from argparse import ArgumentParser
+from typing import Any, Callable, Dict
+
+from src.authorizer.authorizer.records import CachedCredential
+from src.authorizer.authorizer.types import DynamoModel
+
+
+def item(i: int) -> Dict[str, Any]:
+    # Topics are built per item the way they come out of DynamoDB, shared by value only
+    return dict(
+        Client_ID=f"device-{i:08d}",
+        Username=f"user-{i:08d}",
+        Password=f"pbkdf2_sha256$100000$salt{i:016d}$hash{i:032d}",
+        allow_connect=True,
+        allow_read=True,
+        allow_write=i % 2 == 0,
+        read_topic="/".join(["fleet", str(i % 10), "*"]),
+        write_topic="/".join(["fleet", str(i % 10), "out"]),
+    )
+
+
+def as_model(i: int) -> DynamoModel:
+    return DynamoModel(**item(i))
+
+
+def as_compact(i: int) -> CachedCredential:
+    return CachedCredential.from_model(DynamoModel(**item(i)))
+
+
+def retained_bytes(build: Callable[[int], Any], records: int) -> int:
+    # Only the cache itself is kept alive, anything temporary is freed before measuring
+    gc.collect()
+    tracemalloc.start()
+    try:
+        cache = {f"device-{i:08d}": build(i) for i in range(records)}
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del cache
+    return current
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=100000)
+    args = parser.parse_args()
+
+    results = dict(
+        DynamoModel=retained_bytes(as_model, args.records),
+        CachedCredential=retained_bytes(as_compact, args.records),
+    )
+    for name, size in results.items():
+        per_mb = args.records / (size / 1024 / 1024)
+        print(
+            f"{name:<17} {size / 1024 / 1024:8.1f} MB  "
+            f"{size / args.records:6.0f} B/entry  {per_mb:8.0f} entries/MB"
+        )
+    print(f"{results['DynamoModel'] / results['CachedCredential']:.1f}x denser")
+
+
+if __name__ == "__main__":
+    main()
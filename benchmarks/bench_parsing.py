@@ -0,0 +1,37 @@
+"""
+Compare the lean event parser with the full AuthorizerInput model.
+
+    python -m benchmarks.bench_parsing --number 20000
+"""
+from argparse import ArgumentParser
+from json import load
+from pathlib import Path
+
+from src.authorizer.authorizer.parsing import parse_lean, parse_strict
+
+from .bench_policy import time_per_call
+
+EVENT_PATH = Path(__file__).parent.parent / "events" / "mqtt_auth_verify.json"
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(EVENT_PATH) as fp:
+        event = load(fp)
+    assert parse_lean(event) == parse_strict(event)
+
+    strict_us = time_per_call(lambda: parse_strict(event), args.number, args.repeat)
+    lean_us = time_per_call(lambda: parse_lean(event), args.number, args.repeat)
+    print(f"strict AuthorizerInput: {strict_us:8.2f} us/call")
+    print(f"lean parse_lean:        {lean_us:8.2f} us/call")
+    print(
+        f"saved {strict_us - lean_us:.2f} us/call ({strict_us / lean_us:.1f}x faster)"
+    )
+
+
+if __name__ == "__main__":
+    main()
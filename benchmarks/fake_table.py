@@ -0,0 +1,57 @@
+from random import Random
+from threading import Lock
+from time import sleep
+from typing import Any, Dict, Optional
+
+
+class FakeTable:
+    """
+    Local stand-in for the MQTTAuthTable with injectable latency.
+
+    Implements just enough of the boto3 Table interface for the authorizer (get_item)
+    and counts reads so benchmarks can report hit ratios and read amplification.
+    throttle_ratio of reads fail the way DynamoDB does when it's out of capacity.
+    """
+
+    def __init__(
+        self,
+        items: Optional[Dict[str, Dict[str, Any]]] = None,
+        latency_ms: float = 0,
+        throttle_ratio: float = 0,
+        seed: int = 0,
+    ):
+        self.items: Dict[str, Dict[str, Any]] = items or {}
+        self.latency_ms = latency_ms
+        self.throttle_ratio = throttle_ratio
+        self.reads = 0
+        self.throttled = 0
+        self._rng = Random(seed)
+        self._lock = Lock()
+
+    def put_item(self, Item: Dict[str, Any]) -> None:
+        self.items[Item["Client_ID"]] = dict(Item)
+
+    def get_item(
+        self, Key: Dict[str, Any], ProjectionExpression: Optional[str] = None, **kwargs
+    ) -> Dict[str, Any]:
+        with self._lock:
+            self.reads += 1
+            throttled = self._rng.random() < self.throttle_ratio
+            self.throttled += throttled
+        if self.latency_ms:
+            sleep(self.latency_ms / 1000)
+        if throttled:
+            from botocore.exceptions import ClientError
+
+            raise ClientError(
+                dict(Error=dict(Code="ProvisionedThroughputExceededException")),
+                "GetItem",
+            )
+        response: Dict[str, Any] = dict(ResponseMetadata=dict(RetryAttempts=0))
+        item = self.items.get(Key["Client_ID"])
+        if item is not None:
+            if ProjectionExpression:  # Like DynamoDB, only return what was asked for
+                fields = [f.strip() for f in ProjectionExpression.split(",")]
+                item = {f: item[f] for f in fields if f in item}
+            response["Item"] = dict(item)
+        return response
@@ -0,0 +1,322 @@
+"""
+Replay synthetic CONNECT events through lambda_handler against a local table.
+
+    python -m benchmarks.harness --clients 1000 --invocations 20000 --dynamo-latency-ms 5
+
+Runs a cold pass (empty caches), a warm pass over the same events and a memory pass,
+then prints throughput, latency percentiles, cache hit ratio and retained memory.
+--min-throughput, --max-p99-ms and --min-hit-ratio (checked on the warm passes) and
+--max-cold-p99-ms (the cold pass against a slow table) make it exit non zero so it can
+gate a release.
+"""
+import tracemalloc
+from argparse import ArgumentParser
+from base64 import b64encode
+from copy import deepcopy
+from json import dumps, load
+from pathlib import Path
+from random import Random
+from time import perf_counter
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from src.authorizer.authorizer.app import lambda_handler
+from src.authorizer.authorizer.credential_cache import credential_cache
+from src.authorizer.authorizer.log import LEVELS, logger
+from src.authorizer.authorizer.policy import compile_statements
+from src.authorizer.authorizer.resources import (
+    DYNAMODB,
+    build_resources,
+    resource_holder,
+)
+
+from .fake_table import FakeTable
+
+EVENT_PATH = Path(__file__).parent.parent / "events"
+EVENT_TEMPLATES = sorted(EVENT_PATH.glob("mqtt_auth_*.json"))
+
+
+class ScenarioResult(NamedTuple):
+    name: str
+    invocations: int
+    seconds: float
+    per_second: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+    hit_ratio: float
+    table_reads: int
+    authenticated: int
+
+
+def device_item(i: int) -> Dict[str, Any]:
+    return dict(
+        Client_ID=f"bench-client-{i}",
+        Username=f"bench-user-{i}",
+        Password=f"bench-pass-{i}",
+        allow_connect=True,
+        allow_read=True,
+        allow_write=i % 2 == 0,
+        read_topic=f"bench/{i % 10}/*",
+        write_topic=f"bench/{i % 10}/write",
+    )
+
+
+def load_templates() -> List[Dict[str, Any]]:
+    templates = []
+    for path in EVENT_TEMPLATES:
+        with open(path) as fp:
+            templates.append(load(fp))
+    return templates
+
+
+def connect_event(
+    template: Dict[str, Any], client_id: str, username: str, password: str
+) -> Dict[str, Any]:
+    event = deepcopy(template)
+    event["protocolData"]["mqtt"] = dict(
+        username=username,
+        password=b64encode(password.encode("utf-8")).decode("utf-8"),
+        clientId=client_id,
+    )
+    return event
+
+
+def make_events(
+    clients: int,
+    invocations: int,
+    unknown_ratio: float = 0,
+    bad_password_ratio: float = 0,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    # A mix of good devices, devices with the wrong password and client ids that don't exist
+    rng = Random(seed)
+    templates = load_templates()
+    events = []
+    for n in range(invocations):
+        template = templates[n % len(templates)]
+        roll = rng.random()
+        if roll < unknown_ratio:
+            events.append(
+                connect_event(template, f"unknown-{rng.randrange(clients)}", "u", "p")
+            )
+            continue
+        item = device_item(rng.randrange(clients))
+        password = "wrong" if roll < unknown_ratio + bad_password_ratio else None
+        events.append(
+            connect_event(
+                template,
+                item["Client_ID"],
+                item["Username"],
+                password or item["Password"],
+            )
+        )
+    return events
+
+
+def make_table(clients: int, latency_ms: float = 0) -> FakeTable:
+    return FakeTable(
+        {item["Client_ID"]: item for item in map(device_item, range(clients))},
+        latency_ms=latency_ms,
+    )
+
+
+def install_table(table: Any) -> None:
+    # Same extension point the handler uses, so no monkey patching of the handler itself
+    resource_holder.register(DYNAMODB, lambda: (None, table))
+
+
+def reset_caches() -> None:
+    # Everything a fresh container wouldn't have
+    credential_cache.clear()
+    compile_statements.cache_clear()
+    resource_holder.reset()
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(p / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_scenario(
+    name: str, events: List[Dict[str, Any]], table: FakeTable
+) -> ScenarioResult:
+    reads_before = table.reads
+    latencies: List[float] = []
+    authenticated = 0
+    start = perf_counter()
+    for event in events:
+        call_start = perf_counter()
+        response = lambda_handler(event, None)
+        latencies.append((perf_counter() - call_start) * 1000)
+        authenticated += response["isAuthenticated"]
+    seconds = perf_counter() - start
+    latencies.sort()
+    reads = table.reads - reads_before
+    return ScenarioResult(
+        name=name,
+        invocations=len(events),
+        seconds=seconds,
+        per_second=len(events) / seconds if seconds else 0.0,
+        p50_ms=percentile(latencies, 50),
+        p90_ms=percentile(latencies, 90),
+        p99_ms=percentile(latencies, 99),
+        max_ms=latencies[-1] if latencies else 0.0,
+        hit_ratio=1 - reads / len(events) if events else 0.0,
+        table_reads=reads,
+        authenticated=authenticated,
+    )
+
+
+def measure_memory(events: List[Dict[str, Any]], table: FakeTable) -> Dict[str, float]:
+    # Separate pass because tracemalloc slows everything down
+    reset_caches()
+    tracemalloc.start()
+    try:
+        for event in events:
+            lambda_handler(event, None)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return dict(
+        retained_kib=current / 1024,
+        peak_kib=peak / 1024,
+        cached_entries=len(credential_cache),
+    )
+
+
+def run(
+    clients: int,
+    invocations: int,
+    dynamo_latency_ms: float = 0,
+    unknown_ratio: float = 0,
+    bad_password_ratio: float = 0,
+    seed: int = 0,
+    memory: bool = True,
+) -> Dict[str, Any]:
+    events = make_events(clients, invocations, unknown_ratio, bad_password_ratio, seed)
+    table = make_table(clients)
+    install_table(table)
+    try:
+        reset_caches()
+        results = [
+            run_scenario("cold", events, table),
+            run_scenario("warm", events, table),
+        ]
+        if dynamo_latency_ms:
+            table.latency_ms = dynamo_latency_ms
+            reset_caches()
+            results.append(run_scenario(f"cold+{dynamo_latency_ms:g}ms", events, table))
+            results.append(run_scenario(f"warm+{dynamo_latency_ms:g}ms", events, table))
+            table.latency_ms = 0
+        report: Dict[str, Any] = dict(scenarios=[r._asdict() for r in results])
+        if memory:
+            report["memory"] = measure_memory(events, table)
+        return report
+    finally:
+        reset_caches()
+        # Put the real DynamoDB back for anything running after us
+        resource_holder.register(DYNAMODB, build_resources)
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    header = (
+        f"{'scenario':<16}{'inv/s':>10}{'p50 ms':>9}{'p90 ms':>9}"
+        f"{'p99 ms':>9}{'max ms':>9}{'hit %':>8}{'reads':>8}"
+    )
+    rows = [header]
+    for r in report["scenarios"]:
+        rows.append(
+            f"{r['name']:<16}{r['per_second']:>10.0f}{r['p50_ms']:>9.3f}"
+            f"{r['p90_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['max_ms']:>9.3f}"
+            f"{r['hit_ratio'] * 100:>8.1f}{r['table_reads']:>8}"
+        )
+    memory = report.get("memory")
+    if memory:
+        rows.append(
+            f"memory: {memory['retained_kib']:.0f} KiB retained, "
+            f"{memory['peak_kib']:.0f} KiB peak, {memory['cached_entries']} cached entries"
+        )
+    return "\n".join(rows)
+
+
+def check_gates(
+    report: Dict[str, Any],
+    min_throughput: Optional[float],
+    max_p99_ms: Optional[float],
+    min_hit_ratio: Optional[float] = None,
+    max_cold_p99_ms: Optional[float] = None,
+) -> List[str]:
+    # Throughput, p99 and hit ratio are checked against every warm run, that's what
+    # most CONNECTs look like. With table latency a cache that stopped working shows up
+    # in warm+Nms, at 0ms only the hit ratio would catch it
+    failures = []
+    for r in report["scenarios"]:
+        name = r["name"]
+        if not name.startswith("warm"):
+            continue
+        if min_throughput is not None and r["per_second"] < min_throughput:
+            failures.append(
+                f"{name} throughput {r['per_second']:.0f}/s < {min_throughput:g}/s"
+            )
+        if max_p99_ms is not None and r["p99_ms"] > max_p99_ms:
+            failures.append(f"{name} p99 {r['p99_ms']:.3f}ms > {max_p99_ms:g}ms")
+        if min_hit_ratio is not None and r["hit_ratio"] < min_hit_ratio:
+            failures.append(
+                f"{name} hit ratio {r['hit_ratio']:.3f} < {min_hit_ratio:g}"
+            )
+    # Misses against a slow table, bounds what coalescing and the pool add on top
+    for r in report["scenarios"]:
+        if r["name"].startswith("cold+") and max_cold_p99_ms is not None:
+            if r["p99_ms"] > max_cold_p99_ms:
+                failures.append(
+                    f"{r['name']} p99 {r['p99_ms']:.3f}ms > {max_cold_p99_ms:g}ms"
+                )
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--invocations", type=int, default=20000)
+    parser.add_argument("--dynamo-latency-ms", type=float, default=0)
+    parser.add_argument("--unknown-ratio", type=float, default=0.05)
+    parser.add_argument("--bad-password-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--min-throughput", type=float, default=None)
+    parser.add_argument("--max-p99-ms", type=float, default=None)
+    parser.add_argument("--min-hit-ratio", type=float, default=None)
+    parser.add_argument("--max-cold-p99-ms", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    # Logging every CONNECT would make this a benchmark of stdout
+    logger.level = LEVELS["WARNING"]
+    report = run(
+        clients=args.clients,
+        invocations=args.invocations,
+        dynamo_latency_ms=args.dynamo_latency_ms,
+        unknown_ratio=args.unknown_ratio,
+        bad_password_ratio=args.bad_password_ratio,
+        seed=args.seed,
+        memory=not args.no_memory,
+    )
+    failures = check_gates(
+        report,
+        args.min_throughput,
+        args.max_p99_ms,
+        args.min_hit_ratio,
+        args.max_cold_p99_ms,
+    )
+    report["failures"] = failures
+    print(dumps(report, indent=2) if args.json else format_report(report))
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,60 @@
+"""
+The original pydantic policy builder, kept as a reference for policy.render_policy.
+
+Every statement is one action on one resource and the whole response is validated by
+the PolicyDocument model. The grants come from policy.grants, so topic handling lives in
+one place and what the comparison checks is the packing and the response itself.
+"""
+from typing import List, Optional
+
+from src.authorizer.authorizer.policy import (
+    DISCONNECT_SECONDS,
+    REFRESH_SECONDS,
+    format_principal,
+    grants,
+    topic_filters,
+)
+from src.authorizer.authorizer.types import (
+    DynamoModel,
+    PolicyDocument,
+    PolicyProfileModel,
+    PolicyStatement,
+)
+
+
+def generate_policy(
+    dynamoData: Optional[DynamoModel],
+    authenticated: bool,
+    client_id: str,
+    profile: Optional[PolicyProfileModel] = None,
+) -> PolicyDocument:
+    policy_statements: List[PolicyStatement] = []
+    if authenticated:  # Only create allow policies if the client is authenticated
+        if dynamoData.profile is not None:
+            if profile is None:
+                raise ValueError(f"{dynamoData.Client_ID} needs its profile")
+            dynamoData = dynamoData.with_profile(profile)
+        allowed = grants(
+            bool(dynamoData.allow_connect),
+            bool(dynamoData.allow_read),
+            bool(dynamoData.allow_write),
+            topic_filters(dynamoData.read_topic),
+            topic_filters(dynamoData.write_topic),
+            dynamoData.Client_ID,
+        )
+        policy_statements = [
+            PolicyStatement(Action=action, Effect="Allow", Resource=resource)
+            for action, resources in allowed.items()
+            for resource in resources
+        ]
+
+    return PolicyDocument(
+        password=None
+        if authenticated is False or dynamoData is None
+        else dynamoData.Password,
+        isAuthenticated=authenticated,
+        principalId=format_principal(client_id),
+        disconnectAfterInSeconds=DISCONNECT_SECONDS,
+        refreshAfterInSeconds=REFRESH_SECONDS,
+        policyDocuments=[dict(Version="2012-10-17", Statement=policy_statements)],
+    )
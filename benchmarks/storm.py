@@ -0,0 +1,329 @@
+"""
+Simulate reconnect storms from a fleet of devices against a local stand-in table.
+
+    python -m benchmarks.storm --devices 5000 --connects 20000 --pattern herd --latency-ms 5
+
+Builds MQTTAuthTable rows for --devices devices and CONNECT events in the events/*.json
+shape, then fires them on a schedule instead of back to back:
+
+    herd     every connect lands within --duration, a broker outage ending
+    bursty   --bursts tight bursts spread over --duration, devices in reconnect loops
+    churn    random arrivals at a steady rate over --duration
+
+at lambda_handler on a thread pool (--target handler, --workers concurrent invocations)
+or at AsyncAuthorizer (--target async). The table can be slow (--latency-ms) and throttle
+(--throttle-ratio of reads fail with ProvisionedThroughputExceededException). Reports the
+success rate, latency from each connect's scheduled time (so queueing counts), a latency
+histogram and backend read amplification, table reads per distinct client id.
+"""
+import asyncio
+from argparse import ArgumentParser
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
+from random import Random
+from time import perf_counter, sleep
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from src.authorizer.authorizer.app import lambda_handler
+from src.authorizer.authorizer.async_core import AsyncAuthorizer
+from src.authorizer.authorizer.log import LEVELS, logger
+from src.authorizer.authorizer.resources import (
+    DYNAMODB,
+    build_resources,
+    resource_holder,
+)
+
+from .fake_table import FakeTable
+from .harness import (
+    connect_event,
+    device_item,
+    install_table,
+    load_templates,
+    percentile,
+    reset_caches,
+)
+
+PATTERNS = ("herd", "bursty", "churn")
+TARGETS = ("handler", "async")
+HISTOGRAM_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# (seconds after the start, device index)
+Arrival = Tuple[float, int]
+
+
+class Outcome(NamedTuple):
+    ok: bool
+    authenticated: bool
+    latency_ms: float
+
+
+def schedule(
+    pattern: str,
+    devices: int,
+    connects: int,
+    duration: float,
+    bursts: int = 5,
+    seed: int = 0,
+) -> List[Arrival]:
+    rng = Random(seed)
+    if pattern == "herd":
+        # Every device once before any device twice, like a fleet coming back
+        order = list(range(devices))
+        rng.shuffle(order)
+        times = sorted(rng.uniform(0, duration) for _ in range(connects))
+        return [(t, order[n % devices]) for n, t in enumerate(times)]
+    if pattern == "bursty":
+        # Each burst takes a tenth of its slot, the rest is quiet
+        slot = duration / max(bursts, 1)
+        arrivals = [
+            (
+                (n % bursts) * slot + rng.uniform(0, slot / 10),
+                rng.randrange(devices),
+            )
+            for n in range(connects)
+        ]
+        return sorted(arrivals)
+    if pattern == "churn":
+        rate = connects / duration if duration else float("inf")
+        arrivals, now = [], 0.0
+        for _ in range(connects):
+            arrivals.append((now, rng.randrange(devices)))
+            now += rng.expovariate(rate) if rate != float("inf") else 0.0
+        return arrivals
+    raise ValueError(f"Unknown pattern {pattern}, expected one of {PATTERNS}")
+
+
+def make_events(
+    arrivals: List[Arrival],
+    unknown_ratio: float = 0,
+    bad_password_ratio: float = 0,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    rng = Random(seed)
+    templates = load_templates()
+    events = []
+    for n, (_, device) in enumerate(arrivals):
+        template = templates[n % len(templates)]
+        roll = rng.random()
+        if roll < unknown_ratio:  # Someone spraying client ids
+            events.append(connect_event(template, f"unknown-{device}", "u", "p"))
+            continue
+        item = device_item(device)
+        wrong = roll < unknown_ratio + bad_password_ratio
+        events.append(
+            connect_event(
+                template,
+                item["Client_ID"],
+                item["Username"],
+                "wrong" if wrong else item["Password"],
+            )
+        )
+    return events
+
+
+def _wait_until(start: float, due: float) -> None:
+    delay = start + due - perf_counter()
+    if delay > 0:
+        sleep(delay)
+
+
+def fire_handler(
+    arrivals: List[Arrival], events: List[Dict[str, Any]], workers: int
+) -> List[Outcome]:
+    # Each worker thread stands in for one concurrent Lambda invocation
+    outcomes: List[Optional[Outcome]] = [None] * len(events)
+
+    def call(n: int, due: float) -> None:
+        try:
+            authenticated = lambda_handler(events[n], None)["isAuthenticated"]
+            ok = True
+        except Exception:
+            authenticated = ok = False
+        outcomes[n] = Outcome(ok, authenticated, (perf_counter() - start - due) * 1000)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = perf_counter()
+        for n, (due, _) in enumerate(arrivals):
+            _wait_until(start, due)
+            pool.submit(call, n, due)
+    return outcomes
+
+
+async def _fire_async(
+    arrivals: List[Arrival], events: List[Dict[str, Any]], workers: int
+) -> List[Outcome]:
+    authorizer = AsyncAuthorizer(executor=ThreadPoolExecutor(max_workers=workers))
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def call(n: int, due: float) -> Outcome:
+        try:
+            response = await authorizer.handle_event(events[n])
+            authenticated, ok = response["isAuthenticated"], True
+        except Exception:
+            authenticated = ok = False
+        return Outcome(ok, authenticated, (loop.time() - start - due) * 1000)
+
+    try:
+        tasks = []
+        for n, (due, _) in enumerate(arrivals):
+            delay = start + due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(call(n, due)))
+        return list(await asyncio.gather(*tasks))
+    finally:
+        authorizer.close()
+
+
+def fire_async(
+    arrivals: List[Arrival], events: List[Dict[str, Any]], workers: int
+) -> List[Outcome]:
+    return asyncio.run(_fire_async(arrivals, events, workers))
+
+
+def histogram(latencies: List[float]) -> Dict[str, int]:
+    labels = [f"<={ms}ms" for ms in HISTOGRAM_MS] + [f">{HISTOGRAM_MS[-1]}ms"]
+    counts = [0] * len(labels)
+    for latency in latencies:
+        counts[bisect_left(HISTOGRAM_MS, latency)] += 1
+    return dict(zip(labels, counts))
+
+
+def summarize(
+    outcomes: List[Outcome],
+    events: List[Dict[str, Any]],
+    table: FakeTable,
+    reads_before: int,
+    seconds: float,
+) -> Dict[str, Any]:
+    latencies = sorted(o.latency_ms for o in outcomes)
+    ok = sum(o.ok for o in outcomes)
+    client_ids = {e["protocolData"]["mqtt"]["clientId"] for e in events}
+    reads = table.reads - reads_before
+    return dict(
+        connects=len(outcomes),
+        seconds=seconds,
+        per_second=len(outcomes) / seconds if seconds else 0.0,
+        success_rate=ok / len(outcomes) if outcomes else 0.0,
+        errors=len(outcomes) - ok,
+        authenticated=sum(o.authenticated for o in outcomes),
+        p50_ms=percentile(latencies, 50),
+        p90_ms=percentile(latencies, 90),
+        p99_ms=percentile(latencies, 99),
+        max_ms=latencies[-1] if latencies else 0.0,
+        histogram=histogram(latencies),
+        distinct_clients=len(client_ids),
+        table_reads=reads,
+        table_throttled=table.throttled,
+        # 1 is one read per device, less is the cache or prewarming, more is retries
+        read_amplification=reads / len(client_ids) if client_ids else 0.0,
+    )
+
+
+def run_storm(
+    devices: int,
+    connects: int,
+    pattern: str = "herd",
+    target: str = "handler",
+    duration: float = 1.0,
+    bursts: int = 5,
+    workers: int = 50,
+    latency_ms: float = 0,
+    throttle_ratio: float = 0,
+    unknown_ratio: float = 0,
+    bad_password_ratio: float = 0,
+    warm: bool = False,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    if target not in TARGETS:
+        raise ValueError(f"Unknown target {target}, expected one of {TARGETS}")
+    arrivals = schedule(pattern, devices, connects, duration, bursts, seed)
+    events = make_events(arrivals, unknown_ratio, bad_password_ratio, seed)
+    table = FakeTable(
+        {item["Client_ID"]: item for item in map(device_item, range(devices))},
+        latency_ms=latency_ms,
+        seed=seed,
+    )
+    install_table(table)
+    try:
+        reset_caches()
+        if warm:  # A container that already saw every device once, off the clock
+            for event in make_events([(0.0, d) for d in range(devices)]):
+                lambda_handler(event, None)
+        table.throttle_ratio = throttle_ratio
+        reads_before = table.reads
+        fire = fire_async if target == "async" else fire_handler
+        start = perf_counter()
+        outcomes = fire(arrivals, events, workers)
+        seconds = perf_counter() - start
+        report = summarize(outcomes, events, table, reads_before, seconds)
+        return dict(pattern=pattern, target=target, warm=warm, **report)
+    finally:
+        reset_caches()
+        # Put the real DynamoDB back for anything running after us
+        resource_holder.register(DYNAMODB, build_resources)
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    width = max(report["histogram"].values(), default=0) or 1
+    rows = [
+        f"{report['pattern']} storm via {report['target']}"
+        f"{' (warm)' if report['warm'] else ''}: {report['connects']} connects from "
+        f"{report['distinct_clients']} client ids in {report['seconds']:.2f}s "
+        f"({report['per_second']:.0f}/s)",
+        f"success {report['success_rate'] * 100:.1f}% ({report['errors']} errors), "
+        f"{report['authenticated']} authenticated",
+        f"latency p50 {report['p50_ms']:.2f}ms p90 {report['p90_ms']:.2f}ms "
+        f"p99 {report['p99_ms']:.2f}ms max {report['max_ms']:.2f}ms",
+    ]
+    for label, count in report["histogram"].items():
+        rows.append(f"  {label:>9} {count:>7} {'#' * round(count / width * 40)}")
+    rows.append(
+        f"table reads {report['table_reads']} ({report['table_throttled']} throttled), "
+        f"read amplification {report['read_amplification']:.2f}"
+    )
+    return "\n".join(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--connects", type=int, default=20000)
+    parser.add_argument("--pattern", choices=PATTERNS, default="herd")
+    parser.add_argument("--target", choices=TARGETS, default="handler")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds")
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--throttle-ratio", type=float, default=0)
+    parser.add_argument("--unknown-ratio", type=float, default=0)
+    parser.add_argument("--bad-password-ratio", type=float, default=0)
+    parser.add_argument("--warm", action="store_true", help="start with a warm cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    # Stale and rebuild warnings are expected under a storm, one per CONNECT is noise
+    logger.level = LEVELS["ERROR"]
+    report = run_storm(
+        devices=args.devices,
+        connects=args.connects,
+        pattern=args.pattern,
+        target=args.target,
+        duration=args.duration,
+        bursts=args.bursts,
+        workers=args.workers,
+        latency_ms=args.latency_ms,
+        throttle_ratio=args.throttle_ratio,
+        unknown_ratio=args.unknown_ratio,
+        bad_password_ratio=args.bad_password_ratio,
+        warm=args.warm,
+        seed=args.seed,
+    )
+    print(dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+asyncio front end to the authorizer, for running it outside Lambda.
+
+A self hosted broker (see sidecar.py) can have thousands of CONNECTs in flight at once.
+Cache hits are answered on the event loop, misses go to the blocking backend on a thread
+pool, and concurrent misses for the same client id share one lookup instead of each
+taking a thread and a backend read.
+"""
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from os import environ
+from typing import Any, Callable, Dict, Optional
+
+from . import instrumentation
+from .core import (
+    cached_details,
+    decide,
+    lookup_client,
+    refresh_client,
+    settle_early,
+    settle_early_blocks,
+    with_cached_profile,
+)
+from .invalidation import invalidations
+from .parsing import AuthorizerRequest, parse_event
+from .records import CachedCredential
+from .singleflight import AsyncSingleFlight
+
+# Threads for blocking backend lookups, botocore's pool (DYNAMO_MAX_POOL_CONNECTIONS) should match
+ASYNC_LOOKUP_WORKERS = int(environ.get("ASYNC_LOOKUP_WORKERS", 10))
+
+
+class AsyncAuthorizer:
+    def __init__(
+        self,
+        lookup: Callable[[str], CachedCredential] = lookup_client,
+        executor: Optional[Executor] = None,
+        refresh: Callable[[str], CachedCredential] = refresh_client,
+    ):
+        self._lookup = lookup
+        self._refresh = refresh
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=ASYNC_LOOKUP_WORKERS, thread_name_prefix="authorizer-lookup"
+        )
+        self._lookups = AsyncSingleFlight()
+
+    def _start_lookup(self, client_id: str) -> "asyncio.Future[CachedCredential]":
+        # Run in a copy of our context so the lookup's counters land on this request
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, copy_context().run, self._lookup, client_id
+        )
+
+    async def lookup(self, client_id: str) -> Optional[CachedCredential]:
+        """The client's credentials, or None if it isn't known."""
+        try:
+            cached = cached_details(client_id, partial(self._refresh, client_id))
+            if cached is not None:
+                cached = with_cached_profile(cached)
+            if cached is not None:
+                return cached
+            return await self._lookups.do(
+                client_id, lambda: self._start_lookup(client_id)
+            )
+        except KeyError:
+            return None
+
+    async def authorize(self, request: AuthorizerRequest) -> Dict[str, Any]:
+        if settle_early_blocks():  # Off the event loop
+            policy = await asyncio.get_running_loop().run_in_executor(
+                self._executor, copy_context().run, settle_early, request
+            )
+        else:
+            policy = settle_early(request)
+        if policy is not None:
+            return policy
+        if invalidations.due():  # Off the event loop, nobody waits for it
+            asyncio.get_running_loop().run_in_executor(
+                self._executor, invalidations.poll
+            )
+        with instrumentation.current().phase("Lookup"):
+            data = await self.lookup(request.mqtt.clientId)
+        return decide(request, data)
+
+    async def handle_event(
+        self, event: Dict[str, Any], source: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Same input and output as lambda_handler."""
+        with instrumentation.recording():
+            with instrumentation.current().phase("Parse"):
+                request = parse_event(event)
+            if source is not None:
+                request = request._replace(source=source)
+            return await self.authorize(request)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,193 @@
+"""
+Where device credentials are looked up, chosen with CREDENTIAL_BACKEND.
+
+dynamodb (the default) reads MQTTAuthTable. sqlite reads a read only, memory mapped SQLite
+file, for edge deployments and benchmarks where there's no network to talk to. Opening it
+doesn't read the file, pages are faulted in as lookups touch them. Build one from the
+same CSV/JSONL files authorizer.provision takes (or a prewarm snapshot) with
+
+    python -m authorizer.backends build-sqlite credentials.jsonl --out credentials.db
+"""
+import sqlite3
+from abc import ABC, abstractmethod
+from argparse import ArgumentParser
+from os import environ
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from . import instrumentation
+from .config import code_path
+from .profiles import profile_key
+from .records import ALLOW_CONNECT, ALLOW_READ, ALLOW_WRITE, pack_flags
+from .resources import DYNAMODB, ClientTable, resource_holder
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
+
+    from .types import DynamoModel, PolicyProfileModel
+
+# "dynamodb" or "sqlite"
+CREDENTIAL_BACKEND = environ.get("CREDENTIAL_BACKEND", "dynamodb").lower()
+# Relative paths are relative to the function's code directory
+CREDENTIAL_DB_PATH = environ.get("CREDENTIAL_DB_PATH", "credentials.db")
+SQLITE_MMAP_BYTES = int(environ.get("SQLITE_MMAP_BYTES", 256 * 1024 * 1024))
+
+CREDENTIALS = "credentials"
+PROJECTION = (
+    "Username, Password, AllowedTopic, allow_read, "
+    "allow_connect, allow_write, read_topic, write_topic, profile"
+)
+
+
+class CredentialBackend(ABC):
+    # Name used for the lookup phase in instrumentation
+    name = "Backend"
+
+    @abstractmethod
+    def get_item(self, client_id: str) -> Optional[Dict[str, Any]]:
+        """The device's attributes (as DynamoDB would return them) or None if unknown."""
+
+
+class DynamoBackend(CredentialBackend):
+    name = "DynamoDB"
+
+    def __init__(self, table: Union["Table", ClientTable]):
+        self.table = table
+
+    def get_item(self, client_id: str) -> Optional[Dict[str, Any]]:
+        response = self.table.get_item(
+            Key=dict(Client_ID=client_id), ProjectionExpression=PROJECTION
+        )
+        instrumentation.current().count(
+            "DynamoRetries",
+            response.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+        )
+        return response.get("Item")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS credentials (
+    Client_ID TEXT PRIMARY KEY,
+    Username TEXT NOT NULL,
+    Password TEXT NOT NULL,
+    read_topic TEXT NOT NULL,
+    write_topic TEXT NOT NULL,
+    flags INTEGER NOT NULL,
+    profile TEXT
+) WITHOUT ROWID
+"""
+
+
+# NUL can't appear in an MQTT topic, so it's safe to join topic lists with
+TOPIC_SEPARATOR = "\0"
+
+
+def _pack_topics(value: Union[str, List[str]]) -> str:
+    return value if isinstance(value, str) else TOPIC_SEPARATOR.join(value)
+
+
+def _unpack_topics(value: str) -> Union[str, List[str]]:
+    return value.split(TOPIC_SEPARATOR) if TOPIC_SEPARATOR in value else value
+
+
+class SQLiteBackend(CredentialBackend):
+    name = "SQLite"
+
+    def __init__(self, path: Path, mmap_bytes: int = SQLITE_MMAP_BYTES):
+        # immutable=1 means no locking or change detection, the file never changes under us
+        self.connection = sqlite3.connect(
+            f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False
+        )
+        self.connection.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+
+    def get_item(self, client_id: str) -> Optional[Dict[str, Any]]:
+        row = self.connection.execute(
+            "SELECT Username, Password, read_topic, write_topic, flags, profile "
+            "FROM credentials WHERE Client_ID = ?",
+            (client_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        username, password, read_topic, write_topic, flags, profile = row
+        if profile is not None:  # Permissions come from the profile, as in DynamoDB
+            return dict(Username=username, Password=password, profile=profile)
+        return dict(
+            Username=username,
+            Password=password,
+            read_topic=_unpack_topics(read_topic),
+            write_topic=_unpack_topics(write_topic),
+            allow_connect=bool(flags & ALLOW_CONNECT),
+            allow_read=bool(flags & ALLOW_READ),
+            allow_write=bool(flags & ALLOW_WRITE),
+        )
+
+
+def _sqlite_row(record: Union["DynamoModel", "PolicyProfileModel"]) -> Tuple:
+    # Profiles go in the same table under their profile#<name> key, like in DynamoDB
+    if not hasattr(record, "Client_ID"):  # A PolicyProfileModel
+        client_id, username, password, profile = profile_key(record.Name), "", "", None
+    else:
+        client_id, username, password = (
+            record.Client_ID,
+            record.Username,
+            record.Password,
+        )
+        profile = record.profile
+    return (
+        client_id,
+        username,
+        password,
+        _pack_topics(record.read_topic or ""),
+        _pack_topics(record.write_topic or ""),
+        pack_flags(record),
+        profile,
+    )
+
+
+def build_sqlite(
+    records: Iterable[Union["DynamoModel", "PolicyProfileModel"]], path: Path
+) -> int:
+    path.unlink(missing_ok=True)
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute(SCHEMA)
+        with connection:
+            cursor = connection.executemany(
+                "INSERT OR REPLACE INTO credentials VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (_sqlite_row(r) for r in records),
+            )
+        connection.execute("VACUUM")  # Packs the file so pages are dense for mmap
+        return cursor.rowcount
+    finally:
+        connection.close()
+
+
+def build_backend() -> CredentialBackend:
+    if CREDENTIAL_BACKEND == "sqlite":
+        return SQLiteBackend(code_path(CREDENTIAL_DB_PATH))
+    if CREDENTIAL_BACKEND == "dynamodb":
+        return DynamoBackend(resource_holder.get(DYNAMODB)[1])
+    raise ValueError(f"Unknown CREDENTIAL_BACKEND {CREDENTIAL_BACKEND}")
+
+
+resource_holder.register(CREDENTIALS, build_backend, depends_on=(DYNAMODB,))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(description="Credential backends")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sqlite_command = commands.add_parser(
+        "build-sqlite", help="build a SQLite credential file from CSV/JSONL records"
+    )
+    sqlite_command.add_argument("path", type=Path)
+    sqlite_command.add_argument("--out", type=Path, default=Path("credentials.db"))
+    args = parser.parse_args(argv)
+
+    from .provision import load_records
+
+    count = build_sqlite(load_records(args.path), args.out)
+    print(f"wrote {count} records to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Helpers for reading settings, kept free of anything heavier than the standard library.
+"""
+from os import environ
+from pathlib import Path
+from typing import Union
+
+
+# The function's code directory, where packaged files (snapshots, databases) end up
+CODE_DIR = Path(__file__).parent.parent
+
+
+def code_path(path: Union[str, Path]) -> Path:
+    # Relative paths are relative to the function's code directory
+    path = Path(path)
+    return path if path.is_absolute() else CODE_DIR / path
+
+
+def env_bool(name: str, default: bool) -> bool:
+    return environ.get(name, str(default)).lower() in ("1", "true", "yes")
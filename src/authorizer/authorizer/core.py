@@ -0,0 +1,300 @@
+"""
+The authorization decision, independent of how requests arrive.
+
+lambda_handler (app.py) and the asyncio front end (async_core.py) both parse a request
+into an AuthorizerRequest, give settle_early() the chance to answer it, look the client
+up and hand the result to decide(). Only the lookup differs, the Lambda handler blocks
+on it, the async one awaits it.
+"""
+from base64 import b64decode
+from binascii import Error as BinasciiError
+from functools import partial
+from hmac import compare_digest
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Union
+
+from . import instrumentation
+from .backends import CREDENTIALS, CredentialBackend, DynamoBackend
+from .config import env_bool
+from .credential_cache import MISSING, credential_cache, refresher
+from .invalidation import invalidations
+from .log import logger
+from .parsing import AuthorizerRequest, MQTTDetails
+from .passwords import verified_memo
+from .policy import DISCONNECT_SECONDS, deny_policy, render_policy
+from .profiles import cached_profile, get_profile, profile_name
+from .records import CachedCredential
+from .resources import ClientTable, resource_holder
+from .singleflight import SingleFlight
+from .throttle import throttle
+from .tokens import TOKEN_MODE, InvalidToken, connection_seconds, split_token, verifier
+
+# Deny anything IoT Core didn't verify the token signature of (a signed authorizer)
+REQUIRE_SIGNATURE_VERIFICATION = env_bool("REQUIRE_SIGNATURE_VERIFICATION", False)
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
+
+    from .types import DynamoModel, MQTTData
+
+
+def check_password(
+    db_creds: Union["DynamoModel", CachedCredential],
+    request_creds: Union["MQTTData", MQTTDetails],
+) -> bool:
+    # Note, password comes in as base64 under normal circumstances.
+    # Both checks always run and compare in constant time so timing doesn't leak which failed
+    username_matches = compare_digest(
+        db_creds.Username.encode("utf-8"), request_creds.username.encode("utf-8")
+    )
+    password_matches = verified_memo.verify(
+        db_creds.Client_ID, db_creds.Password, b64decode(request_creds.password)
+    )
+    return username_matches and password_matches
+
+
+def cached_details(
+    client_id: str, refresh: Optional[Callable[[], Any]] = None
+) -> Optional[CachedCredential]:
+    # None on a cache miss, KeyError if the client is cached as unknown. A hit past the
+    # soft TTL is still returned, and refresh() is queued to run in the background
+    invocation = instrumentation.current()
+    cached, stale = credential_cache.lookup(client_id)
+    if cached is MISSING:
+        invocation.count("NegativeCacheHit")
+        raise KeyError(client_id)
+    if cached is not None:
+        invocation.count("CacheHit")
+        if stale and refresh is not None:
+            invocation.count("StaleHit")
+            refresher.submit(client_id, refresh)
+    return cached
+
+
+lookups = SingleFlight()
+
+
+def _load(client_id: str, backend: CredentialBackend) -> CachedCredential:
+    invocation = instrumentation.current()
+    invocation.count("CacheMiss")
+    with invocation.phase(backend.name):
+        item = backend.get_item(client_id)
+    if item is None:
+        credential_cache.put_missing(client_id)
+        raise KeyError(client_id)
+    from .types import DynamoModel
+
+    # Validated by the model, but what gets cached and returned is the compact record
+    return credential_cache.put(client_id, DynamoModel(**item, Client_ID=client_id))
+
+
+def get_details_for_client_id(
+    client_id: str, backend: Union[CredentialBackend, "Table", ClientTable]
+) -> CachedCredential:
+    # Reconnect storms would otherwise turn straight into a backend read spike
+    if profile_name(client_id) is not None:  # Profiles live in the table, never connect
+        raise KeyError(client_id)
+    if not isinstance(backend, CredentialBackend):  # A plain DynamoDB table
+        backend = DynamoBackend(backend)
+    # Concurrent misses for one client share a single read, and its KeyError if unknown
+    load = partial(lookups.do, client_id, partial(_load, client_id, backend))
+    cached = cached_details(client_id, refresh=load)
+    if cached is not None:
+        return cached
+    return load()
+
+
+def with_cached_profile(record: CachedCredential) -> Optional[CachedCredential]:
+    # record with its profile applied, None if the profile has to be read first
+    if record.profile is None:
+        return record
+    profile = cached_profile(record.profile)
+    return None if profile is None else record.with_profile(profile)
+
+
+def apply_profile(
+    record: CachedCredential, backend: CredentialBackend
+) -> CachedCredential:
+    if record.profile is None:
+        return record
+    try:
+        return record.with_profile(get_profile(record.profile, backend))
+    except KeyError:  # A device pointing at a missing profile gets nothing
+        logger.warning(
+            "Unknown policy profile", clientId=record.Client_ID, profile=record.profile
+        )
+        raise KeyError(record.Client_ID) from None
+
+
+def lookup_client(client_id: str) -> CachedCredential:
+    # Rebuilds the backend (and the client under it) and retries once if it has gone bad
+    try:
+        return resource_holder.call(
+            CREDENTIALS,
+            lambda backend: apply_profile(
+                get_details_for_client_id(client_id, backend), backend
+            ),
+        )
+    except KeyError:
+        raise
+    except Exception as e:
+        # With CREDENTIAL_CACHE_STALE_IF_ERROR_SECONDS set, an outage or throttling
+        # serves what we had rather than locking every device out
+        stale = credential_cache.get_stale(client_id)
+        if stale is not None:
+            stale = with_cached_profile(stale)
+        if stale is None:
+            raise
+        logger.warning("Serving stale credentials", clientId=client_id, error=repr(e))
+        instrumentation.current().count("ServedStale")
+        return stale
+
+
+def refresh_client(client_id: str) -> CachedCredential:
+    # Reads through to the backend even if the cache has the client, the profile
+    # (if there is one) is applied when the record is next used
+    return resource_holder.call(
+        CREDENTIALS,
+        lambda backend: lookups.do(client_id, partial(_load, client_id, backend)),
+    )
+
+
+def log_result(client_id: str, authenticated: bool, known_client: bool = True) -> None:
+    logger.info(
+        "client authentication", clientId=client_id, authenticated=authenticated
+    )
+    logger.metrics(
+        {"Authenticated" if authenticated else "Rejected": 1},
+        UnknownClient=not known_client,
+    )
+
+
+def decide(
+    request: AuthorizerRequest, data: Optional[CachedCredential]
+) -> Dict[str, Any]:
+    """The policy for a request, data is None when the client id isn't known."""
+    invocation = instrumentation.current()
+    details = request.mqtt
+    if data is None:
+        log_result(details.clientId, False, known_client=False)
+        with invocation.phase("Policy"):
+            return render_policy(
+                authenticated=False, dynamoData=None, client_id=details.clientId
+            )
+    with invocation.phase("CheckPassword"):
+        authenticated = check_password(data, details)
+    log_result(details.clientId, authenticated)
+    with invocation.phase("Policy"):
+        returned_policy = render_policy(
+            dynamoData=data,
+            authenticated=authenticated,
+            client_id=details.clientId,
+        )
+    if logger.enabled("DEBUG"):  # redact() walks the whole policy, skip it if unused
+        logger.debug("returned policy", policy=returned_policy)
+    return returned_policy
+
+
+def throttled(request: AuthorizerRequest, limit: Optional[str]) -> Dict[str, Any]:
+    logger.info("client throttled", clientId=request.mqtt.clientId, limit=limit)
+    logger.metrics({"Throttled": 1}, Limit=limit)
+    instrumentation.current().count("Throttled")
+    return deny_policy(request.mqtt.clientId)
+
+
+def _as_token(value: str) -> Optional[str]:
+    # value if it's laid out like one of our tokens, whether or not it verifies
+    try:
+        split_token(value)
+    except InvalidToken:
+        return None
+    return value
+
+
+def request_token(request: AuthorizerRequest) -> Optional[str]:
+    # A signed authorizer's token, or a password that is a token rather than a password.
+    # Legacy devices behind a signed authorizer send some other token, they use the table
+    if request.token and _as_token(request.token) is not None:
+        return request.token
+    try:
+        password = b64decode(request.mqtt.password).decode("utf-8")
+    except (BinasciiError, UnicodeDecodeError, ValueError):
+        return None
+    return _as_token(password)
+
+
+def authorize_token(request: AuthorizerRequest) -> Optional[Dict[str, Any]]:
+    """The policy for a token carrying request, None to go on to the table lookup."""
+    if TOKEN_MODE == "off":
+        return None
+    client_id = request.mqtt.clientId
+    token = request_token(request)
+    if token is None:
+        if TOKEN_MODE != "require":  # A device that hasn't moved to tokens yet
+            return None
+        log_result(client_id, False)
+        return deny_policy(client_id)
+    invocation = instrumentation.current()
+    with invocation.phase("VerifyToken"):
+        try:
+            claims = verifier.verify(token, client_id)
+        except InvalidToken as e:
+            logger.info("invalid token", clientId=client_id, error=str(e))
+            claims = None
+    log_result(client_id, claims is not None)
+    if claims is None:
+        return deny_policy(client_id)
+    with invocation.phase("Policy"):
+        policy = render_policy(
+            dynamoData=claims.credential(request.mqtt.username),
+            authenticated=True,
+            client_id=client_id,
+        )
+    seconds = connection_seconds(claims, DISCONNECT_SECONDS)
+    policy["disconnectAfterInSeconds"] = seconds
+    policy["refreshAfterInSeconds"] = min(policy["refreshAfterInSeconds"], seconds)
+    return policy
+
+
+def unverified(request: AuthorizerRequest) -> Optional[Dict[str, Any]]:
+    """A deny if signatures are required and this request's wasn't verified, else None."""
+    if not REQUIRE_SIGNATURE_VERIFICATION or request.signatureVerified is True:
+        return None
+    log_result(request.mqtt.clientId, False)
+    return deny_policy(request.mqtt.clientId)
+
+
+def settle_early(request: AuthorizerRequest) -> Optional[Dict[str, Any]]:
+    """
+    The policy for a request settled before its credentials are looked up, None if
+    it needs the lookup.
+
+    Both front ends go through this, in this order: the signature requirement, the
+    throttle, then a signed token. Blocks on the shared throttle if that's on, see
+    settle_early_blocks().
+    """
+    policy = unverified(request)
+    if policy is not None:
+        return policy
+    # The source is only known from the sidecar, IoT Core's events carry no address
+    limit = throttle.check(request.mqtt.clientId, request.source)
+    if limit is not None:
+        return throttled(request, limit)
+    return authorize_token(request)
+
+
+def settle_early_blocks() -> bool:
+    # The shared throttle is a network call, the rest of settle_early is CPU only
+    return throttle.shared
+
+
+def authorize(request: AuthorizerRequest) -> Dict[str, Any]:
+    policy = settle_early(request)
+    if policy is not None:
+        return policy
+    invalidations.maybe_poll()
+    try:
+        with instrumentation.current().phase("Lookup"):
+            data: Optional[CachedCredential] = lookup_client(request.mqtt.clientId)
+    except KeyError:  # User ID not found in table
+        data = None
+    return decide(request, data)
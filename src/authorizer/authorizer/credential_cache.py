@@ -0,0 +1,190 @@
+from os import environ
+from threading import Lock, RLock
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Callable, Optional, Set, Tuple, Union
+
+from cachetools import TTLCache
+
+from .log import logger
+from .records import CachedCredential
+
+if TYPE_CHECKING:
+    from .types import DynamoModel
+
+# Set CREDENTIAL_CACHE_TTL_SECONDS to 0 to turn caching off entirely
+CREDENTIAL_CACHE_TTL_SECONDS = float(environ.get("CREDENTIAL_CACHE_TTL_SECONDS", 60))
+CREDENTIAL_CACHE_NEGATIVE_TTL_SECONDS = float(
+    environ.get("CREDENTIAL_CACHE_NEGATIVE_TTL_SECONDS", 30)
+)
+CREDENTIAL_CACHE_MAX_ENTRIES = int(environ.get("CREDENTIAL_CACHE_MAX_ENTRIES", 10000))
+# Past the soft TTL a hit is still served, but refreshed in the background.
+# Defaults to the (hard) TTL, which means never
+CREDENTIAL_CACHE_SOFT_TTL_SECONDS = float(
+    environ.get("CREDENTIAL_CACHE_SOFT_TTL_SECONDS", CREDENTIAL_CACHE_TTL_SECONDS)
+)
+# How long past the hard TTL an entry is kept to serve if the backend is failing, 0 is off
+CREDENTIAL_CACHE_STALE_IF_ERROR_SECONDS = float(
+    environ.get("CREDENTIAL_CACHE_STALE_IF_ERROR_SECONDS", 0)
+)
+CREDENTIAL_REFRESH_WORKERS = int(environ.get("CREDENTIAL_REFRESH_WORKERS", 2))
+
+
+class _Missing:
+    # Sentinel for "we asked DynamoDB and this Client_ID isn't there"
+    def __repr__(self) -> str:
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class CredentialCache:
+    """
+    Warm container cache of device credentials keyed by Client_ID.
+
+    Records are stored as compact CachedCredential objects rather than DynamoModel.
+
+    TTLCache already evicts least recently used entries once it hits maxsize, so that
+    gives us LRU eviction for free. Unknown client ids are kept in a separate (smaller,
+    shorter lived) cache so a device spamming a bad id can't push real devices out.
+
+    Entries have three ages: younger than soft_ttl they're fresh, up to ttl they're
+    served but flagged for a background refresh, and up to ttl + stale_if_error they're
+    only handed out by get_stale() when the backend can't be reached.
+    """
+
+    def __init__(
+        self,
+        ttl: float = CREDENTIAL_CACHE_TTL_SECONDS,
+        negative_ttl: float = CREDENTIAL_CACHE_NEGATIVE_TTL_SECONDS,
+        maxsize: int = CREDENTIAL_CACHE_MAX_ENTRIES,
+        soft_ttl: Optional[float] = None,
+        stale_if_error: float = CREDENTIAL_CACHE_STALE_IF_ERROR_SECONDS,
+    ):
+        self.enabled = ttl > 0 and maxsize > 0
+        self.negative_enabled = self.enabled and negative_ttl > 0
+        self.ttl = ttl
+        self.soft_ttl = min(
+            ttl, CREDENTIAL_CACHE_SOFT_TTL_SECONDS if soft_ttl is None else soft_ttl
+        )
+        self.stale_if_error = max(stale_if_error, 0)
+        # Values are (record, time it was fetched)
+        self._found = TTLCache(
+            maxsize=max(maxsize, 1), ttl=ttl + self.stale_if_error, timer=monotonic
+        )
+        self._missing = TTLCache(
+            maxsize=max(maxsize // 10, 1), ttl=max(negative_ttl, 0), timer=monotonic
+        )
+        # cachetools caches aren't thread safe and get() mutates LRU order
+        self._lock = RLock()
+
+    def lookup(
+        self, client_id: str
+    ) -> Tuple[Union[CachedCredential, _Missing, None], bool]:
+        # The cached record, MISSING for a known bad id or None on a miss, and whether
+        # the record is past its soft TTL and should be refreshed
+        if not self.enabled:
+            return None, False
+        with self._lock:
+            found = self._found.get(client_id)
+            if found is not None:
+                record, fetched = found
+                age = monotonic() - fetched
+                if age < self.ttl:
+                    return record, age >= self.soft_ttl
+            elif client_id in self._missing:
+                return MISSING, False
+        return None, False
+
+    def get(self, client_id: str) -> Union[CachedCredential, _Missing, None]:
+        return self.lookup(client_id)[0]
+
+    def get_stale(self, client_id: str) -> Optional[CachedCredential]:
+        # Whatever we still hold for client_id, however old, if serving stale is on
+        if not self.enabled or not self.stale_if_error:
+            return None
+        with self._lock:
+            found = self._found.get(client_id)
+        return None if found is None else found[0]
+
+    def put(
+        self,
+        client_id: str,
+        record: Union[CachedCredential, "DynamoModel"],
+        age: float = 0,
+    ) -> CachedCredential:
+        # age is how long ago the record was read, it expires ttl after that
+        if not isinstance(record, CachedCredential):
+            record = CachedCredential.from_model(record)
+        if not self.enabled or age >= self.ttl:
+            return record
+        with self._lock:
+            self._missing.pop(client_id, None)
+            self._found[client_id] = (record, monotonic() - age)
+        return record
+
+    def put_missing(self, client_id: str) -> None:
+        if not self.negative_enabled:
+            return
+        with self._lock:
+            self._found.pop(client_id, None)
+            self._missing[client_id] = True
+
+    def invalidate(self, client_id: str) -> None:
+        with self._lock:
+            self._found.pop(client_id, None)
+            self._missing.pop(client_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._found.clear()
+            self._missing.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._found) + len(self._missing)
+
+
+class BackgroundRefresher:
+    """Runs refreshes on a small thread pool, at most one queued or running per key."""
+
+    def __init__(self, workers: int = CREDENTIAL_REFRESH_WORKERS):
+        self.workers = workers
+        self._pending: Set[str] = set()
+        self._lock = Lock()
+        self._pool: Any = None
+
+    def submit(self, key: str, refresh: Callable[[], Any]) -> bool:
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            if self._pool is None:  # Most containers never need it
+                from concurrent.futures import ThreadPoolExecutor
+
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="credential-refresh"
+                )
+        self._pool.submit(self._run, key, refresh)
+        return True
+
+    def _run(self, key: str, refresh: Callable[[], Any]) -> None:
+        try:
+            refresh()
+        except KeyError:  # Deleted from the table, the refresh cached it as missing
+            pass
+        except Exception as e:  # The entry stays until its hard TTL
+            logger.warning(
+                "Background credential refresh failed", key=key, error=repr(e)
+            )
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+credential_cache = CredentialCache()
+refresher = BackgroundRefresher()
@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from os import environ
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .log import logger
+
+# "off", "emf" for CloudWatch Embedded Metric Format, or "record" for one JSON log line
+INSTRUMENTATION = environ.get("INSTRUMENTATION", "off").lower()
+
+
+class _Phase:
+    __slots__ = ("invocation", "name", "start")
+
+    def __init__(self, invocation: "Invocation", name: str):
+        self.invocation = invocation
+        self.name = name
+
+    def __enter__(self) -> "_Phase":
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.invocation.add_time(self.name, (perf_counter() - self.start) * 1000)
+
+
+class Invocation:
+    """Per invocation timings (in milliseconds) and counters."""
+
+    __slots__ = ("timings", "counters", "start")
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.start = perf_counter()
+
+    def phase(self, name: str) -> _Phase:
+        return _Phase(self, name)
+
+    def add_time(self, name: str, ms: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + ms
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def total_ms(self) -> float:
+        return (perf_counter() - self.start) * 1000
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullPhase":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+class _NullInvocation:
+    # What everything talks to when instrumentation is off, so the hot path has no ifs
+    __slots__ = ()
+    _phase = _NullPhase()
+
+    def phase(self, name: str) -> _NullPhase:
+        return self._phase
+
+    def add_time(self, name: str, ms: float) -> None:
+        pass
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+
+NULL_INVOCATION = _NullInvocation()
+
+# A ContextVar rather than a global so concurrent (async/threaded) callers don't mix
+_current: ContextVar = ContextVar("invocation", default=NULL_INVOCATION)
+
+
+def current() -> Invocation:
+    return _current.get()
+
+
+def emit(invocation: Invocation, mode: str = INSTRUMENTATION) -> None:
+    timings = {f"{name}Ms": round(ms, 3) for name, ms in invocation.timings.items()}
+    timings["TotalMs"] = round(invocation.total_ms(), 3)
+    if mode == "emf":
+        logger.emf(
+            {**timings, **invocation.counters},
+            units={name: "Milliseconds" for name in timings},
+        )
+    else:
+        logger.write(
+            dict(message="invocation", timings=timings, counters=invocation.counters)
+        )
+
+
+@contextmanager
+def recording(mode: Optional[str] = None) -> Iterator[Any]:
+    # Records phases for everything run inside the block, then emits one record
+    active = mode or INSTRUMENTATION
+    if active == "off":
+        yield NULL_INVOCATION
+        return
+    invocation = Invocation()
+    token = _current.set(invocation)
+    try:
+        yield invocation
+    finally:
+        _current.reset(token)
+        emit(invocation, active)
+
+
+def instrumented(fn: Optional[Callable] = None, mode: Optional[str] = None) -> Callable:
+    # Decorator version of recording() for the Lambda handler. Decided once at
+    # import, with instrumentation off the handler is returned untouched
+    active = mode or INSTRUMENTATION
+
+    def decorator(fn: Callable) -> Callable:
+        if active == "off":
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs) -> Any:
+            with recording(active):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator(fn) if fn is not None else decorator
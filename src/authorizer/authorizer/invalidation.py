@@ -0,0 +1,247 @@
+"""
+Push credential changes out to warm containers so cache TTLs can be long.
+
+    MQTTAuthTable --stream--> stream_handler --markers--> channel <--poll-- authorizers
+
+stream_handler is its own Lambda function on the table's DynamoDB stream, for every
+inserted, modified or removed device it writes a small marker (just the Client_ID) to
+the channel. Authorizer containers read every marker written since their last poll in
+one request, at most once every INVALIDATION_POLL_SECONDS, and drop those devices from
+their credential cache. A revoked device or rotated password then takes effect within
+a poll interval instead of a cache TTL.
+
+The channel is a DynamoDB table with one partition of markers sorted by time, which
+keeps a poll to a single Query. MemoryChannel is a stand in for running it locally.
+"""
+from abc import ABC, abstractmethod
+from os import environ
+from threading import Lock
+from time import monotonic, time, time_ns
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from . import instrumentation
+from .credential_cache import CredentialCache, credential_cache
+from .log import logger
+from .profiles import ProfileCache, profile_cache, profile_name
+from .resources import DYNAMODB, dynamodb_client, resource_holder
+
+# "off", "dynamodb" or "memory" (in process, for local testing)
+INVALIDATION_CHANNEL = environ.get("INVALIDATION_CHANNEL", "off").lower()
+INVALIDATION_TABLE_NAME = environ.get(
+    "INVALIDATION_TABLE_NAME", "MQTTAuthInvalidations"
+)
+INVALIDATION_POLL_SECONDS = float(environ.get("INVALIDATION_POLL_SECONDS", 5))
+# Markers are read again for this long, covering clock skew and late stream batches
+INVALIDATION_LAG_SECONDS = float(environ.get("INVALIDATION_LAG_SECONDS", 10))
+# DynamoDB TTL deletes markers after this, nothing reads them after a poll interval or two
+INVALIDATION_MARKER_TTL_SECONDS = int(
+    environ.get("INVALIDATION_MARKER_TTL_SECONDS", 24 * 3600)
+)
+INVALIDATION_MAX_PAGES = int(environ.get("INVALIDATION_MAX_PAGES", 10))
+
+INVALIDATIONS = "invalidations"
+PARTITION = "credentials"
+
+
+def marker_seq(now_ns: int, client_id: str = "") -> str:
+    # Sorts by time, the client id only keeps two markers in the same nanosecond apart
+    return f"{now_ns:020d}#{client_id}"
+
+
+class Markers(NamedTuple):
+    client_ids: List[str]
+    # Seq of the last marker read if the read stopped with more left, None if it didn't
+    resume_after: Optional[str] = None
+
+
+class InvalidationChannel(ABC):
+    @abstractmethod
+    def publish(self, client_ids: Iterable[str]) -> int:
+        """Write one marker per client id, returns how many were written."""
+
+    @abstractmethod
+    def read_since(self, cursor: str) -> Markers:
+        """Client ids of the markers after cursor (a marker_seq)."""
+
+
+class MemoryChannel(InvalidationChannel):
+    def __init__(self):
+        self.markers: List[Tuple[str, str]] = []
+        self.reads = 0
+        self._lock = Lock()
+
+    def publish(self, client_ids: Iterable[str]) -> int:
+        now = time_ns()
+        with self._lock:
+            new = [(marker_seq(now, c), c) for c in client_ids]
+            self.markers.extend(new)
+            self.markers.sort()
+        return len(new)
+
+    def read_since(self, cursor: str) -> Markers:
+        with self._lock:
+            self.reads += 1
+            return Markers(
+                [client_id for seq, client_id in self.markers if seq > cursor]
+            )
+
+
+class DynamoChannel(InvalidationChannel):
+    """Markers in a table keyed by (Channel, Seq), with ExpiresAt as its TTL attribute."""
+
+    def __init__(self, client: Any, table_name: str = INVALIDATION_TABLE_NAME):
+        self.client = client
+        self.table_name = table_name
+
+    def publish(self, client_ids: Iterable[str]) -> int:
+        from .provision import chunked, write_chunk
+
+        now = time_ns()
+        expires = int(time()) + INVALIDATION_MARKER_TTL_SECONDS
+        items = [
+            dict(
+                Channel=PARTITION,
+                Seq=marker_seq(now, client_id),
+                Client_ID=client_id,
+                ExpiresAt=expires,
+            )
+            for client_id in client_ids
+        ]
+        for chunk in chunked(items):
+            write_chunk(self.client, self.table_name, chunk)
+        return len(items)
+
+    def read_since(self, cursor: str) -> Markers:
+        client_ids: List[str] = []
+        kwargs: Dict[str, Any] = dict(
+            TableName=self.table_name,
+            KeyConditionExpression="Channel = :channel AND Seq > :cursor",
+            ExpressionAttributeValues={
+                ":channel": dict(S=PARTITION),
+                ":cursor": dict(S=cursor),
+            },
+            ProjectionExpression="Client_ID, Seq",
+        )
+        for _ in range(INVALIDATION_MAX_PAGES):
+            page = self.client.query(**kwargs)
+            client_ids.extend(item["Client_ID"]["S"] for item in page["Items"])
+            if "LastEvaluatedKey" not in page:
+                return Markers(client_ids)
+            kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+        # Out of pages with more to read, the next poll picks up from here
+        return Markers(client_ids, kwargs["ExclusiveStartKey"]["Seq"]["S"])
+
+
+def build_channel() -> InvalidationChannel:
+    if INVALIDATION_CHANNEL == "memory":
+        return MemoryChannel()
+    if INVALIDATION_CHANNEL == "dynamodb":
+        return DynamoChannel(dynamodb_client())
+    raise ValueError(f"Unknown INVALIDATION_CHANNEL {INVALIDATION_CHANNEL}")
+
+
+resource_holder.register(INVALIDATIONS, build_channel, depends_on=(DYNAMODB,))
+
+
+class InvalidationPoller:
+    """
+    Applies markers to the credential and profile caches, at most once per interval.
+
+    due() is a clock comparison so it can sit on the request path. Only one caller
+    polls at a time, anyone else arriving mid poll carries on without waiting.
+    """
+
+    def __init__(
+        self,
+        channel: Optional[InvalidationChannel] = None,
+        interval: float = INVALIDATION_POLL_SECONDS,
+        lag: float = INVALIDATION_LAG_SECONDS,
+        cache: CredentialCache = credential_cache,
+        enabled: bool = INVALIDATION_CHANNEL != "off",
+        profiles: ProfileCache = profile_cache,
+    ):
+        self.channel = channel
+        self.interval = interval
+        self.lag_ns = int(lag * 1e9)
+        self.cache = cache
+        self.profiles = profiles
+        self.enabled = enabled
+        # Nothing from before the container started can be in its cache
+        self.cursor = marker_seq(time_ns() - self.lag_ns)
+        self._next_poll = 0.0
+        self._lock = Lock()
+
+    def rewind(self, since: float) -> None:
+        # The cache was filled with data read at since (seconds since the epoch)
+        with self._lock:
+            self.cursor = min(self.cursor, marker_seq(int(since * 1e9) - self.lag_ns))
+
+    def due(self) -> bool:
+        return self.enabled and monotonic() >= self._next_poll
+
+    def _read(self, cursor: str) -> Markers:
+        if self.channel is not None:
+            return self.channel.read_since(cursor)
+        return resource_holder.call(
+            INVALIDATIONS, lambda channel: channel.read_since(cursor)
+        )
+
+    def poll(self) -> int:
+        # Returns how many cached clients were invalidated
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            if not self.due():
+                return 0
+            # Set before reading, so a failing channel is retried at the same rate
+            self._next_poll = monotonic() + self.interval
+            started = time_ns()
+            markers = self._read(self.cursor)
+            client_ids = set(markers.client_ids)
+            for client_id in client_ids:
+                name = profile_name(client_id)
+                if name is None:
+                    self.cache.invalidate(client_id)
+                else:  # Devices keep their profile name, the next use rereads it
+                    self.profiles.invalidate(name)
+            cursor = marker_seq(started - self.lag_ns)
+            if markers.resume_after is not None:
+                # Never past what was read, and read the rest on the next CONNECT
+                cursor = min(cursor, markers.resume_after)
+                self._next_poll = 0.0
+            self.cursor = cursor
+            instrumentation.current().count("Invalidations", len(client_ids))
+            return len(client_ids)
+        except Exception as e:  # Stale for another interval beats failing a CONNECT
+            logger.warning("Invalidation poll failed", error=repr(e))
+            return 0
+        finally:
+            self._lock.release()
+
+    def maybe_poll(self) -> None:
+        if self.due():
+            self.poll()
+
+
+invalidations = InvalidationPoller()
+
+
+def changed_client_ids(event: Dict[str, Any]) -> List[str]:
+    # Inserts matter too, the new device may be cached as unknown
+    seen: Dict[str, None] = {}
+    for record in event.get("Records", []):
+        if record.get("eventName") not in ("INSERT", "MODIFY", "REMOVE"):
+            continue
+        key = record.get("dynamodb", {}).get("Keys", {}).get("Client_ID", {})
+        if "S" in key:
+            seen[key["S"]] = None
+    return list(seen)
+
+
+def stream_handler(event, context):
+    """Lambda handler for the MQTTAuthTable stream (KEYS_ONLY is all it needs)."""
+    client_ids = changed_client_ids(event)
+    if client_ids:
+        resource_holder.call(INVALIDATIONS, lambda channel: channel.publish(client_ids))
+    logger.info("published invalidations", count=len(client_ids))
+    return dict(published=len(client_ids))
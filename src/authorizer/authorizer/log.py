@@ -0,0 +1,142 @@
+import sys
+from json import dumps
+from os import environ
+from random import random
+from time import time
+from typing import Any, Dict, Mapping, Optional, TextIO
+
+LEVELS = dict(DEBUG=10, INFO=20, WARNING=30, ERROR=40)
+
+LOG_LEVEL = environ.get("LOG_LEVEL", "INFO").upper()
+# Fraction of DEBUG/INFO lines that get written, warnings and errors are always written
+LOG_SAMPLE_RATE = float(environ.get("LOG_SAMPLE_RATE", 1))
+# "emf" writes CloudWatch Embedded Metric Format lines, "log" writes them as normal log lines
+METRICS_FORMAT = environ.get("METRICS_FORMAT", "off").lower()
+METRICS_NAMESPACE = environ.get("METRICS_NAMESPACE", "MQTTAuthorizer")
+
+# Anything under one of these keys gets blanked before it's written, at any depth
+SECRET_KEYS = frozenset(("password", "token", "secret"))
+REDACTED = "***"
+
+
+def redact(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return {
+            k: REDACTED if str(k).lower() in SECRET_KEYS else redact(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    return value
+
+
+class JsonLogger:
+    """
+    Writes one compact JSON object per line, which CloudWatch Logs Insights can query.
+
+    Lines under the configured level cost a single comparison, and DEBUG/INFO lines can be
+    sampled so a connect storm doesn't turn into a CloudWatch ingestion bill.
+    """
+
+    def __init__(
+        self,
+        level: str = LOG_LEVEL,
+        sample_rate: float = LOG_SAMPLE_RATE,
+        metrics_format: str = METRICS_FORMAT,
+        namespace: str = METRICS_NAMESPACE,
+        stream: Optional[TextIO] = None,
+    ):
+        self.level = LEVELS.get(level.upper(), LEVELS["INFO"])
+        self.sample_rate = sample_rate
+        self.metrics_format = metrics_format
+        self.namespace = namespace
+        self.stream = stream
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS[level] >= self.level
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        # Looked up per write so anything swapping sys.stdout (pytest, Lambda) still works
+        (self.stream or sys.stdout).write(
+            dumps(record, separators=(",", ":"), default=str) + "\n"
+        )
+
+    def log(self, level: str, message: str, **fields: Any) -> None:
+        level_no = LEVELS[level]
+        if level_no < self.level:
+            return
+        if level_no < LEVELS["WARNING"] and random() >= self.sample_rate:
+            return
+        self._write(dict(level=level, message=message, **redact(fields)))
+
+    def debug(self, message: str, **fields: Any) -> None:
+        self.log("DEBUG", message, **fields)
+
+    def info(self, message: str, **fields: Any) -> None:
+        self.log("INFO", message, **fields)
+
+    def warning(self, message: str, **fields: Any) -> None:
+        self.log("WARNING", message, **fields)
+
+    def error(self, message: str, **fields: Any) -> None:
+        self.log("ERROR", message, **fields)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        # Unsampled and unfiltered, for records that are already opt in (e.g. instrumentation)
+        self._write(redact(record))
+
+    def emf(
+        self,
+        metrics: Dict[str, float],
+        units: Optional[Dict[str, str]] = None,
+        dimensions: Optional[Dict[str, str]] = None,
+        **properties: Any,
+    ) -> None:
+        units = units or {}
+        dimensions = dimensions or {}
+        self._write(
+            dict(
+                _aws=dict(
+                    Timestamp=int(time() * 1000),
+                    CloudWatchMetrics=[
+                        dict(
+                            Namespace=self.namespace,
+                            Dimensions=[list(dimensions)],
+                            Metrics=[
+                                dict(Name=name, Unit=units.get(name, "Count"))
+                                for name in metrics
+                            ],
+                        )
+                    ],
+                ),
+                **dimensions,
+                **redact(properties),
+                **metrics,
+            )
+        )
+
+    def metrics(
+        self,
+        metrics: Dict[str, float],
+        units: Optional[Dict[str, str]] = None,
+        dimensions: Optional[Dict[str, str]] = None,
+        **properties: Any,
+    ) -> None:
+        # Metrics aren't sampled, CloudWatch would undercount them
+        if self.metrics_format == "off" or not metrics:
+            return
+        if self.metrics_format == "emf":
+            self.emf(metrics, units, dimensions, **properties)
+        else:
+            self._write(
+                dict(
+                    level="INFO",
+                    message="metrics",
+                    **(dimensions or {}),
+                    **redact(properties),
+                    **metrics,
+                )
+            )
+
+
+logger = JsonLogger()
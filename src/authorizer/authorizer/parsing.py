@@ -0,0 +1,108 @@
+from typing import Any, Dict, NamedTuple, Optional
+
+from .config import env_bool
+
+# Set to run every event through the full AuthorizerInput model
+STRICT_INPUT_VALIDATION = env_bool("STRICT_INPUT_VALIDATION", False)
+
+VALID_PROTOCOLS = frozenset(("tls", "mqtt"))  # Todo support https
+AUTHORIZER_NAME_SUFFIX = "?x-amz-customauthorizer-name"
+
+
+class InvalidRequest(ValueError):
+    # pydantic's ValidationError is also a ValueError so callers can catch either
+    pass
+
+
+class MQTTDetails(NamedTuple):
+    # Same attribute names as MQTTData so check_password doesn't care which it gets
+    username: str
+    password: str
+    clientId: str
+
+
+class AuthorizerRequest(NamedTuple):
+    mqtt: MQTTDetails
+    signatureVerified: Optional[bool]
+    token: Optional[str]
+    # Where the CONNECT came from if the front end knows (the sidecar's peer address)
+    source: Optional[str] = None
+
+
+def strip_authorizer_name(username: str) -> str:
+    # you're probably sending the auth header through, it's not actually part of the username
+    return username.split(AUTHORIZER_NAME_SUFFIX)[0]
+
+
+def _require_str(container: Dict[str, Any], key: str) -> str:
+    value = container.get(key)
+    if not isinstance(value, str):
+        raise InvalidRequest(f"Expected a string for {key}, got {value!r}")
+    return value
+
+
+def parse_lean(event: Dict[str, Any]) -> AuthorizerRequest:
+    """
+    Pull out only what the authorizer uses without building the nested pydantic models.
+
+    Rejects the same things AuthorizerInput would care about: empty or unknown
+    protocols, missing connectionMetadata, missing/non string MQTT credentials and a
+    signatureVerified or token of the wrong type.
+    """
+    try:
+        protocols = event["protocols"]
+        mqtt = event["protocolData"]["mqtt"]
+        connection_id = event["connectionMetadata"]["id"]
+    except (KeyError, TypeError) as e:
+        raise InvalidRequest(f"Missing field in authorizer event: {e}") from e
+
+    if not isinstance(protocols, list) or len(protocols) == 0:
+        raise InvalidRequest(f"Expected List of valid protocols, got {protocols}")
+    for item in protocols:
+        if not isinstance(item, str) or item not in VALID_PROTOCOLS:
+            raise InvalidRequest(
+                f"got a value I didn't expect for protocol, {protocols}"
+            )
+    if not isinstance(connection_id, str) or not isinstance(mqtt, dict):
+        raise InvalidRequest("Malformed connectionMetadata or protocolData")
+    # Not coerced like the model would, "false" mustn't pass as a verified signature
+    signature_verified, token = event.get("signatureVerified"), event.get("token")
+    if not isinstance(signature_verified, (bool, type(None))):
+        raise InvalidRequest(
+            f"Expected a bool for signatureVerified, got {signature_verified!r}"
+        )
+    if not isinstance(token, (str, type(None))):
+        raise InvalidRequest(f"Expected a string for token, got {token!r}")
+
+    return AuthorizerRequest(
+        mqtt=MQTTDetails(
+            username=strip_authorizer_name(_require_str(mqtt, "username")),
+            password=_require_str(mqtt, "password"),
+            clientId=_require_str(mqtt, "clientId"),
+        ),
+        signatureVerified=signature_verified,
+        token=token,
+    )
+
+
+def parse_strict(event: Dict[str, Any]) -> AuthorizerRequest:
+    # Only strict mode needs the full model, so pydantic stays out of the import graph
+    from .types import AuthorizerInput
+
+    input_val = AuthorizerInput(**event)
+    mqtt = input_val.protocolData.mqtt
+    return AuthorizerRequest(
+        mqtt=MQTTDetails(
+            username=strip_authorizer_name(mqtt.username),
+            password=mqtt.password,
+            clientId=mqtt.clientId,
+        ),
+        signatureVerified=input_val.signatureVerified,
+        token=input_val.token,
+    )
+
+
+def parse_event(event: Dict[str, Any]) -> AuthorizerRequest:
+    if STRICT_INPUT_VALIDATION:
+        return parse_strict(event)
+    return parse_lean(event)
@@ -0,0 +1,213 @@
+"""
+Salted password hashes for the Password attribute in MQTTAuthTable.
+
+Hashes are stored as a single string with their parameters so they can be changed per item,
+
+    pbkdf2_sha256$<iterations>$<salt b64>$<hash b64>
+    scrypt$<n>$<r>$<p>$<salt b64>$<hash b64>
+
+Anything else is treated as a plaintext password (while ALLOW_PLAINTEXT_PASSWORDS is on),
+which keeps existing items working until they've been migrated with
+
+    python -m authorizer.passwords migrate --table MQTTAuthTable
+"""
+import hashlib
+import hmac
+from argparse import ArgumentParser
+from base64 import b64decode, b64encode
+from os import environ, urandom
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional
+
+from cachetools import TTLCache
+
+from .config import env_bool
+
+ALLOW_PLAINTEXT_PASSWORDS = env_bool("ALLOW_PLAINTEXT_PASSWORDS", True)
+PASSWORD_HASH_SCHEME = environ.get("PASSWORD_HASH_SCHEME", "pbkdf2_sha256")
+PBKDF2_ITERATIONS = int(environ.get("PBKDF2_ITERATIONS", 100_000))
+SCRYPT_N = int(environ.get("SCRYPT_N", 2**14))
+SCRYPT_R = int(environ.get("SCRYPT_R", 8))
+SCRYPT_P = int(environ.get("SCRYPT_P", 1))
+SALT_BYTES = 16
+# Successful verifications remembered so a reconnecting device doesn't pay for the KDF again
+VERIFIED_MEMO_TTL_SECONDS = float(environ.get("VERIFIED_MEMO_TTL_SECONDS", 300))
+VERIFIED_MEMO_MAX_ENTRIES = int(environ.get("VERIFIED_MEMO_MAX_ENTRIES", 10000))
+
+
+def _b64(raw: bytes) -> str:
+    return b64encode(raw).decode("ascii")
+
+
+def _pbkdf2(password: bytes, salt: bytes, iterations: int, length: int = 32) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password, salt, iterations, dklen=length)
+
+
+def _scrypt(password: bytes, salt: bytes, n: int, r: int, p: int, length: int = 32):
+    # maxmem has to cover 128 * n * r * p bytes or OpenSSL refuses
+    return hashlib.scrypt(
+        password, salt=salt, n=n, r=r, p=p, dklen=length, maxmem=256 * n * r * p
+    )
+
+
+def _verify_pbkdf2(password: bytes, params: List[str]) -> bool:
+    iterations, salt, expected = params
+    expected_raw = b64decode(expected)
+    return hmac.compare_digest(
+        _pbkdf2(password, b64decode(salt), int(iterations), len(expected_raw)),
+        expected_raw,
+    )
+
+
+def _verify_scrypt(password: bytes, params: List[str]) -> bool:
+    n, r, p, salt, expected = params
+    expected_raw = b64decode(expected)
+    return hmac.compare_digest(
+        _scrypt(password, b64decode(salt), int(n), int(r), int(p), len(expected_raw)),
+        expected_raw,
+    )
+
+
+VERIFIERS: Dict[str, Callable[[bytes, List[str]], bool]] = dict(
+    pbkdf2_sha256=_verify_pbkdf2, scrypt=_verify_scrypt
+)
+
+
+def hash_password(password: str, scheme: str = PASSWORD_HASH_SCHEME) -> str:
+    salt = urandom(SALT_BYTES)
+    raw = password.encode("utf-8")
+    if scheme == "pbkdf2_sha256":
+        digest = _pbkdf2(raw, salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+    if scheme == "scrypt":
+        digest = _scrypt(raw, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    raise ValueError(f"Unknown password hash scheme {scheme}")
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.split("$", 1)[0] in VERIFIERS
+
+
+def verify_password(stored: str, password: bytes) -> bool:
+    scheme, _, params = stored.partition("$")
+    verifier = VERIFIERS.get(scheme)
+    if verifier is None:
+        # Still constant time, but only if we're allowing plaintext items at all
+        return ALLOW_PLAINTEXT_PASSWORDS and hmac.compare_digest(
+            stored.encode("utf-8"), password
+        )
+    try:
+        return verifier(password, params.split("$"))
+    except (ValueError, TypeError):  # Malformed hash in the table, never a match
+        return False
+
+
+class VerifiedMemo:
+    """
+    Bounded memo of credentials that have already passed the KDF.
+
+    Keys are an HMAC (with a per container random key) of the client id, the stored hash
+    and the password, so rotating the password in the table invalidates the entry and
+    nothing in memory can be used to brute force the password offline.
+    """
+
+    def __init__(
+        self,
+        ttl: float = VERIFIED_MEMO_TTL_SECONDS,
+        maxsize: int = VERIFIED_MEMO_MAX_ENTRIES,
+    ):
+        self.enabled = ttl > 0 and maxsize > 0
+        self._key = urandom(32)
+        self._verified = TTLCache(maxsize=max(maxsize, 1), ttl=ttl, timer=monotonic)
+        self._lock = Lock()
+
+    def _digest(self, client_id: str, stored: str, password: bytes) -> bytes:
+        return hmac.new(
+            self._key,
+            b"\0".join((client_id.encode("utf-8"), stored.encode("utf-8"), password)),
+            hashlib.sha256,
+        ).digest()
+
+    def verify(self, client_id: str, stored: str, password: bytes) -> bool:
+        if not self.enabled or not is_hashed(stored):  # Plaintext is cheap anyway
+            return verify_password(stored, password)
+        digest = self._digest(client_id, stored, password)
+        with self._lock:
+            if self._verified.get(digest):
+                return True
+        verified = verify_password(stored, password)
+        if verified:
+            with self._lock:
+                self._verified[digest] = True
+        return verified
+
+    def clear(self) -> None:
+        with self._lock:
+            self._verified.clear()
+
+
+verified_memo = VerifiedMemo()
+
+
+def migrate_table(table: Any, scheme: str = PASSWORD_HASH_SCHEME) -> int:
+    """
+    Hash every plaintext Password in the table, returns the number of items updated.
+
+    The update is conditional on the password not having changed since the scan, so
+    running this against a live table won't clobber a password rotated mid migration.
+    """
+    from botocore.exceptions import ClientError
+
+    updated = 0
+    scan_kwargs: Dict[str, Any] = dict(ProjectionExpression="Client_ID, Password")
+    while True:
+        page = table.scan(**scan_kwargs)
+        for item in page.get("Items", []):
+            password = item.get("Password")
+            if password is None or is_hashed(password):
+                continue
+            try:
+                table.update_item(
+                    Key=dict(Client_ID=item["Client_ID"]),
+                    UpdateExpression="SET Password = :hashed",
+                    ConditionExpression="Password = :plain",
+                    ExpressionAttributeValues={
+                        ":hashed": hash_password(password, scheme),
+                        ":plain": password,
+                    },
+                )
+                updated += 1
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+        if "LastEvaluatedKey" not in page:
+            return updated
+        scan_kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(description="Password hashing for MQTTAuthTable")
+    commands = parser.add_subparsers(dest="command", required=True)
+    hash_command = commands.add_parser("hash", help="print the hash for a password")
+    hash_command.add_argument("password")
+    hash_command.add_argument("--scheme", default=PASSWORD_HASH_SCHEME)
+    migrate_command = commands.add_parser(
+        "migrate", help="hash every plaintext password in a table"
+    )
+    migrate_command.add_argument("--table", required=True)
+    migrate_command.add_argument("--scheme", default=PASSWORD_HASH_SCHEME)
+    args = parser.parse_args(argv)
+
+    if args.command == "hash":
+        print(hash_password(args.password, args.scheme))
+    else:
+        import boto3
+
+        table = boto3.resource("dynamodb").Table(args.table)
+        print(f"hashed {migrate_table(table, args.scheme)} plaintext passwords")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+from functools import lru_cache
+from hashlib import blake2b
+from json import dumps
+from os import environ
+from re import compile as re_compile
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from .log import logger
+
+if TYPE_CHECKING:
+    from .records import CachedCredential
+    from .types import DynamoModel
+
+# Anything with the DynamoModel attributes will do
+Credential = Union["DynamoModel", "CachedCredential"]
+
+# Defaults but easily overridable
+DISCONNECT_SECONDS = int(environ.get("DISCONNECT_SECONDS", 3600))
+REFRESH_SECONDS = int(environ.get("REFRESH_SECONDS", 3600))
+POLICY_CACHE_MAX_ENTRIES = int(environ.get("POLICY_CACHE_MAX_ENTRIES", 4096))
+# Keys the principal hash so principals can't be worked out from client ids alone,
+# hashed itself since blake2b keys top out at 64 bytes
+PRINCIPAL_KEY = (
+    blake2b(environ["PRINCIPAL_KEY"].encode("utf-8")).digest()
+    if environ.get("PRINCIPAL_KEY")
+    else b""
+)
+PRINCIPAL_CACHE_MAX_ENTRIES = int(environ.get("PRINCIPAL_CACHE_MAX_ENTRIES", 10000))
+
+# IoT Core's limits on what an authorizer returns
+POLICY_DOCUMENT_MAX_CHARS = int(environ.get("POLICY_DOCUMENT_MAX_CHARS", 2048))
+POLICY_DOCUMENTS_MAX = 10
+
+POLICY_VERSION = "2012-10-17"
+CLIENT_ID_VARIABLE = "${iot:ClientId}"
+# Policy (*, ?) and MQTT (+, #) wildcards and the level separator
+UNSAFE_IN_VARIABLES = frozenset("*?+#/")
+RESOURCE_KINDS = {
+    "iot:Connect": "client",
+    "iot:Subscribe": "topicfilter",
+    "iot:Receive": "topic",
+    "iot:Publish": "topic",
+}
+
+
+class PolicyTooLarge(ValueError):
+    pass
+
+
+# Member must satisfy ([a-zA-Z0-9]){1,128}, the hash takes 32 of those
+PRINCIPAL_MAX_CHARS = 128
+PRINCIPAL_HASH_BYTES = 16
+NOT_PRINCIPAL = re_compile("[^a-zA-Z0-9]")
+
+
+@lru_cache(maxsize=PRINCIPAL_CACHE_MAX_ENTRIES)
+def format_principal(client_id: str) -> str:
+    # The same client always gets the same principal, so repeat CONNECTs give IoT Core
+    # identical answers. The readable prefix is the client id with anything outside the
+    # allowed characters dropped, the hash keeps ids that only differed in those apart
+    digest = blake2b(
+        client_id.encode("utf-8"),
+        digest_size=PRINCIPAL_HASH_BYTES,
+        key=PRINCIPAL_KEY,
+    ).hexdigest()
+    prefix = NOT_PRINCIPAL.sub("", client_id)[: PRINCIPAL_MAX_CHARS - len(digest)]
+    return f"{prefix}{digest}"
+
+
+@lru_cache(maxsize=None)
+def base_iot_string() -> str:
+    # AWS region is a default env so I dont need to worry about setting it.
+    # Neither of these change for the life of the container, so only build it once
+    return f"arn:aws:iot:{environ.get('AWS_REGION', None)}:{environ.get('AWS_ACCOUNT_ID', None)}"
+
+
+def topic_filters(value: Union[str, Iterable[str]]) -> Tuple[str, ...]:
+    # read_topic/write_topic are one filter or a list of them, deduplicated in order
+    if isinstance(value, str):
+        return (value,) if value else ()
+    return tuple(dict.fromkeys(v for v in value if v))
+
+
+def substitute(topic: str, client_id: str) -> Optional[str]:
+    """
+    Fill in policy variables we know the value of, None if it isn't safe to.
+
+    A client id with a wildcard or a level separator in it would widen the grant
+    (devices/${iot:ClientId} for client id "*" is every device), so those topics are
+    dropped instead. Variables we don't know are left for IoT Core to resolve.
+    """
+    if CLIENT_ID_VARIABLE not in topic:
+        return topic
+    if not UNSAFE_IN_VARIABLES.isdisjoint(client_id):
+        return None
+    return topic.replace(CLIENT_ID_VARIABLE, client_id)
+
+
+def receive_topic(topic_filter: str) -> str:
+    # Receive is checked against the topic a message arrived on, not the filter, so
+    # MQTT wildcards become policy wildcards
+    return topic_filter.replace("+", "*").replace("#", "*")
+
+
+def grants(
+    allow_connect: bool,
+    allow_read: bool,
+    allow_write: bool,
+    read_topics: Tuple[str, ...],
+    write_topics: Tuple[str, ...],
+    client_id: str,
+) -> Dict[str, List[str]]:
+    """Resources for each allowed action, deduplicated, in the order they were given."""
+    base = base_iot_string()
+    reads = [t for t in (substitute(t, client_id) for t in read_topics) if t]
+    writes = [t for t in (substitute(t, client_id) for t in write_topics) if t]
+    allowed: Dict[str, List[str]] = {}
+    if allow_connect:
+        allowed["iot:Connect"] = [f"{base}:client/{client_id}"]
+    if allow_read and reads:
+        allowed["iot:Subscribe"] = [f"{base}:topicfilter/{t}" for t in reads]
+        allowed["iot:Receive"] = list(
+            dict.fromkeys(f"{base}:topic/{receive_topic(t)}" for t in reads)
+        )
+    if allow_write and writes:
+        allowed["iot:Publish"] = [f"{base}:topic/{t}" for t in writes]
+    return allowed
+
+
+def _one_or_many(values: List[str]) -> Union[str, List[str]]:
+    return values[0] if len(values) == 1 else values
+
+
+def pack_statements(allowed: Dict[str, List[str]]) -> List[Dict]:
+    """
+    As few statements as the grants allow without widening them.
+
+    A statement allows every Action on every Resource in it, so actions only share a
+    statement if that adds nothing: either they're on exactly the same resources, or
+    none of them applies to the kind of resource (client, topicfilter, topic) the other
+    uses. Connect, Subscribe and Receive always fit in one, Publish joins them only
+    when it's on the same topics as Receive.
+    """
+    by_resources: Dict[Tuple[str, ...], List[str]] = {}
+    for action, resources in allowed.items():
+        by_resources.setdefault(tuple(resources), []).append(action)
+    groups: List[Tuple[List[str], List[str], Set[str]]] = []
+    for resources, actions in by_resources.items():
+        kinds = {RESOURCE_KINDS[a] for a in actions}
+        for group_actions, group_resources, group_kinds in groups:
+            if group_kinds.isdisjoint(kinds):
+                group_actions.extend(actions)
+                group_resources.extend(resources)
+                group_kinds.update(kinds)
+                break
+        else:
+            groups.append((list(actions), list(resources), kinds))
+    return [
+        dict(
+            Action=_one_or_many(actions),
+            Effect="Allow",
+            Resource=_one_or_many(resources),
+        )
+        for actions, resources, _ in groups
+    ]
+
+
+def _size(value: Dict) -> int:
+    return len(dumps(value, separators=(",", ":")))
+
+
+def _split(statement: Dict, limit: int) -> List[Dict]:
+    # Halve the resource list until each part fits in a document on its own
+    if _size(dict(Version=POLICY_VERSION, Statement=[statement])) <= limit:
+        return [statement]
+    resources = statement["Resource"]
+    if isinstance(resources, str) or len(resources) == 1:
+        raise PolicyTooLarge(f"A single resource is over {limit} characters")
+    half = len(resources) // 2
+    return _split({**statement, "Resource": resources[:half]}, limit) + _split(
+        {**statement, "Resource": resources[half:]}, limit
+    )
+
+
+def pack_documents(
+    statements: List[Dict],
+    limit: int = POLICY_DOCUMENT_MAX_CHARS,
+    max_documents: int = POLICY_DOCUMENTS_MAX,
+) -> List[Dict]:
+    # IoT Core caps the size of each returned document and how many there can be
+    documents: List[Dict] = []
+    for part in (p for s in statements for p in _split(s, limit)):
+        if documents and _size(documents[-1]) + _size(part) + 1 <= limit:
+            documents[-1]["Statement"].append(part)
+        else:
+            documents.append(dict(Version=POLICY_VERSION, Statement=[part]))
+    if len(documents) > max_documents:
+        raise PolicyTooLarge(
+            f"Policy needs {len(documents)} documents, IoT Core allows {max_documents}"
+        )
+    return documents or [dict(Version=POLICY_VERSION, Statement=[])]
+
+
+@lru_cache(maxsize=POLICY_CACHE_MAX_ENTRIES)
+def compile_statements(
+    allow_connect: bool,
+    allow_read: bool,
+    allow_write: bool,
+    read_topics: Tuple[str, ...],
+    write_topics: Tuple[str, ...],
+    client_id: str,
+) -> List[Dict]:
+    """
+    Build the policyDocuments for a set of permissions once.
+
+    These are the same shape as PolicyDocument.dict() would give, but skip pydantic
+    entirely. The returned list is shared between calls so treat it as read only.
+    """
+    return pack_documents(
+        pack_statements(
+            grants(
+                allow_connect,
+                allow_read,
+                allow_write,
+                read_topics,
+                write_topics,
+                client_id,
+            )
+        )
+    )
+
+
+DENY_POLICY_DOCUMENTS: List[Dict] = [dict(Version=POLICY_VERSION, Statement=[])]
+
+
+def compile_policy(dynamoData: Credential) -> List[Dict]:
+    return compile_statements(
+        dynamoData.allow_connect,
+        dynamoData.allow_read,
+        dynamoData.allow_write,
+        topic_filters(dynamoData.read_topic),
+        topic_filters(dynamoData.write_topic),
+        dynamoData.Client_ID,
+    )
+
+
+def deny_policy(client_id: str) -> Dict:
+    # Nothing to look up or compile, the throttle answers with this
+    return dict(
+        password=None,
+        isAuthenticated=False,
+        principalId=format_principal(client_id),
+        disconnectAfterInSeconds=DISCONNECT_SECONDS,
+        refreshAfterInSeconds=REFRESH_SECONDS,
+        policyDocuments=DENY_POLICY_DOCUMENTS,
+    )
+
+
+def render_policy(
+    dynamoData: Optional[Credential], authenticated: bool, client_id: str
+) -> Dict:
+    # Same output as benchmarks.reference_policy.generate_policy(...).dict(), packed
+    allowed = authenticated and dynamoData is not None
+    if allowed:
+        try:
+            policy_documents = compile_policy(dynamoData)
+        except PolicyTooLarge as e:  # Better to refuse than hand out part of a policy
+            logger.error("policy too large", clientId=client_id, error=str(e))
+            allowed = authenticated = False
+    return dict(
+        password=dynamoData.Password if allowed else None,
+        isAuthenticated=authenticated,
+        principalId=format_principal(client_id),
+        disconnectAfterInSeconds=DISCONNECT_SECONDS,
+        refreshAfterInSeconds=REFRESH_SECONDS,
+        policyDocuments=policy_documents if allowed else DENY_POLICY_DOCUMENTS,
+    )
+
+
+def allows(policy: Dict, action: str) -> bool:
+    """Whether an authenticated policy has an Allow statement for action."""
+    if not policy["isAuthenticated"]:
+        return False
+    for document in policy["policyDocuments"]:
+        for statement in document["Statement"]:
+            actions = statement["Action"]
+            if statement["Effect"] == "Allow" and (
+                action == actions if isinstance(actions, str) else action in actions
+            ):
+                return True
+    return False
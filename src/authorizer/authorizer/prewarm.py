@@ -0,0 +1,274 @@
+"""
+Fill the credential cache in bulk during Lambda init.
+
+After a broker outage every device reconnects at once, and every new container would
+otherwise start with an empty cache. PREWARM_CACHE=scan does a parallel segmented Scan
+of the table, PREWARM_CACHE=snapshot reads a JSONL file of DynamoModel records (packaged
+with the function or on a local path), which can be made with
+
+    python -m authorizer.prewarm snapshot --table MQTTAuthTable --out credentials.jsonl
+
+Either way loading stops once the time, memory or entry budget runs out, so a big table
+can't push init past its timeout.
+
+A snapshot's first line records when it was taken. Its records expire a cache TTL after
+that rather than after the container started, a snapshot older than
+PREWARM_SNAPSHOT_MAX_AGE_SECONDS isn't loaded at all, and the invalidation poller goes
+back to the snapshot's time so changes made since then are still applied.
+"""
+import json
+from itertools import chain
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from pathlib import Path
+from sys import getsizeof
+from threading import Lock
+from time import monotonic, time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from .config import code_path
+from .credential_cache import (
+    CREDENTIAL_CACHE_MAX_ENTRIES,
+    CREDENTIAL_CACHE_TTL_SECONDS,
+    credential_cache,
+)
+from .invalidation import invalidations
+from .log import logger
+from .profiles import profile_cache, profile_name
+from .records import CachedCredential, PolicyProfile
+
+# "off", "scan" or "snapshot"
+PREWARM_CACHE = environ.get("PREWARM_CACHE", "off").lower()
+# Relative paths are relative to the function's code directory
+PREWARM_SNAPSHOT_PATH = environ.get("PREWARM_SNAPSHOT_PATH", "credentials.jsonl")
+# Older records would expire as soon as they were loaded
+PREWARM_SNAPSHOT_MAX_AGE_SECONDS = float(
+    environ.get("PREWARM_SNAPSHOT_MAX_AGE_SECONDS", CREDENTIAL_CACHE_TTL_SECONDS)
+)
+PREWARM_SCAN_SEGMENTS = int(environ.get("PREWARM_SCAN_SEGMENTS", 4))
+PREWARM_SCAN_PAGE_SIZE = int(environ.get("PREWARM_SCAN_PAGE_SIZE", 1000))
+# Lambda gives init 10 seconds, leave plenty for everything else
+PREWARM_TIME_BUDGET_SECONDS = float(environ.get("PREWARM_TIME_BUDGET_SECONDS", 2))
+PREWARM_MEMORY_BUDGET_MB = float(environ.get("PREWARM_MEMORY_BUDGET_MB", 32))
+# Loading more than the cache holds would just evict what we loaded first
+PREWARM_MAX_ENTRIES = int(
+    environ.get("PREWARM_MAX_ENTRIES", CREDENTIAL_CACHE_MAX_ENTRIES)
+)
+
+# First line of a snapshot, {"snapshot_created_at": seconds since the epoch}
+CREATED_AT = "snapshot_created_at"
+
+PROJECTION = (
+    "Client_ID, Username, Password, allow_read, allow_connect, allow_write, "
+    "read_topic, write_topic, profile"
+)
+
+
+class PrewarmReport(NamedTuple):
+    source: str
+    loaded: int
+    approx_bytes: int
+    seconds: float
+    stopped_by: Optional[str]
+
+
+def approx_size(record: Any) -> int:
+    # Good enough to stop a runaway load, not an exact accounting
+    values = getattr(record, "__dict__", None)
+    if values is None:
+        values = {name: getattr(record, name) for name in record.__slots__}
+    return (
+        getsizeof(record)
+        + getsizeof(values)
+        + sum(getsizeof(v) for v in values.values())
+    )
+
+
+class Budget:
+    def __init__(self, seconds: float, max_bytes: float, max_entries: int):
+        self.start = monotonic()
+        self.deadline = self.start + seconds
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.bytes = 0
+        self.entries = 0
+        self.stopped_by: Optional[str] = None
+        self._lock = Lock()
+
+    def exhausted(self) -> bool:
+        if self.stopped_by is None:
+            if monotonic() >= self.deadline:
+                self.stopped_by = "time"
+            elif self.bytes >= self.max_bytes:
+                self.stopped_by = "memory"
+            elif self.entries >= self.max_entries:
+                self.stopped_by = "entries"
+        return self.stopped_by is not None
+
+    def take(self, nbytes: int) -> bool:
+        with self._lock:
+            if self.exhausted():
+                return False
+            self.bytes += nbytes
+            self.entries += 1
+            return True
+
+    def report(self, source: str) -> PrewarmReport:
+        return PrewarmReport(
+            source=source,
+            loaded=self.entries,
+            approx_bytes=self.bytes,
+            seconds=monotonic() - self.start,
+            stopped_by=self.stopped_by,
+        )
+
+
+def default_budget() -> Budget:
+    return Budget(
+        seconds=PREWARM_TIME_BUDGET_SECONDS,
+        max_bytes=PREWARM_MEMORY_BUDGET_MB * 1024 * 1024,
+        max_entries=PREWARM_MAX_ENTRIES,
+    )
+
+
+def load_items(items: Iterable[Dict[str, Any]], budget: Budget, age: float = 0) -> bool:
+    # Returns False once the budget has run out so the caller can stop reading. age is
+    # how long ago the items were read
+    from .types import DynamoModel, PolicyProfileModel
+
+    for item in items:
+        name = profile_name(str(item.get("Client_ID", "")))
+        if name is not None and age:
+            # ProfileCache can't backdate an entry, and a profile is one read per
+            # container however many devices use it
+            continue
+        try:
+            if name is None:
+                record = CachedCredential.from_model(DynamoModel(**item))
+            else:
+                fields = {k: v for k, v in item.items() if k != "Client_ID"}
+                record = PolicyProfile.from_model(
+                    PolicyProfileModel(**fields, Name=name)
+                )
+        except (ValueError, TypeError):  # A broken item, skip it
+            continue
+        if not budget.take(approx_size(record)):
+            return False
+        if name is None:
+            credential_cache.put(record.Client_ID, record, age)
+        else:
+            profile_cache.put(name, record)
+    return True
+
+
+def load_snapshot(path: Path, budget: Optional[Budget] = None) -> PrewarmReport:
+    budget = budget or default_budget()
+    path = code_path(path)
+    with open(path) as fp:
+        lines = (json.loads(line) for line in fp if line.strip())
+        first = next(lines, None)
+        if isinstance(first, dict) and CREATED_AT in first:
+            created = float(first[CREATED_AT])
+        else:  # Written before snapshots were dated, the file's age will have to do
+            created = path.stat().st_mtime
+            lines = chain([first] if first is not None else [], lines)
+        age = max(time() - created, 0)
+        if age >= PREWARM_SNAPSHOT_MAX_AGE_SECONDS:
+            raise ValueError(f"Snapshot is {age:.0f}s old, too old to load")
+        invalidations.rewind(created)
+        load_items(lines, budget, age)
+    return budget.report("snapshot")
+
+
+def _scan_segment(table: Any, segment: int, segments: int, budget: Budget) -> None:
+    kwargs: Dict[str, Any] = dict(
+        Segment=segment,
+        TotalSegments=segments,
+        ProjectionExpression=PROJECTION,
+        Limit=PREWARM_SCAN_PAGE_SIZE,
+    )
+    while not budget.exhausted():
+        page = table.scan(**kwargs)
+        if not load_items(page.get("Items", []), budget):
+            return
+        if "LastEvaluatedKey" not in page:
+            return
+        kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def scan_table(
+    table: Any, segments: int = PREWARM_SCAN_SEGMENTS, budget: Optional[Budget] = None
+) -> PrewarmReport:
+    budget = budget or default_budget()
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        futures = [
+            pool.submit(_scan_segment, table, n, segments, budget)
+            for n in range(segments)
+        ]
+        for future in futures:
+            future.result()
+    return budget.report("scan")
+
+
+def prewarm_cache(
+    table: Any = None, mode: str = PREWARM_CACHE
+) -> Optional[PrewarmReport]:
+    # Never let a failed prewarm take the container down, the cache just starts cold
+    try:
+        if mode == "scan":
+            report = scan_table(table)
+        elif mode == "snapshot":
+            report = load_snapshot(Path(PREWARM_SNAPSHOT_PATH))
+        else:
+            return None
+    except Exception as e:
+        logger.warning("Credential cache prewarm failed", mode=mode, error=repr(e))
+        return None
+    logger.info("Credential cache prewarmed", **report._asdict())
+    return report
+
+
+def _json_default(value: Any) -> Any:
+    # String sets (read_topic, write_topic) become lists load_items reads back as lists,
+    # str() would turn them into one topic spelling out the set
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def write_snapshot(table: Any, out: Path) -> int:
+    written = 0
+    kwargs: Dict[str, Any] = dict(ProjectionExpression=PROJECTION)
+    with open(out, "w") as fp:
+        # Before the scan, so anything changed while it runs is invalidated
+        fp.write(json.dumps({CREATED_AT: time()}) + "\n")
+        while True:
+            page = table.scan(**kwargs)
+            for item in page.get("Items", []):
+                fp.write(
+                    json.dumps(item, separators=(",", ":"), default=_json_default)
+                    + "\n"
+                )
+                written += 1
+            if "LastEvaluatedKey" not in page:
+                return written
+            kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(description="Credential cache snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot = commands.add_parser("snapshot", help="dump a table to a snapshot file")
+    snapshot.add_argument("--table", required=True)
+    snapshot.add_argument("--out", type=Path, default=Path("credentials.jsonl"))
+    args = parser.parse_args(argv)
+
+    import boto3
+
+    table = boto3.resource("dynamodb").Table(args.table)
+    print(f"wrote {write_snapshot(table, args.out)} records to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
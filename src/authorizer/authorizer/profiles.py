@@ -0,0 +1,134 @@
+"""
+Named policy profiles shared by many devices.
+
+A device item with a profile attribute takes its allow_* flags and topics from the item
+stored under Client_ID profile#<name> in the same table, so a role change is one write.
+Profiles get their own cache, a fleet of thousands of devices on a handful of roles
+costs a handful of profile reads per container. Being in the same table means the
+table's stream (see invalidation.py) covers profile changes too.
+"""
+from os import environ
+from threading import RLock
+from time import monotonic
+from typing import TYPE_CHECKING, Optional, Union
+
+from cachetools import TTLCache
+
+from . import instrumentation
+from .credential_cache import MISSING, _Missing
+from .records import PolicyProfile
+from .singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from .backends import CredentialBackend
+    from .types import PolicyProfileModel
+
+PROFILE_CACHE_TTL_SECONDS = float(environ.get("PROFILE_CACHE_TTL_SECONDS", 300))
+PROFILE_CACHE_NEGATIVE_TTL_SECONDS = float(
+    environ.get("PROFILE_CACHE_NEGATIVE_TTL_SECONDS", 30)
+)
+PROFILE_CACHE_MAX_ENTRIES = int(environ.get("PROFILE_CACHE_MAX_ENTRIES", 1024))
+
+PROFILE_PREFIX = "profile#"
+
+
+def profile_key(name: str) -> str:
+    return f"{PROFILE_PREFIX}{name}"
+
+
+def profile_name(key: str) -> Optional[str]:
+    # The profile name if key is a profile's Client_ID, None for a device
+    return key[len(PROFILE_PREFIX) :] if key.startswith(PROFILE_PREFIX) else None
+
+
+class ProfileCache:
+    # Same idea as CredentialCache, minus the soft TTL, profiles are few and cheap to read
+    def __init__(
+        self,
+        ttl: float = PROFILE_CACHE_TTL_SECONDS,
+        negative_ttl: float = PROFILE_CACHE_NEGATIVE_TTL_SECONDS,
+        maxsize: int = PROFILE_CACHE_MAX_ENTRIES,
+    ):
+        self.enabled = ttl > 0 and maxsize > 0
+        self.negative_enabled = self.enabled and negative_ttl > 0
+        self._found = TTLCache(maxsize=max(maxsize, 1), ttl=ttl, timer=monotonic)
+        self._missing = TTLCache(
+            maxsize=max(maxsize, 1), ttl=max(negative_ttl, 0), timer=monotonic
+        )
+        self._lock = RLock()
+
+    def get(self, name: str) -> Union[PolicyProfile, _Missing, None]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            found = self._found.get(name)
+            if found is not None:
+                return found
+            if name in self._missing:
+                return MISSING
+        return None
+
+    def put(
+        self, name: str, profile: Union[PolicyProfile, "PolicyProfileModel"]
+    ) -> PolicyProfile:
+        if not isinstance(profile, PolicyProfile):
+            profile = PolicyProfile.from_model(profile)
+        if self.enabled:
+            with self._lock:
+                self._missing.pop(name, None)
+                self._found[name] = profile
+        return profile
+
+    def put_missing(self, name: str) -> None:
+        if self.negative_enabled:
+            with self._lock:
+                self._found.pop(name, None)
+                self._missing[name] = True
+
+    def invalidate(self, name: str) -> None:
+        with self._lock:
+            self._found.pop(name, None)
+            self._missing.pop(name, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._found.clear()
+            self._missing.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._found) + len(self._missing)
+
+
+profile_cache = ProfileCache()
+profile_lookups = SingleFlight()
+
+
+def cached_profile(name: str) -> Optional[PolicyProfile]:
+    # None on a cache miss, KeyError if the profile is cached as missing
+    cached = profile_cache.get(name)
+    if cached is MISSING:
+        raise KeyError(name)
+    if cached is not None:
+        instrumentation.current().count("ProfileCacheHit")
+    return cached
+
+
+def _load_profile(name: str, backend: "CredentialBackend") -> PolicyProfile:
+    invocation = instrumentation.current()
+    invocation.count("ProfileCacheMiss")
+    with invocation.phase(backend.name):
+        item = backend.get_item(profile_key(name))
+    if item is None:
+        profile_cache.put_missing(name)
+        raise KeyError(name)
+    from .types import PolicyProfileModel
+
+    return profile_cache.put(name, PolicyProfileModel(**item, Name=name))
+
+
+def get_profile(name: str, backend: "CredentialBackend") -> PolicyProfile:
+    cached = cached_profile(name)
+    if cached is not None:
+        return cached
+    return profile_lookups.do(name, lambda: _load_profile(name, backend))
@@ -0,0 +1,181 @@
+"""
+Sampled profiling for a warm container, for finding out where a latency regression went.
+
+PROFILING=cpu runs 1 in PROFILING_SAMPLE_EVERY invocations under cProfile, =memory under
+tracemalloc, =both under both. Stats add up across sampled invocations in the container,
+and every PROFILING_EMIT_EVERY samples one log line goes out with the top PROFILING_TOP_N
+functions (by time spent in the function itself) and allocation sites (by memory still
+held when the invocation returned), then the totals start again. Unsampled invocations
+pay for one counter increment, and with PROFILING=off the handler isn't wrapped at all.
+"""
+from collections import Counter
+from functools import wraps
+from os import environ
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .log import logger
+
+# "off", "cpu", "memory" or "both"
+PROFILING = environ.get("PROFILING", "off").lower()
+PROFILING_SAMPLE_EVERY = int(environ.get("PROFILING_SAMPLE_EVERY", 100))
+PROFILING_EMIT_EVERY = int(environ.get("PROFILING_EMIT_EVERY", 10))
+PROFILING_TOP_N = int(environ.get("PROFILING_TOP_N", 15))
+PROFILING_TRACEMALLOC_FRAMES = int(environ.get("PROFILING_TRACEMALLOC_FRAMES", 1))
+
+MODES = ("off", "cpu", "memory", "both")
+
+
+def short_path(path: str) -> str:
+    # site-packages/botocore/endpoint.py is plenty to go on, and much shorter
+    return "/".join(path.replace("\\", "/").split("/")[-2:])
+
+
+class SampledProfiler:
+    def __init__(
+        self,
+        mode: str = PROFILING,
+        sample_every: int = PROFILING_SAMPLE_EVERY,
+        emit_every: int = PROFILING_EMIT_EVERY,
+        top_n: int = PROFILING_TOP_N,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown PROFILING {mode}, expected one of {MODES}")
+        self.cpu = mode in ("cpu", "both")
+        self.memory = mode in ("memory", "both")
+        self.enabled = self.cpu or self.memory
+        self.sample_every = max(sample_every, 1)
+        self.emit_every = max(emit_every, 1)
+        self.top_n = top_n
+        self.invocations = 0
+        self.samples = 0
+        self._profile: Any = None
+        self._allocations: Counter = Counter()
+        self._allocation_counts: Counter = Counter()
+        self._peak = 0
+        self._tracing = False
+        # One sample at a time, cProfile and tracemalloc are both process wide
+        self._lock = Lock()
+
+    def _start(self) -> None:
+        if self.cpu:
+            if self._profile is None:
+                import cProfile
+
+                self._profile = cProfile.Profile()
+            self._profile.enable()
+        if self.memory:
+            import tracemalloc
+
+            # Someone else is already tracing (a benchmark, say), leave them to it
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start(PROFILING_TRACEMALLOC_FRAMES)
+
+    def _stop(self) -> None:
+        if self.cpu:
+            self._profile.disable()  # Stats keep adding up until emit()
+        if self._tracing:
+            import tracemalloc
+
+            self._tracing = False
+            snapshot = tracemalloc.take_snapshot()
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            snapshot = snapshot.filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__)]
+            )
+            for stat in snapshot.statistics("lineno"):
+                frame = stat.traceback[0]
+                site = f"{short_path(frame.filename)}:{frame.lineno}"
+                self._allocations[site] += stat.size
+                self._allocation_counts[site] += stat.count
+            # Keep the totals bounded, sites outside the top few won't be reported
+            if len(self._allocations) > 10 * self.top_n:
+                kept = dict(self._allocations.most_common(self.top_n * 2))
+                self._allocations = Counter(kept)
+                self._allocation_counts = Counter(
+                    {site: self._allocation_counts[site] for site in kept}
+                )
+
+    def top_functions(self) -> List[Dict[str, Any]]:
+        if self._profile is None:
+            return []
+        import pstats
+
+        stats: Dict[Tuple[str, int, str], Tuple] = pstats.Stats(self._profile).stats
+        ranked = sorted(stats.items(), key=lambda kv: kv[1][2], reverse=True)
+        return [
+            dict(
+                function=f"{short_path(path)}:{line}({name})",
+                calls=calls,
+                self_ms=round(tottime * 1000, 3),
+                cumulative_ms=round(cumtime * 1000, 3),
+            )
+            for (path, line, name), (_, calls, tottime, cumtime, _) in ranked[
+                : self.top_n
+            ]
+        ]
+
+    def top_allocations(self) -> List[Dict[str, Any]]:
+        return [
+            dict(
+                site=site,
+                kib=round(size / 1024, 2),
+                blocks=self._allocation_counts[site],
+            )
+            for site, size in self._allocations.most_common(self.top_n)
+        ]
+
+    def emit(self) -> Optional[Dict[str, Any]]:
+        """Log what's been gathered so far and start again, None if nothing was."""
+        if not self.samples:
+            return None
+        record: Dict[str, Any] = dict(
+            message="profile", samples=self.samples, invocations=self.invocations
+        )
+        if self.cpu:
+            record["functions"] = self.top_functions()
+        if self.memory:
+            record["allocations"] = self.top_allocations()
+            record["peak_kib"] = round(self._peak / 1024, 2)
+        logger.write(record)
+        self._profile = None
+        self._allocations.clear()
+        self._allocation_counts.clear()
+        self._peak = 0
+        self.samples = 0
+        return record
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        self.invocations += 1  # Racy under threads, only ever costs a sample
+        if self.invocations % self.sample_every or not self._lock.acquire(
+            blocking=False
+        ):
+            return fn(*args, **kwargs)
+        try:
+            self._start()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._stop()
+                self.samples += 1
+                if self.samples >= self.emit_every:
+                    self.emit()
+        finally:
+            self._lock.release()
+
+
+profiler = SampledProfiler()
+
+
+def profiled(fn: Callable) -> Callable:
+    # Decided once at import, with profiling off the handler is returned untouched
+    if not profiler.enabled:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs) -> Any:
+        return profiler.call(fn, *args, **kwargs)
+
+    return wrapper
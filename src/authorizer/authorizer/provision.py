@@ -0,0 +1,240 @@
+"""
+Bulk load devices into MQTTAuthTable from a CSV or JSONL file of DynamoModel records.
+
+    python -m authorizer.provision devices.csv --table MQTTAuthTable --checkpoint devices.done
+
+Every record is validated with DynamoModel before anything is written. Records are then
+written in parallel BatchWriteItem chunks of 25, unprocessed items are retried with
+backoff. With --checkpoint, finished chunks are recorded so an interrupted run can be
+started again with the same arguments and will skip what's already been written.
+"""
+import csv
+import json
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from random import random
+from threading import Lock
+from time import perf_counter, sleep
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+
+from .profiles import profile_key, profile_name
+from .types import PERMISSION_FIELDS, DynamoModel, PolicyProfileModel
+
+Record = Union[DynamoModel, PolicyProfileModel]
+
+BATCH_SIZE = 25  # BatchWriteItem limit
+MAX_ATTEMPTS = 8
+BASE_BACKOFF_SECONDS = 0.05
+MAX_BACKOFF_SECONDS = 5.0
+
+
+class InvalidRecords(ValueError):
+    def __init__(self, errors: List[Tuple[int, str]]):
+        self.errors = errors
+        super().__init__(
+            "\n".join(f"line {line}: {error}" for line, error in errors[:20])
+        )
+
+
+class ProvisionReport(NamedTuple):
+    records: int
+    written: int
+    skipped_chunks: int
+    retries: int
+    seconds: float
+
+    @property
+    def per_second(self) -> float:
+        return self.written / self.seconds if self.seconds else 0.0
+
+
+def _read_rows(path: Path) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    with open(path, newline="") as fp:
+        if path.suffix.lower() == ".csv":
+            # Header is line 1, pydantic takes care of "true"/"false" for the allow_* columns
+            for line, row in enumerate(csv.DictReader(fp), start=2):
+                yield line, row
+        else:
+            for line, raw in enumerate(fp, start=1):
+                if raw.strip():
+                    yield line, json.loads(raw)
+
+
+def parse_record(row: Dict[str, Any]) -> Record:
+    # Rows keyed profile#<name> are policy profiles, everything else is a device. A CSV
+    # has every column on every row, so blank cells are the ones that don't apply
+    name = profile_name(str(row.get("Client_ID", "")))
+    if name is not None:
+        fields = {k: v for k, v in row.items() if k != "Client_ID" and v != ""}
+        return PolicyProfileModel(**fields, Name=name)
+    if row.get("profile") in ("", None):
+        return DynamoModel(**{k: v for k, v in row.items() if k != "profile"})
+    blank = {k for k in PERMISSION_FIELDS if row.get(k) == ""}
+    return DynamoModel(**{k: v for k, v in row.items() if k not in blank})
+
+
+def record_key(record: Record) -> str:
+    if isinstance(record, PolicyProfileModel):
+        return profile_key(record.Name)
+    return record.Client_ID
+
+
+def to_item(record: Record) -> Dict[str, Any]:
+    if isinstance(record, PolicyProfileModel):
+        return dict(Client_ID=record_key(record), **record.dict(exclude={"Name"}))
+    # Permissions left to a profile are left out rather than written as NULL
+    return record.dict(exclude_none=True)
+
+
+def load_records(path: Path) -> List[Record]:
+    """Validate every record up front, a typo halfway through a fleet is no fun to clean up."""
+    records: Dict[str, Record] = {}
+    errors: List[Tuple[int, str]] = []
+    for line, row in _read_rows(path):
+        try:
+            record = parse_record(row)
+        except (ValueError, TypeError) as e:
+            errors.append((line, str(e).replace("\n", " ")))
+            continue
+        # BatchWriteItem rejects duplicate keys in a batch, last one in the file wins
+        key = record_key(record)
+        records.pop(key, None)
+        records[key] = record
+    if errors:
+        raise InvalidRecords(errors)
+    return list(records.values())
+
+
+def chunked(records: List[Any], size: int = BATCH_SIZE) -> List[List[Any]]:
+    return [records[i : i + size] for i in range(0, len(records), size)]
+
+
+class Checkpoint:
+    # Append only file of finished chunk numbers
+    def __init__(self, path: Optional[Path]):
+        self.path = path
+        self._lock = Lock()
+
+    def completed(self) -> Set[int]:
+        if self.path is None or not self.path.exists():
+            return set()
+        with open(self.path) as fp:
+            return {int(line) for line in fp if line.strip()}
+
+    def mark(self, chunk: int) -> None:
+        if self.path is None:
+            return
+        with self._lock, open(self.path, "a") as fp:
+            fp.write(f"{chunk}\n")
+            fp.flush()
+
+
+def write_chunk(client: Any, table_name: str, items: List[Dict[str, Any]]) -> int:
+    # Returns how many retries it took, raises if DynamoDB never takes everything
+    from boto3.dynamodb.types import TypeSerializer
+
+    serializer = TypeSerializer()
+    request = {
+        table_name: [
+            dict(
+                PutRequest=dict(
+                    Item={k: serializer.serialize(v) for k, v in item.items()}
+                )
+            )
+            for item in items
+        ]
+    }
+    for attempt in range(MAX_ATTEMPTS):
+        response = client.batch_write_item(RequestItems=request)
+        request = response.get("UnprocessedItems") or {}
+        if not request:
+            return attempt
+        # Full jitter, so parallel workers don't all come back at the same moment
+        sleep(random() * min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2**attempt))
+    remaining = sum(len(v) for v in request.values())
+    raise RuntimeError(
+        f"{remaining} items still unprocessed after {MAX_ATTEMPTS} tries"
+    )
+
+
+def provision(
+    records: List[Record],
+    table_name: str,
+    client: Any,
+    workers: int = 8,
+    checkpoint: Optional[Path] = None,
+    hash_passwords: bool = False,
+) -> ProvisionReport:
+    from .passwords import hash_password, is_hashed
+
+    start = perf_counter()
+    progress = Checkpoint(checkpoint)
+    done = progress.completed()
+    chunks = chunked(records)
+    pending = [(n, chunk) for n, chunk in enumerate(chunks) if n not in done]
+
+    def run(n: int, chunk: List[Record]) -> Tuple[int, int]:
+        items = []
+        for record in chunk:
+            item = to_item(record)
+            if (
+                hash_passwords
+                and "Password" in item
+                and not is_hashed(item["Password"])
+            ):
+                item["Password"] = hash_password(item["Password"])
+            items.append(item)
+        retries = write_chunk(client, table_name, items)
+        progress.mark(n)
+        return len(items), retries
+
+    written = retries = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(run, n, c) for n, c in pending]):
+            count, chunk_retries = future.result()
+            written += count
+            retries += chunk_retries
+    return ProvisionReport(
+        records=len(records),
+        written=written,
+        skipped_chunks=len(chunks) - len(pending),
+        retries=retries,
+        seconds=perf_counter() - start,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("path", type=Path, help=".csv or .jsonl of DynamoModel records")
+    parser.add_argument("--table", required=True)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--checkpoint", type=Path, default=None)
+    parser.add_argument("--hash-passwords", action="store_true")
+    args = parser.parse_args(argv)
+
+    import boto3
+    from botocore.config import Config
+
+    records = load_records(args.path)
+    client = boto3.client(
+        "dynamodb",
+        config=Config(retries=dict(mode="adaptive"), max_pool_connections=args.workers),
+    )
+    report = provision(
+        records,
+        args.table,
+        client,
+        workers=args.workers,
+        checkpoint=args.checkpoint,
+        hash_passwords=args.hash_passwords,
+    )
+    print(
+        f"wrote {report.written}/{report.records} records in {report.seconds:.1f}s "
+        f"({report.per_second:.0f}/s), {report.retries} retries, "
+        f"{report.skipped_chunks} chunks skipped from checkpoint"
+    )
+
+
+if __name__ == "__main__":
+    main()
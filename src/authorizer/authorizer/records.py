@@ -0,0 +1,189 @@
+from sys import intern
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from .types import DynamoModel, PolicyProfileModel
+
+ALLOW_CONNECT = 1
+ALLOW_READ = 2
+ALLOW_WRITE = 4
+
+# A single topic filter stays a plain string, which is what almost every device has
+Topics = Union[str, Tuple[str, ...]]
+
+
+def intern_topics(value: Union[str, Iterable[str]]) -> Topics:
+    if isinstance(value, str):
+        return intern(value)
+    return tuple(intern(v) for v in value)
+
+
+def topics_value(value: Topics) -> Union[str, List[str]]:
+    # Back to what DynamoModel holds
+    return value if isinstance(value, str) else list(value)
+
+
+def pack_flags(model: Union["DynamoModel", "PolicyProfileModel"]) -> int:
+    return (
+        (ALLOW_CONNECT if model.allow_connect else 0)
+        | (ALLOW_READ if model.allow_read else 0)
+        | (ALLOW_WRITE if model.allow_write else 0)
+    )
+
+
+class CachedCredential:
+    """
+    Compact, read only stand in for DynamoModel used by the credential cache.
+
+    A pydantic model carries a __dict__ and a __fields_set__ per instance, which adds up
+    fast with hundreds of thousands of devices cached. This keeps the same attribute names
+    (so check_password and the policy compiler don't care which one they get), packs the
+    allow_* flags into one int and interns topics since most of a fleet shares a handful.
+    Topic lists are kept as tuples so they're hashable for the policy cache.
+    """
+
+    __slots__ = (
+        "Client_ID",
+        "Username",
+        "Password",
+        "read_topic",
+        "write_topic",
+        "flags",
+        "profile",
+    )
+
+    def __init__(
+        self,
+        Client_ID: str,
+        Username: str,
+        Password: str,
+        read_topic: Union[str, Iterable[str]],
+        write_topic: Union[str, Iterable[str]],
+        flags: int,
+        profile: Optional[str] = None,
+    ):
+        self.Client_ID = Client_ID
+        self.Username = Username
+        self.Password = Password
+        self.read_topic = intern_topics(read_topic)
+        self.write_topic = intern_topics(write_topic)
+        self.flags = flags
+        self.profile = profile
+
+    @classmethod
+    def from_model(cls, model: "DynamoModel") -> "CachedCredential":
+        if model.profile is not None:  # Permissions come from the profile
+            return cls(
+                Client_ID=model.Client_ID,
+                Username=model.Username,
+                Password=model.Password,
+                read_topic=(),
+                write_topic=(),
+                flags=0,
+                profile=model.profile,
+            )
+        return cls(
+            Client_ID=model.Client_ID,
+            Username=model.Username,
+            Password=model.Password,
+            read_topic=model.read_topic,
+            write_topic=model.write_topic,
+            flags=pack_flags(model),
+        )
+
+    def to_model(self) -> "DynamoModel":
+        from .types import DynamoModel
+
+        if self.profile is not None:
+            return DynamoModel(
+                Client_ID=self.Client_ID,
+                Username=self.Username,
+                Password=self.Password,
+                profile=self.profile,
+            )
+        return DynamoModel(
+            Client_ID=self.Client_ID,
+            Username=self.Username,
+            Password=self.Password,
+            read_topic=topics_value(self.read_topic),
+            write_topic=topics_value(self.write_topic),
+            allow_connect=self.allow_connect,
+            allow_read=self.allow_read,
+            allow_write=self.allow_write,
+        )
+
+    def with_profile(self, profile: "PolicyProfile") -> "CachedCredential":
+        # A per request copy with the profile's permissions, the cached record keeps none
+        return CachedCredential(
+            Client_ID=self.Client_ID,
+            Username=self.Username,
+            Password=self.Password,
+            read_topic=profile.read_topic,
+            write_topic=profile.write_topic,
+            flags=profile.flags,
+            profile=self.profile,
+        )
+
+    @property
+    def allow_connect(self) -> bool:
+        return bool(self.flags & ALLOW_CONNECT)
+
+    @property
+    def allow_read(self) -> bool:
+        return bool(self.flags & ALLOW_READ)
+
+    @property
+    def allow_write(self) -> bool:
+        return bool(self.flags & ALLOW_WRITE)
+
+    def _key(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CachedCredential):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        # Never include the password, these end up in logs
+        return (
+            f"CachedCredential(Client_ID={self.Client_ID!r}, flags={self.flags}, "
+            f"read_topic={self.read_topic!r}, write_topic={self.write_topic!r}, "
+            f"profile={self.profile!r})"
+        )
+
+
+class PolicyProfile:
+    """Compact PolicyProfileModel, the same permission attributes as CachedCredential."""
+
+    __slots__ = ("Name", "read_topic", "write_topic", "flags")
+
+    def __init__(
+        self,
+        Name: str,
+        read_topic: Union[str, Iterable[str]],
+        write_topic: Union[str, Iterable[str]],
+        flags: int,
+    ):
+        self.Name = Name
+        self.read_topic = intern_topics(read_topic)
+        self.write_topic = intern_topics(write_topic)
+        self.flags = flags
+
+    @classmethod
+    def from_model(cls, model: "PolicyProfileModel") -> "PolicyProfile":
+        return cls(
+            Name=model.Name,
+            read_topic=model.read_topic,
+            write_topic=model.write_topic,
+            flags=pack_flags(model),
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"PolicyProfile(Name={self.Name!r}, flags={self.flags}, "
+            f"read_topic={self.read_topic!r}, write_topic={self.write_topic!r})"
+        )
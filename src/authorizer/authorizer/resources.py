@@ -0,0 +1,229 @@
+from os import environ
+from threading import RLock
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from . import instrumentation
+from .config import env_bool
+from .log import logger
+
+if TYPE_CHECKING:
+    from botocore.config import Config
+    from mypy_boto3_dynamodb import DynamoDBClient, ServiceResource
+    from mypy_boto3_dynamodb.service_resource import Table
+
+
+# The function timeout is 3 seconds, botocore defaults (60s timeouts, legacy retries)
+# would happily blow through that on a single slow request
+DYNAMO_CONNECT_TIMEOUT = float(environ.get("DYNAMO_CONNECT_TIMEOUT", 0.5))
+DYNAMO_READ_TIMEOUT = float(environ.get("DYNAMO_READ_TIMEOUT", 1))
+DYNAMO_MAX_ATTEMPTS = int(environ.get("DYNAMO_MAX_ATTEMPTS", 2))
+DYNAMO_RETRY_MODE = environ.get("DYNAMO_RETRY_MODE", "standard")
+DYNAMO_MAX_POOL_CONNECTIONS = int(environ.get("DYNAMO_MAX_POOL_CONNECTIONS", 10))
+DYNAMO_TCP_KEEPALIVE = env_bool("DYNAMO_TCP_KEEPALIVE", True)
+# The low level client skips the resource layer's per call model/shape machinery
+DYNAMO_USE_CLIENT = env_bool("DYNAMO_USE_CLIENT", False)
+# Build the client (and open a connection) during Lambda init rather than on the first CONNECT
+PREWARM_RESOURCES = env_bool("PREWARM_RESOURCES", False)
+PREWARM_KEY = "__authorizer_prewarm__"
+
+T = TypeVar("T")
+
+# Error codes that mean the client itself is bad rather than the request
+RECOVERABLE_ERROR_CODES = frozenset(
+    (
+        "ExpiredToken",
+        "ExpiredTokenException",
+        "RequestExpired",
+        "InvalidClientTokenId",
+        "UnrecognizedClientException",
+    )
+)
+
+
+def dynamo_config() -> "Config":
+    from botocore.config import Config
+
+    options: Dict[str, Any] = dict(
+        connect_timeout=DYNAMO_CONNECT_TIMEOUT,
+        read_timeout=DYNAMO_READ_TIMEOUT,
+        retries=dict(mode=DYNAMO_RETRY_MODE, total_max_attempts=DYNAMO_MAX_ATTEMPTS),
+        max_pool_connections=DYNAMO_MAX_POOL_CONNECTIONS,
+    )
+    # Only newer botocore versions know about tcp_keepalive
+    if "tcp_keepalive" in Config.OPTION_DEFAULTS:
+        options["tcp_keepalive"] = DYNAMO_TCP_KEEPALIVE
+    return Config(**options)
+
+
+class ClientTable:
+    """
+    Wraps the low level DynamoDB client so it can be used where a Table is expected.
+
+    Only get_item and scan are implemented since that's all the authorizer does, keys and
+    items are (de)serialized the same way the resource layer would.
+    """
+
+    def __init__(self, client: "DynamoDBClient", table_name: str):
+        from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+        self.client = client
+        self.name = table_name
+        self._serializer = TypeSerializer()
+        self._deserializer = TypeDeserializer()
+
+    def _serialize(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: self._serializer.serialize(v) for k, v in item.items()}
+
+    def _deserialize(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: self._deserializer.deserialize(v) for k, v in item.items()}
+
+    def get_item(self, Key: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        response = self.client.get_item(
+            TableName=self.name, Key=self._serialize(Key), **kwargs
+        )
+        if "Item" in response:
+            response["Item"] = self._deserialize(response["Item"])
+        return response
+
+    def scan(self, **kwargs) -> Dict[str, Any]:
+        if "ExclusiveStartKey" in kwargs:
+            kwargs["ExclusiveStartKey"] = self._serialize(kwargs["ExclusiveStartKey"])
+        response = self.client.scan(TableName=self.name, **kwargs)
+        response["Items"] = [self._deserialize(i) for i in response.get("Items", [])]
+        if "LastEvaluatedKey" in response:
+            response["LastEvaluatedKey"] = self._deserialize(
+                response["LastEvaluatedKey"]
+            )
+        return response
+
+
+def build_resources() -> Tuple[
+    Union["ServiceResource", "DynamoDBClient"], Union["Table", ClientTable]
+]:
+    # boto3 is the bulk of our import time so only load it when we need to talk to AWS
+    import boto3
+
+    table_name = environ.get("DYNAMO_TABLE_NAME", None)
+    if DYNAMO_USE_CLIENT:
+        client = boto3.client(service_name="dynamodb", config=dynamo_config())
+        return client, ClientTable(client, table_name)
+    resource = boto3.resource(service_name="dynamodb", config=dynamo_config())
+    return resource, resource.Table(table_name)
+
+
+def warm_connection(table: Union["Table", ClientTable]) -> None:
+    # A throwaway read means endpoint resolution and the TLS handshake happen during init
+    try:
+        table.get_item(
+            Key=dict(Client_ID=PREWARM_KEY), ProjectionExpression="Client_ID"
+        )
+    except Exception as e:  # Never fail init over this, the real request will retry
+        logger.warning("DynamoDB prewarm failed", error=repr(e))
+
+
+def is_recoverable(error: BaseException) -> bool:
+    # Only called on the error path, so importing botocore here costs nothing normally
+    from botocore.exceptions import (
+        ClientError,
+        ConnectionClosedError,
+        EndpointConnectionError,
+    )
+
+    if isinstance(error, (ConnectionClosedError, EndpointConnectionError)):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in RECOVERABLE_ERROR_CODES
+    return False
+
+
+class ResourceHolder:
+    """
+    Keeps clients around for the life of the container.
+
+    Anything expensive to build (boto3 clients, connection pools) gets registered here
+    by name and built on first use. It's only thrown away and rebuilt when using it
+    raises an error that means the client is broken, e.g. expired credentials.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._depends_on: Dict[str, Tuple[str, ...]] = {}
+        self._instances: Dict[str, Any] = {}
+        # Reentrant since a factory can get() the resources it depends on
+        self._lock = RLock()
+
+    def register(
+        self, name: str, factory: Callable[[], Any], depends_on: Tuple[str, ...] = ()
+    ) -> None:
+        # depends_on means a rebuild of any of those also throws this one away
+        with self._lock:
+            self._factories[name] = factory
+            self._depends_on[name] = depends_on
+            self._reset(name)
+
+    def get(self, name: str) -> Any:
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:  # Don't let two threads build the same client
+            if name not in self._instances:
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def _reset(self, name: str) -> None:
+        self._instances.pop(name, None)
+        for dependent, depends_on in self._depends_on.items():
+            if name in depends_on:
+                self._reset(dependent)
+
+    def _roots(self, name: str) -> Set[str]:
+        depends_on = self._depends_on.get(name, ())
+        if not depends_on:
+            return {name}
+        return set().union(*(self._roots(d) for d in depends_on))
+
+    def reset(self, name: Optional[str] = None) -> None:
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._reset(name)
+
+    def call(self, name: str, fn: Callable[[Any], T]) -> T:
+        # Run fn against the resource, rebuilding it and retrying once if it's broken
+        try:
+            return fn(self.get(name))
+        except Exception as e:
+            if not is_recoverable(e):
+                raise
+            logger.warning("Rebuilding resource", resource=name, error=repr(e))
+            instrumentation.current().count("ResourceRebuild")
+            with self._lock:
+                # The broken client is probably something this is built on top of
+                for root in self._roots(name):
+                    self._reset(root)
+            return fn(self.get(name))
+
+
+DYNAMODB = "dynamodb"
+
+resource_holder = ResourceHolder()
+resource_holder.register(DYNAMODB, build_resources)
+
+
+def dynamodb_client() -> "DynamoDBClient":
+    # The low level client under DYNAMODB, for the authorizer's other tables
+    dynamodb = resource_holder.get(DYNAMODB)[0]
+    # The resource layer keeps its low level client on .meta
+    return getattr(dynamodb.meta, "client", dynamodb)
@@ -0,0 +1,191 @@
+"""
+Local HTTP auth service for a self hosted broker, built on AsyncAuthorizer.
+
+    python -m authorizer.sidecar --host 127.0.0.1 --port 8080
+
+POST /authorize takes the same event IoT Core sends the Lambda function and returns the
+same policy. POST /mqtt/auth takes {"username", "password", "clientid"} with the plain
+password (what mosquitto-go-auth's http backend sends) and answers 200 if the device
+authenticates and its policy allows iot:Connect, 403 otherwise.
+GET /health is for load balancer checks. Connections are kept alive between requests.
+"""
+import asyncio
+import json
+from argparse import ArgumentParser
+from base64 import b64encode
+from typing import Any, Dict, List, Optional, Tuple
+
+from .async_core import AsyncAuthorizer
+from .log import logger
+from .parsing import AuthorizerRequest, InvalidRequest, MQTTDetails
+from .policy import allows
+
+MAX_BODY_BYTES = 64 * 1024
+# Request line and headers together, and how many header lines
+MAX_HEADER_BYTES = 16 * 1024
+MAX_HEADERS = 100
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        self.status = status
+        super().__init__(message or REASONS[status])
+
+
+async def _read_line(reader: asyncio.StreamReader) -> bytes:
+    try:
+        return await reader.readline()
+    except ValueError as e:  # Longer than the reader's buffer limit
+        raise HttpError(431) from e
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    # (method, path, headers, body), or None once the client has closed the connection
+    request_line = await _read_line(reader)
+    if not request_line:
+        return None
+    try:
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError as e:
+        raise HttpError(400, "Malformed request line") from e
+    headers: Dict[str, str] = {}
+    # Capped like the body, otherwise a client could send headers forever
+    header_bytes, header_lines = len(request_line), 0
+    while True:
+        line = await _read_line(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        header_bytes += len(line)
+        header_lines += 1
+        if header_bytes > MAX_HEADER_BYTES or header_lines > MAX_HEADERS:
+            raise HttpError(431)
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError as e:
+        raise HttpError(400, "Bad Content-Length") from e
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413)
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?", 1)[0], headers, body
+
+
+def encode_response(status: int, payload: Dict[str, Any], keep_alive: bool) -> bytes:
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+def mqtt_auth_request(body: Dict[str, Any]) -> AuthorizerRequest:
+    try:
+        username, password, client_id = (
+            body["username"],
+            body["password"],
+            body["clientid"],
+        )
+    except (KeyError, TypeError) as e:
+        raise InvalidRequest(f"Missing field in auth request: {e}") from e
+    if not all(isinstance(v, str) for v in (username, password, client_id)):
+        raise InvalidRequest("username, password and clientid must be strings")
+    # check_password expects the base64 IoT Core sends
+    return AuthorizerRequest(
+        mqtt=MQTTDetails(
+            username=username,
+            password=b64encode(password.encode("utf-8")).decode("ascii"),
+            clientId=client_id,
+        ),
+        signatureVerified=None,
+        token=None,
+    )
+
+
+class Sidecar:
+    def __init__(self, authorizer: Optional[AsyncAuthorizer] = None):
+        self.authorizer = authorizer or AsyncAuthorizer()
+
+    async def route(
+        self, method: str, path: str, body: bytes, source: Optional[str] = None
+    ) -> Tuple[int, Dict[str, Any]]:
+        if method == "GET" and path == "/health":
+            return 200, dict(ok=True)
+        if method != "POST" or path not in ("/authorize", "/mqtt/auth"):
+            raise HttpError(404)
+        try:
+            payload = json.loads(body or b"{}")
+            if path == "/authorize":
+                return 200, await self.authorizer.handle_event(payload, source)
+            request = mqtt_auth_request(payload)._replace(source=source)
+            policy = await self.authorizer.authorize(request)
+        except ValueError as e:  # Bad JSON, InvalidRequest and pydantic errors
+            raise HttpError(400, str(e)) from e
+        # A device can authenticate and still not be allowed to connect
+        allowed = allows(policy, "iot:Connect")
+        return (200 if allowed else 403), dict(ok=allowed)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        peer = writer.get_extra_info("peername")
+        source = peer[0] if isinstance(peer, tuple) else None
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        return
+                    method, path, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, payload = await self.route(method, path, body, source)
+                except HttpError as e:
+                    status, payload = e.status, dict(error=str(e))
+                except Exception as e:
+                    logger.error("sidecar request failed", error=repr(e))
+                    status, payload = 500, dict(error=REASONS[500])
+                writer.write(encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away mid request, nothing to answer
+        finally:
+            writer.close()
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+async def serve(host: str, port: int) -> None:
+    server = await Sidecar().start(host, port)
+    logger.info("sidecar listening", host=host, port=port)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(description="Local HTTP auth service for MQTT brokers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Single flight: concurrent calls for the same key share one call and its result or error.
+
+A device retrying CONNECT in a tight loop, or a threaded/async front end with many
+requests in flight, would otherwise put several identical reads on the wire at once.
+Only calls that overlap are shared, nothing is remembered once the call returns, that's
+the credential cache's job.
+"""
+from threading import Event, Lock
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from . import instrumentation
+
+if TYPE_CHECKING:
+    import asyncio
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """For threads, the first caller for a key runs fn and the rest wait for it."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            instrumentation.current().count("Coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """For coroutines on one event loop, every caller awaits the same future."""
+
+    def __init__(self):
+        # Only touched from the event loop, so no lock
+        self._calls: Dict[Hashable, "asyncio.Future"] = {}
+
+    async def do(self, key: Hashable, start: Callable[[], Awaitable[Any]]) -> Any:
+        import asyncio
+
+        future = self._calls.get(key)
+        if future is None:
+            future = self._calls[key] = asyncio.ensure_future(start())
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            instrumentation.current().count("Coalesced")
+        # shield, so one cancelled caller doesn't cancel the call for the others
+        return await asyncio.shield(future)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
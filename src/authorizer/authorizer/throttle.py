@@ -0,0 +1,179 @@
+"""
+Connect throttling, so retry loops and credential spraying never reach the backend.
+
+Every CONNECT takes a token from three buckets: one for its client id, one for its
+source and one shared by everything. The source is the sidecar's peer address, IoT
+Core's events don't carry an address so CONNECTs through the Lambda function skip that
+bucket. A CONNECT finding any of them empty gets a deny without a credential lookup or
+a password check. Each limit is off while its rate is 0.
+
+Buckets live in this container's memory and the least recently used are dropped past
+THROTTLE_MAX_KEYS, a dropped bucket comes back full. THROTTLE_SHARED=dynamodb adds a
+per client count across containers on top, a fixed window counter in DynamoDB. It costs
+a write per CONNECT that got past the local buckets, and lets everything through if the
+table can't be reached.
+"""
+from os import environ
+from threading import Lock
+from time import monotonic, time
+from typing import Any, Callable, Optional
+
+from cachetools import LRUCache
+
+from .log import logger
+from .resources import DYNAMODB, dynamodb_client, resource_holder
+
+THROTTLE_CLIENT_RATE = float(environ.get("THROTTLE_CLIENT_RATE", 0))
+THROTTLE_CLIENT_BURST = float(environ.get("THROTTLE_CLIENT_BURST", 10))
+THROTTLE_SOURCE_RATE = float(environ.get("THROTTLE_SOURCE_RATE", 0))
+THROTTLE_SOURCE_BURST = float(environ.get("THROTTLE_SOURCE_BURST", 100))
+THROTTLE_GLOBAL_RATE = float(environ.get("THROTTLE_GLOBAL_RATE", 0))
+THROTTLE_GLOBAL_BURST = float(environ.get("THROTTLE_GLOBAL_BURST", 1000))
+THROTTLE_MAX_KEYS = int(environ.get("THROTTLE_MAX_KEYS", 10000))
+
+# "off" or "dynamodb"
+THROTTLE_SHARED = environ.get("THROTTLE_SHARED", "off").lower()
+THROTTLE_TABLE_NAME = environ.get("THROTTLE_TABLE_NAME", "MQTTAuthThrottle")
+THROTTLE_SHARED_LIMIT = int(environ.get("THROTTLE_SHARED_LIMIT", 30))
+THROTTLE_SHARED_WINDOW_SECONDS = int(environ.get("THROTTLE_SHARED_WINDOW_SECONDS", 60))
+
+THROTTLE_COUNTERS = "throttle_counters"
+
+
+class TokenBuckets:
+    """One token bucket per key, refilled at rate per second up to burst."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_keys: int = THROTTLE_MAX_KEYS,
+        timer: Callable[[], float] = monotonic,
+    ):
+        self.enabled = rate > 0
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._timer = timer
+        # (tokens, when) per key, a bucket that isn't here is full
+        self._buckets = LRUCache(maxsize=max(max_keys, 1))
+        self._lock = Lock()
+
+    def take(self, key: str) -> bool:
+        if not self.enabled:
+            return True
+        now = self._timer()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._buckets)
+
+
+class DynamoCounter:
+    """Fixed window counts in a table keyed by Key, with ExpiresAt as its TTL attribute."""
+
+    def __init__(
+        self,
+        client: Any,
+        table_name: str = THROTTLE_TABLE_NAME,
+        limit: int = THROTTLE_SHARED_LIMIT,
+        window: int = THROTTLE_SHARED_WINDOW_SECONDS,
+    ):
+        self.client = client
+        self.table_name = table_name
+        self.limit = limit
+        self.window = window
+
+    def take(self, key: str) -> bool:
+        now = int(time())
+        start = now - now % self.window
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key=dict(Key=dict(S=f"{key}#{start}")),
+                UpdateExpression="ADD Hits :one SET ExpiresAt = :expires",
+                ConditionExpression="attribute_not_exists(Hits) OR Hits < :limit",
+                ExpressionAttributeValues={
+                    ":one": dict(N="1"),
+                    ":limit": dict(N=str(self.limit)),
+                    ":expires": dict(N=str(start + 2 * self.window)),
+                },
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+
+def build_counter() -> Optional[DynamoCounter]:
+    if THROTTLE_SHARED == "off":
+        return None
+    if THROTTLE_SHARED == "dynamodb":
+        return DynamoCounter(dynamodb_client())
+    raise ValueError(f"Unknown THROTTLE_SHARED {THROTTLE_SHARED}")
+
+
+resource_holder.register(THROTTLE_COUNTERS, build_counter, depends_on=(DYNAMODB,))
+
+
+class ConnectThrottle:
+    def __init__(
+        self,
+        client: Optional[TokenBuckets] = None,
+        source: Optional[TokenBuckets] = None,
+        global_: Optional[TokenBuckets] = None,
+        shared: bool = THROTTLE_SHARED != "off",
+    ):
+        # Not "or", an empty TokenBuckets is falsy
+        if client is None:
+            client = TokenBuckets(THROTTLE_CLIENT_RATE, THROTTLE_CLIENT_BURST)
+        if source is None:
+            source = TokenBuckets(THROTTLE_SOURCE_RATE, THROTTLE_SOURCE_BURST)
+        if global_ is None:
+            global_ = TokenBuckets(
+                THROTTLE_GLOBAL_RATE, THROTTLE_GLOBAL_BURST, max_keys=1
+            )
+        self.client = client
+        self.source = source
+        self.global_ = global_
+        self.shared = shared
+
+    def check_local(self, client_id: str, source: Optional[str]) -> Optional[str]:
+        # Name of the limit hit, None if the CONNECT can go ahead. Most specific first,
+        # so one noisy client doesn't use up the global bucket
+        if not self.client.take(client_id):
+            return "client"
+        if source is not None and not self.source.take(source):
+            return "source"
+        if not self.global_.take(""):
+            return "global"
+        return None
+
+    def check_shared(self, client_id: str) -> Optional[str]:
+        if not self.shared:
+            return None
+        try:
+            allowed = resource_holder.call(
+                THROTTLE_COUNTERS, lambda counter: counter.take(client_id)
+            )
+        except Exception as e:  # Better to let a CONNECT through than fail it
+            logger.warning("Shared throttle failed", error=repr(e))
+            return None
+        return None if allowed else "shared"
+
+    def check(self, client_id: str, source: Optional[str]) -> Optional[str]:
+        return self.check_local(client_id, source) or self.check_shared(client_id)
+
+
+throttle = ConnectThrottle()
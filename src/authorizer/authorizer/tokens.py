@@ -0,0 +1,267 @@
+"""
+Signed tokens that carry a device's permissions, so a CONNECT needs no lookup at all.
+
+A token is three base64url parts joined with dots, the same layout as a JWT,
+
+    {"alg": "HS256" or "EdDSA", "kid": "<key id>"} . <claims> . <signature>
+
+with the claims
+
+    sub      the client id the token was issued to, has to match the CONNECT
+    exp      expiry, seconds since the epoch
+    nbf      optional, not valid before
+    connect  optional, defaults to true
+    read     topic filter or list of them, as read_topic
+    write    topic filter or list of them, as write_topic
+
+Devices send the token in place of their password, or as the token of a signed IoT Core
+authorizer. Verification keys come from TOKEN_HMAC_KEYS and TOKEN_ED25519_KEYS
+(comma separated kid=base64 pairs, raw 32 byte public keys for Ed25519) and are parsed
+once per container. Ed25519 needs the cryptography package, HMAC only needs the standard
+library. Mint tokens for testing with
+
+    python -m authorizer.tokens issue --client-id device-1 --read 'cmd/#' --kid k1
+"""
+import hmac
+import json
+from argparse import ArgumentParser
+from base64 import b64decode, urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from functools import lru_cache
+from hashlib import sha256
+from os import environ
+from threading import Lock
+from time import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from cachetools import LRUCache
+
+from .records import ALLOW_CONNECT, ALLOW_READ, ALLOW_WRITE, CachedCredential
+
+# "off", "prefer" (tokens when a device sends one, the table otherwise) or "require"
+TOKEN_MODE = environ.get("TOKEN_MODE", "off").lower()
+TOKEN_LEEWAY_SECONDS = int(environ.get("TOKEN_LEEWAY_SECONDS", 30))
+TOKEN_CACHE_MAX_ENTRIES = int(environ.get("TOKEN_CACHE_MAX_ENTRIES", 10000))
+
+HS256 = "HS256"
+EDDSA = "EdDSA"
+# IoT Core's limits on disconnectAfterInSeconds
+MIN_CONNECTION_SECONDS = 300
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class TokenClaims(NamedTuple):
+    sub: str
+    exp: float
+    connect: bool
+    read: Tuple[str, ...]
+    write: Tuple[str, ...]
+
+    def credential(self, username: str) -> CachedCredential:
+        # Same shape as a table record, so the policy compiler (and its cache) is shared
+        return CachedCredential(
+            Client_ID=self.sub,
+            Username=username,
+            Password="",
+            read_topic=self.read,
+            write_topic=self.write,
+            flags=(ALLOW_CONNECT if self.connect else 0)
+            | (ALLOW_READ if self.read else 0)
+            | (ALLOW_WRITE if self.write else 0),
+        )
+
+
+def _b64url_decode(part: str) -> bytes:
+    return urlsafe_b64decode(part + "=" * (-len(part) % 4))
+
+
+def _b64url_encode(raw: bytes) -> str:
+    return urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _parse_keys(value: str) -> Dict[str, bytes]:
+    keys: Dict[str, bytes] = {}
+    for pair in filter(None, (p.strip() for p in value.split(","))):
+        kid, _, key = pair.partition("=")
+        keys[kid.strip()] = b64decode(key.strip())
+    return keys
+
+
+@lru_cache(maxsize=None)
+def hmac_keys() -> Dict[str, bytes]:
+    return _parse_keys(environ.get("TOKEN_HMAC_KEYS", ""))
+
+
+@lru_cache(maxsize=None)
+def ed25519_keys() -> Dict[str, Any]:
+    raw = _parse_keys(environ.get("TOKEN_ED25519_KEYS", ""))
+    if not raw:
+        return {}
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+    return {kid: Ed25519PublicKey.from_public_bytes(key) for kid, key in raw.items()}
+
+
+def split_token(token: str) -> Tuple[Dict[str, Any], str, bytes, bytes]:
+    # (header, claims part, signing input, signature), checks the layout but not the signature
+    parts = token.split(".")
+    if len(parts) != 3:
+        raise InvalidToken("Expected three parts")
+    try:
+        signed = f"{parts[0]}.{parts[1]}".encode("ascii")
+        header = json.loads(_b64url_decode(parts[0]))
+        signature = _b64url_decode(parts[2])
+    except (BinasciiError, ValueError) as e:  # Unicode errors are ValueErrors
+        raise InvalidToken(f"Malformed token: {e}") from e
+    # alg and kid are used as lookup keys, anything but a string isn't a token of ours
+    if (
+        not isinstance(header, dict)
+        or not isinstance(header.get("alg"), str)
+        or not isinstance(header.get("kid", "default"), str)
+    ):
+        raise InvalidToken("Malformed header")
+    return header, parts[1], signed, signature
+
+
+def _check_signature(header: Dict[str, Any], signed: bytes, signature: bytes) -> None:
+    alg, kid = header["alg"], header.get("kid", "default")
+    if alg == HS256:
+        key = hmac_keys().get(kid)
+        if key is None:
+            raise InvalidToken(f"Unknown HMAC key {kid}")
+        if not hmac.compare_digest(hmac.new(key, signed, sha256).digest(), signature):
+            raise InvalidToken("Bad signature")
+    elif alg == EDDSA:
+        public_key = ed25519_keys().get(kid)
+        if public_key is None:
+            raise InvalidToken(f"Unknown Ed25519 key {kid}")
+        from cryptography.exceptions import InvalidSignature
+
+        try:
+            public_key.verify(signature, signed)
+        except InvalidSignature as e:
+            raise InvalidToken("Bad signature") from e
+    else:  # Never "none", and nothing that could be confused with it
+        raise InvalidToken(f"Unsupported alg {alg}")
+
+
+def _topics(value: Any) -> Tuple[str, ...]:
+    if isinstance(value, str):
+        return (value,) if value else ()
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return tuple(dict.fromkeys(v for v in value if v))
+    raise InvalidToken("read and write must be a topic filter or a list of them")
+
+
+def _claims(claims_part: str) -> TokenClaims:
+    try:
+        claims = json.loads(_b64url_decode(claims_part))
+    except (BinasciiError, ValueError) as e:
+        raise InvalidToken(f"Malformed claims: {e}") from e
+    if not isinstance(claims, dict):
+        raise InvalidToken("Malformed claims")
+    sub, exp = claims.get("sub"), claims.get("exp")
+    if not isinstance(sub, str) or not isinstance(exp, (int, float)):
+        raise InvalidToken("sub and exp are required")
+    nbf = claims.get("nbf", 0)
+    if not isinstance(nbf, (int, float)) or nbf > time() + TOKEN_LEEWAY_SECONDS:
+        raise InvalidToken("Not valid yet")
+    return TokenClaims(
+        sub=sub,
+        exp=float(exp),
+        connect=claims.get("connect", True) is True,
+        read=_topics(claims.get("read", ())),
+        write=_topics(claims.get("write", ())),
+    )
+
+
+class TokenVerifier:
+    """Verified tokens are remembered, a reconnect skips the signature check."""
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_MAX_ENTRIES):
+        self._verified = LRUCache(maxsize=max(maxsize, 1))
+        self._lock = Lock()
+
+    def verify(self, token: str, client_id: str) -> TokenClaims:
+        with self._lock:
+            claims = self._verified.get(token)
+        if claims is None:
+            header, claims_part, signed, signature = split_token(token)
+            _check_signature(header, signed, signature)
+            claims = _claims(claims_part)
+            with self._lock:
+                self._verified[token] = claims
+        # Checked on every use, a remembered token still expires. IoT Core keeps a
+        # connection at least MIN_CONNECTION_SECONDS, a token running out sooner can't
+        # get one that ends with it
+        remaining = claims.exp - time()
+        if remaining + TOKEN_LEEWAY_SECONDS < 0:
+            raise InvalidToken("Expired")
+        if remaining < MIN_CONNECTION_SECONDS:
+            raise InvalidToken("Expires before the shortest connection IoT Core allows")
+        if not hmac.compare_digest(claims.sub.encode(), client_id.encode()):
+            raise InvalidToken("Issued to another client")
+        return claims
+
+    def clear(self) -> None:
+        with self._lock:
+            self._verified.clear()
+
+
+verifier = TokenVerifier()
+
+
+def connection_seconds(claims: TokenClaims, longest: int) -> int:
+    # IoT Core keeps the connection for disconnectAfterInSeconds, not past the token.
+    # verify() turned away tokens with less than MIN_CONNECTION_SECONDS left
+    remaining = int(claims.exp - time())
+    return max(MIN_CONNECTION_SECONDS, min(longest, remaining))
+
+
+def sign_token(
+    claims: Dict[str, Any], key: Union[bytes, Any], kid: str = "default"
+) -> str:
+    """A token for claims, key is an HMAC secret or an Ed25519PrivateKey."""
+    alg = HS256 if isinstance(key, bytes) else EDDSA
+    header = _b64url_encode(
+        json.dumps(dict(alg=alg, kid=kid), separators=(",", ":")).encode()
+    )
+    body = _b64url_encode(json.dumps(claims, separators=(",", ":")).encode())
+    signed = f"{header}.{body}".encode("ascii")
+    if alg == HS256:
+        signature = hmac.new(key, signed, sha256).digest()
+    else:
+        signature = key.sign(signed)
+    return f"{header}.{body}.{_b64url_encode(signature)}"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(description="Signed device tokens")
+    commands = parser.add_subparsers(dest="command", required=True)
+    issue = commands.add_parser("issue", help="print an HS256 token for a device")
+    issue.add_argument("--client-id", required=True)
+    issue.add_argument("--read", action="append", default=[])
+    issue.add_argument("--write", action="append", default=[])
+    issue.add_argument("--no-connect", action="store_true")
+    issue.add_argument("--ttl", type=int, default=24 * 3600, help="seconds")
+    issue.add_argument("--kid", default="default", help="key id in TOKEN_HMAC_KEYS")
+    args = parser.parse_args(argv)
+
+    key = hmac_keys().get(args.kid)
+    if key is None:
+        parser.error(f"no key {args.kid} in TOKEN_HMAC_KEYS")
+    claims = dict(
+        sub=args.client_id,
+        exp=int(time()) + args.ttl,
+        connect=not args.no_connect,
+        read=args.read,
+        write=args.write,
+    )
+    print(sign_token(claims, key, args.kid))
+
+
+if __name__ == "__main__":
+    main()
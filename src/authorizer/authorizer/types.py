@@ -1,6 +1,6 @@
-from typing import List, Literal, Optional
+from typing import List, Literal, Optional, Union
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, root_validator, validator
 
 iot_action = Literal[
     "iot:Connect",
@@ -18,9 +18,9 @@ iot_action = Literal[
 
 
 class PolicyStatement(BaseModel):
-    Action: iot_action
+    Action: Union[iot_action, List[iot_action]]
     Effect: Literal["Allow", "Deny"]
-    Resource: str
+    Resource: Union[str, List[str]]
 
 
 class PolicyDocumentObject(BaseModel):
@@ -37,15 +37,66 @@ class PolicyDocument(BaseModel):
     policyDocuments: List[PolicyDocumentObject]
 
 
+def _topic_list(v):
+    # A DynamoDB string set comes back as a python set
+    if isinstance(v, (set, frozenset)):
+        return sorted(v)
+    if isinstance(v, tuple):
+        return list(v)
+    return v
+
+
+PERMISSION_FIELDS = (
+    "read_topic",
+    "write_topic",
+    "allow_read",
+    "allow_connect",
+    "allow_write",
+)
+
+
+class PolicyProfileModel(BaseModel):
+    """Permissions shared by every device naming it, stored under Client_ID profile#<Name>."""
+
+    Name: str
+    read_topic: Union[str, List[str]] = []
+    write_topic: Union[str, List[str]] = []
+    allow_read: bool = False
+    allow_connect: bool = False
+    allow_write: bool = False
+
+    _topic_list = validator("read_topic", "write_topic", pre=True, allow_reuse=True)(
+        _topic_list
+    )
+
+
 class DynamoModel(BaseModel):
     Client_ID: str
     Password: str
     Username: str
-    read_topic: str
-    write_topic: str
-    allow_read: bool
-    allow_connect: bool
-    allow_write: bool
+    # One topic filter or a list of them, ${iot:ClientId} is replaced with the client id
+    read_topic: Optional[Union[str, List[str]]] = None
+    write_topic: Optional[Union[str, List[str]]] = None
+    allow_read: Optional[bool] = None
+    allow_connect: Optional[bool] = None
+    allow_write: Optional[bool] = None
+    # Name of a PolicyProfileModel, when set its permissions are used instead of the above
+    profile: Optional[str] = None
+
+    _topic_list = validator("read_topic", "write_topic", pre=True, allow_reuse=True)(
+        _topic_list
+    )
+
+    @root_validator(skip_on_failure=True)
+    def permissions_or_profile(cls, values):
+        if values.get("profile") is None:
+            missing = [f for f in PERMISSION_FIELDS if values.get(f) is None]
+            if missing:
+                raise ValueError(f"{', '.join(missing)} required without a profile")
+        return values
+
+    def with_profile(self, profile: PolicyProfileModel) -> "DynamoModel":
+        return self.copy(update={f: getattr(profile, f) for f in PERMISSION_FIELDS})
 
 
 class ConnectionData(BaseModel):
@@ -0,0 +1,14 @@
+import pytest
+
+from src.authorizer.authorizer.credential_cache import credential_cache
+from src.authorizer.authorizer.profiles import profile_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_credential_cache():
+    # The cache lives for the life of the container, which for tests is the session
+    credential_cache.clear()
+    profile_cache.clear()
+    yield
+    credential_cache.clear()
+    profile_cache.clear()
@@ -0,0 +1,91 @@
+"""
+Test data and fixtures shared by the unit tests.
+"""
+from base64 import b64encode
+from copy import deepcopy
+from json import load
+from pathlib import Path
+from uuid import uuid4
+
+import boto3
+from cfn_tools import load_yaml
+from moto import mock_dynamodb
+from mypy_boto3_dynamodb import DynamoDBServiceResource
+
+from src.authorizer.authorizer.types import DynamoModel
+
+root_path = Path(__file__).parent.parent.parent
+
+event_path = root_path / "events"
+
+TABLE_NAME_FOR_TESTING = "TestTablePleaseIgnore" + str(uuid4())
+CLIENT_ID_FOR_TESTING = "CLIENT_NAME"
+USERNAME_FOR_TESTING = "USER_NAME"
+PASSWORD_FOR_TESTING = "PASS_WORD"
+TOPIC_FOR_TESTING = "TestTopicPleaseIgnore" + str(uuid4())
+
+
+def load_json(file_path: Path) -> dict:
+    with open(file_path) as fp:
+        return load(fp)
+
+
+mqtt_auth = load_json(event_path / "mqtt_auth_no_verify.json")
+mqtt_auth_verify = load_json(event_path / "mqtt_auth_verify.json")
+
+
+def load_table_from_yml() -> dict:
+    yaml_path = root_path / "template.yaml"
+    with open(yaml_path) as fp:
+        yaml_doc = load_yaml(fp)
+        table = yaml_doc["Resources"]["Table"]["Properties"]
+        table["TableName"] = TABLE_NAME_FOR_TESTING
+        # The authorizer never reads the stream, and moto wants docker to emulate one
+        table.pop("StreamSpecification", None)
+        return table
+
+
+@mock_dynamodb
+def create_table_with_test_data():
+    dynamo: DynamoDBServiceResource = boto3.resource(service_name="dynamodb")
+    table = dynamo.create_table(**load_table_from_yml())
+
+    table.put_item(
+        Item=DynamoModel(
+            **dict(
+                Client_ID=CLIENT_ID_FOR_TESTING,
+                Password=PASSWORD_FOR_TESTING,
+                Username=USERNAME_FOR_TESTING,
+                allow_read=True,
+                read_topic=TOPIC_FOR_TESTING,
+                allow_connect=True,
+                allow_write=True,
+                write_topic=TOPIC_FOR_TESTING,
+            )
+        ).dict()
+    )
+    assert table.scan()["Items"][0]["read_topic"] == TOPIC_FOR_TESTING
+    return table
+
+
+# A table item for the in-memory FakeTable, and a CONNECT event that matches it
+ITEM = dict(
+    Client_ID="CLIENT",
+    Password="PASS_WORD",
+    Username="USER_NAME",
+    allow_read=True,
+    read_topic="topic/read",
+    allow_connect=True,
+    allow_write=False,
+    write_topic="topic/write",
+)
+
+
+def event(client_id: str = "CLIENT", password: str = "PASS_WORD") -> dict:
+    event = deepcopy(mqtt_auth)
+    event["protocolData"]["mqtt"] = dict(
+        username="USER_NAME",
+        password=b64encode(password.encode()).decode(),
+        clientId=client_id,
+    )
+    return event
@@ -0,0 +1,73 @@
+import asyncio
+from threading import Event
+
+import pytest
+
+from benchmarks.fake_table import FakeTable
+from src.authorizer.authorizer.async_core import AsyncAuthorizer
+from src.authorizer.authorizer.backends import DynamoBackend
+from src.authorizer.authorizer.core import get_details_for_client_id
+
+from .helpers import ITEM, event
+
+
+@pytest.fixture
+def table() -> FakeTable:
+    return FakeTable({"CLIENT": ITEM}, latency_ms=50)
+
+
+@pytest.fixture
+def authorizer(table):
+    backend = DynamoBackend(table)
+    authorizer = AsyncAuthorizer(lambda c: get_details_for_client_id(c, backend))
+    yield authorizer
+    authorizer.close()
+
+
+def test_handle_event(authorizer):
+    async def run():
+        good = await authorizer.handle_event(event())
+        bad = await authorizer.handle_event(event(password="nope"))
+        unknown = await authorizer.handle_event(event(client_id="nobody"))
+        return good, bad, unknown
+
+    good, bad, unknown = asyncio.run(run())
+    assert good["isAuthenticated"] is True
+    assert good["policyDocuments"][0]["Statement"]
+    assert bad["isAuthenticated"] is False
+    assert unknown["isAuthenticated"] is False
+
+
+def test_concurrent_lookups_coalesce(authorizer, table):
+    async def run():
+        return await asyncio.gather(
+            *(authorizer.handle_event(event()) for _ in range(50))
+        )
+
+    results = asyncio.run(run())
+    assert all(r["isAuthenticated"] for r in results)
+    assert table.reads == 1
+
+
+def test_cancelled_caller_does_not_cancel_lookup(table):
+    release = Event()
+
+    def slow_lookup(client_id):
+        release.wait(5)
+        return get_details_for_client_id(client_id, DynamoBackend(table))
+
+    authorizer = AsyncAuthorizer(slow_lookup)
+
+    async def run():
+        first = asyncio.ensure_future(authorizer.lookup("CLIENT"))
+        second = asyncio.ensure_future(authorizer.lookup("CLIENT"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        release.set()
+        return await second
+
+    try:
+        assert asyncio.run(run()).Client_ID == "CLIENT"
+    finally:
+        authorizer.close()
+    assert table.reads == 1
@@ -0,0 +1,79 @@
+from base64 import b64encode
+from copy import deepcopy
+from unittest import mock
+
+import pytest
+
+from src.authorizer.authorizer import app, backends
+from src.authorizer.authorizer.backends import (
+    CREDENTIALS,
+    SQLiteBackend,
+    build_sqlite,
+)
+from src.authorizer.authorizer.resources import resource_holder
+from src.authorizer.authorizer.types import DynamoModel
+
+from .helpers import mqtt_auth
+
+
+def device(i: int) -> DynamoModel:
+    return DynamoModel(
+        Client_ID=f"device-{i}",
+        Username=f"user-{i}",
+        Password=f"pass-{i}",
+        allow_connect=True,
+        allow_read=i % 2 == 0,
+        allow_write=i % 3 == 0,
+        # Every fifth device has a list, which SQLite has to store in one column
+        read_topic=[f"fleet/{i}/*", "shared/#"] if i % 5 == 0 else f"fleet/{i}/*",
+        write_topic=f"fleet/{i}/out",
+    )
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "credentials.db"
+    assert build_sqlite((device(i) for i in range(100)), path) == 100
+    return path
+
+
+def test_sqlite_lookup(db_path):
+    backend = SQLiteBackend(db_path)
+    for i in (0, 1, 5, 99):
+        item = backend.get_item(f"device-{i}")
+        assert DynamoModel(**item, Client_ID=f"device-{i}") == device(i)
+    assert backend.get_item("nope") is None
+
+
+def test_incomplete_backend_fails_when_created():
+    class NoLookup(backends.CredentialBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        NoLookup()
+
+
+def test_sqlite_is_read_only(db_path):
+    backend = SQLiteBackend(db_path)
+    with pytest.raises(Exception):
+        backend.connection.execute("DELETE FROM credentials")
+
+
+def test_handler_uses_configured_backend(db_path):
+    event = deepcopy(mqtt_auth)
+    event["protocolData"]["mqtt"] = dict(
+        username="user-3",
+        password=b64encode(b"pass-3").decode(),
+        clientId="device-3",
+    )
+    with mock.patch.multiple(
+        backends, CREDENTIAL_BACKEND="sqlite", CREDENTIAL_DB_PATH=str(db_path)
+    ):
+        resource_holder.reset(CREDENTIALS)
+        try:
+            assert isinstance(resource_holder.get(CREDENTIALS), SQLiteBackend)
+            assert app.lambda_handler(event, None)["isAuthenticated"] is True
+            event["protocolData"]["mqtt"]["clientId"] = "nope"
+            assert app.lambda_handler(event, None)["isAuthenticated"] is False
+        finally:
+            resource_holder.reset(CREDENTIALS)
@@ -0,0 +1,44 @@
+from benchmarks.harness import check_gates, make_events, run
+from src.authorizer.authorizer.resources import (
+    DYNAMODB,
+    build_resources,
+    resource_holder,
+)
+
+
+def test_events_use_templates():
+    events = make_events(clients=10, invocations=20, unknown_ratio=0.5, seed=1)
+    assert len(events) == 20
+    assert all(event["protocols"] == ["mqtt"] for event in events)
+    assert any(
+        e["protocolData"]["mqtt"]["clientId"].startswith("unknown") for e in events
+    )
+
+
+def test_small_run():
+    report = run(
+        clients=20,
+        invocations=200,
+        dynamo_latency_ms=1,
+        unknown_ratio=0.1,
+        bad_password_ratio=0.1,
+    )
+    cold, warm, cold_latency, warm_latency = report["scenarios"]
+    assert cold["table_reads"] <= 20 + 20  # each known and unknown id read at most once
+    assert warm["table_reads"] == 0
+    assert warm["hit_ratio"] == 1
+    assert cold["authenticated"] == warm["authenticated"] > 0
+    assert cold_latency["p99_ms"] >= 1
+    assert report["memory"]["cached_entries"] > 0
+    # The real DynamoDB resource is put back afterwards
+    assert resource_holder._factories[DYNAMODB] is build_resources
+
+    assert check_gates(report, min_throughput=None, max_p99_ms=None) == []
+    assert check_gates(report, min_throughput=1e12, max_p99_ms=0) != []
+    assert check_gates(report, None, None, min_hit_ratio=1) == []
+    # A warm run that went to the table, or a cold one slower than its table
+    broken = dict(report, scenarios=[dict(warm_latency, hit_ratio=0.5)])
+    assert len(check_gates(broken, None, None, min_hit_ratio=0.99)) == 1
+    assert check_gates(report, None, None, max_cold_p99_ms=0) == [
+        f"cold+1ms p99 {cold_latency['p99_ms']:.3f}ms > 0ms"
+    ]
@@ -0,0 +1,171 @@
+from time import sleep
+from unittest import mock
+
+import pytest
+
+from benchmarks.fake_table import FakeTable
+from src.authorizer.authorizer import core
+from src.authorizer.authorizer.backends import (
+    CREDENTIALS,
+    CredentialBackend,
+    build_backend,
+)
+from src.authorizer.authorizer.core import get_details_for_client_id, lookup_client
+from src.authorizer.authorizer.credential_cache import (
+    MISSING,
+    CredentialCache,
+    refresher,
+)
+from src.authorizer.authorizer.resources import DYNAMODB, resource_holder
+from src.authorizer.authorizer.records import CachedCredential
+from src.authorizer.authorizer.types import DynamoModel
+
+from .helpers import ITEM
+
+
+def make_record(client_id: str) -> DynamoModel:
+    return DynamoModel(**dict(ITEM, Client_ID=client_id))
+
+
+def test_hit_skips_dynamo():
+    table = FakeTable({"CLIENT": ITEM})
+    first = get_details_for_client_id("CLIENT", table)
+    second = get_details_for_client_id("CLIENT", table)
+    assert first == second
+    assert table.reads == 1
+
+
+def test_unknown_client_is_negatively_cached():
+    table = FakeTable({})
+    for _ in range(3):
+        with pytest.raises(KeyError):
+            get_details_for_client_id("NOPE", table)
+    assert table.reads == 1
+
+
+def test_ttl_expiry():
+    with mock.patch(
+        "src.authorizer.authorizer.credential_cache.monotonic", return_value=0
+    ) as clock:
+        cache = CredentialCache(ttl=10, negative_ttl=5, maxsize=10)
+        cache.put("a", make_record("a"))
+        cache.put_missing("b")
+        clock.return_value = 6
+        assert cache.get("a") is not None
+        assert cache.get("b") is None
+        clock.return_value = 11
+        assert cache.get("a") is None
+
+
+def test_lru_eviction():
+    cache = CredentialCache(ttl=60, negative_ttl=60, maxsize=2)
+    cache.put("a", make_record("a"))
+    cache.put("b", make_record("b"))
+    cache.get("a")  # a is now most recently used
+    cache.put("c", make_record("c"))
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_put_clears_negative_entry():
+    cache = CredentialCache(ttl=60, negative_ttl=60, maxsize=10)
+    cache.put_missing("a")
+    assert cache.get("a") is MISSING
+    cache.put("a", make_record("a"))
+    assert isinstance(cache.get("a"), CachedCredential)
+
+
+def test_disabled_cache():
+    cache = CredentialCache(ttl=0, negative_ttl=0, maxsize=10)
+    cache.put("a", make_record("a"))
+    cache.put_missing("b")
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+
+
+@pytest.fixture
+def clock():
+    with mock.patch(
+        "src.authorizer.authorizer.credential_cache.monotonic", return_value=0
+    ) as clock:
+        yield clock
+
+
+def wait_for_refreshes():
+    for _ in range(200):
+        if refresher.pending() == 0:
+            return
+        sleep(0.01)
+    raise AssertionError("background refresh never finished")
+
+
+def test_soft_ttl_serves_then_refreshes(clock):
+    cache = CredentialCache(ttl=60, negative_ttl=5, maxsize=10, soft_ttl=10)
+    table = FakeTable({"CLIENT": ITEM})
+    with mock.patch.object(core, "credential_cache", cache):
+        get_details_for_client_id("CLIENT", table)
+        table.items["CLIENT"] = {**ITEM, "Username": "RENAMED"}
+        clock.return_value = 5
+        assert get_details_for_client_id("CLIENT", table).Username == "USER_NAME"
+        assert table.reads == 1
+        clock.return_value = 15
+        # Past the soft TTL the old record comes straight back, the refresh is behind it
+        assert get_details_for_client_id("CLIENT", table).Username == "USER_NAME"
+        wait_for_refreshes()
+        assert table.reads == 2
+        assert get_details_for_client_id("CLIENT", table).Username == "RENAMED"
+
+
+def test_hard_ttl_fetches_synchronously(clock):
+    cache = CredentialCache(ttl=60, negative_ttl=5, maxsize=10, soft_ttl=10)
+    table = FakeTable({"CLIENT": ITEM})
+    with mock.patch.object(core, "credential_cache", cache):
+        get_details_for_client_id("CLIENT", table)
+        table.items["CLIENT"] = {**ITEM, "Username": "RENAMED"}
+        clock.return_value = 61
+        assert get_details_for_client_id("CLIENT", table).Username == "RENAMED"
+        assert refresher.pending() == 0
+
+
+def test_background_refresh_of_deleted_client(clock):
+    cache = CredentialCache(ttl=60, negative_ttl=30, maxsize=10, soft_ttl=10)
+    table = FakeTable({"CLIENT": ITEM})
+    with mock.patch.object(core, "credential_cache", cache):
+        get_details_for_client_id("CLIENT", table)
+        del table.items["CLIENT"]
+        clock.return_value = 15
+        get_details_for_client_id("CLIENT", table)
+        wait_for_refreshes()
+        assert cache.get("CLIENT") is MISSING
+
+
+class BrokenBackend(CredentialBackend):
+    def get_item(self, client_id):
+        raise RuntimeError("throttled")
+
+
+@pytest.fixture
+def broken_backend():
+    resource_holder.register(CREDENTIALS, BrokenBackend, depends_on=(DYNAMODB,))
+    yield
+    resource_holder.register(CREDENTIALS, build_backend, depends_on=(DYNAMODB,))
+
+
+@pytest.mark.parametrize("stale_if_error", [0, 300])
+def test_stale_if_error(clock, broken_backend, stale_if_error):
+    cache = CredentialCache(
+        ttl=60, negative_ttl=5, maxsize=10, stale_if_error=stale_if_error
+    )
+    with mock.patch.object(core, "credential_cache", cache):
+        cache.put("CLIENT", make_record("CLIENT"))
+        clock.return_value = 120
+        assert cache.get("CLIENT") is None
+        if stale_if_error:
+            assert lookup_client("CLIENT").Username == "USER_NAME"
+        else:
+            with pytest.raises(RuntimeError):
+                lookup_client("CLIENT")
+        clock.return_value = 400  # Past the stale window as well, nothing left to serve
+        with pytest.raises(RuntimeError):
+            lookup_client("CLIENT")
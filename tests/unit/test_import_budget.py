@@ -0,0 +1,80 @@
+import subprocess
+import sys
+from os import environ
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+root_path = Path(__file__).parent.parent.parent
+
+APP_MODULE = "src.authorizer.authorizer.app"
+# Cumulative import time we allow for the handler module, generous enough for a noisy CI box
+IMPORT_BUDGET_MS = float(environ.get("IMPORT_BUDGET_MS", 150))
+# Nothing in here should be needed just to import the handler
+DEFERRED_PACKAGES = ["asyncio", "boto3", "botocore", "mypy_boto3_dynamodb", "pydantic"]
+
+
+def import_time_report(module: str) -> Dict[str, int]:
+    # Maps module name -> cumulative microseconds from python -X importtime
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        report[name.strip()] = int(cumulative)
+    return report
+
+
+@pytest.fixture(scope="module")
+def report() -> Dict[str, int]:
+    return import_time_report(APP_MODULE)
+
+
+@pytest.mark.parametrize("package", DEFERRED_PACKAGES)
+def test_heavy_imports_deferred(report, package):
+    assert package not in report, f"{package} is imported by {APP_MODULE}"
+
+
+def test_import_budget(report):
+    # Best of a few runs so one slow run on a busy box doesn't fail the build
+    best_ms = (
+        min(
+            [report[APP_MODULE]]
+            + [import_time_report(APP_MODULE)[APP_MODULE] for _ in range(2)]
+        )
+        / 1000
+    )
+    slowest = sorted(report.items(), key=lambda kv: kv[1], reverse=True)[:10]
+    assert best_ms < IMPORT_BUDGET_MS, f"{best_ms:.1f}ms, slowest imports {slowest}"
+
+
+def test_prewarm_loads_models_during_init():
+    # The warm up itself is stubbed out, this is only about what init imports
+    prelude = "; ".join(
+        [
+            "import sys",
+            "from src.authorizer.authorizer import resources",
+            "resources.warm_connection = lambda table: None",
+            "resources.resource_holder.register(resources.DYNAMODB, lambda: (None, None))",
+            "assert 'pydantic' not in sys.modules",
+            f"import {APP_MODULE}",
+            "print('pydantic' in sys.modules)",
+        ]
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", prelude],
+        cwd=root_path,
+        env=dict(environ, PREWARM_RESOURCES="true"),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "True"
@@ -0,0 +1,95 @@
+import os
+from base64 import b64encode
+from copy import deepcopy
+from io import StringIO
+from json import loads
+from unittest import mock
+
+from moto import mock_dynamodb
+
+from src.authorizer.authorizer import app, core, instrumentation
+from src.authorizer.authorizer.instrumentation import NULL_INVOCATION, instrumented
+from src.authorizer.authorizer.log import JsonLogger
+
+from .helpers import (
+    PASSWORD_FOR_TESTING,
+    TABLE_NAME_FOR_TESTING,
+    create_table_with_test_data,
+    mqtt_auth,
+)
+
+
+def good_event() -> dict:
+    event = deepcopy(mqtt_auth)
+    event["protocolData"]["mqtt"]["password"] = b64encode(
+        PASSWORD_FOR_TESTING.encode("utf-8")
+    ).decode("utf-8")
+    return event
+
+
+def run_handler(mode: str, times: int) -> list:
+    stream = StringIO()
+    quiet = JsonLogger(level="ERROR", stream=stream)
+    # The module level handler was decorated at import, with instrumentation off
+    handler = instrumented(app.lambda_handler, mode=mode)
+    with mock.patch.object(instrumentation, "logger", quiet), mock.patch.object(
+        core, "logger", quiet
+    ):
+        for _ in range(times):
+            assert handler(good_event(), None)["isAuthenticated"] is True
+    return [loads(line) for line in stream.getvalue().splitlines()]
+
+
+@mock.patch.dict(os.environ, dict(DYNAMO_TABLE_NAME=TABLE_NAME_FOR_TESTING))
+@mock_dynamodb
+def test_record_per_invocation():
+    create_table_with_test_data()
+    miss, hit = run_handler("record", 2)
+    assert set(miss["timings"]) == {
+        "ParseMs",
+        "LookupMs",
+        "DynamoDBMs",
+        "CheckPasswordMs",
+        "PolicyMs",
+        "TotalMs",
+    }
+    assert miss["counters"] == dict(CacheMiss=1, DynamoRetries=0)
+    assert "DynamoDBMs" not in hit["timings"]
+    assert hit["counters"] == dict(CacheHit=1)
+
+
+@mock.patch.dict(os.environ, dict(DYNAMO_TABLE_NAME=TABLE_NAME_FOR_TESTING))
+@mock_dynamodb
+def test_emf_per_invocation():
+    create_table_with_test_data()
+    (record,) = run_handler("emf", 1)
+    (directive,) = record["_aws"]["CloudWatchMetrics"]
+    units = {metric["Name"]: metric["Unit"] for metric in directive["Metrics"]}
+    assert units["DynamoDBMs"] == "Milliseconds"
+    assert units["CacheMiss"] == "Count"
+    assert record["CacheMiss"] == 1
+
+
+@mock.patch.dict(os.environ, dict(DYNAMO_TABLE_NAME=TABLE_NAME_FOR_TESTING))
+@mock_dynamodb
+def test_off_emits_nothing():
+    create_table_with_test_data()
+    assert run_handler("off", 2) == []
+
+
+def test_off_returns_the_handler_untouched():
+    def handler(event, context):
+        return event
+
+    assert instrumented(handler, mode="off") is handler
+    assert instrumented(mode="off")(handler) is handler
+
+
+def test_current_outside_invocation_is_null():
+    @instrumented(mode="record")
+    def inner():
+        return instrumentation.current()
+
+    with mock.patch.object(instrumentation, "logger", JsonLogger(stream=StringIO())):
+        assert inner() is not NULL_INVOCATION
+    assert instrumentation.current() is NULL_INVOCATION
@@ -0,0 +1,169 @@
+import os
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_dynamodb
+
+from src.authorizer.authorizer import invalidation
+from src.authorizer.authorizer.credential_cache import CredentialCache
+from src.authorizer.authorizer.invalidation import (
+    INVALIDATIONS,
+    DynamoChannel,
+    InvalidationPoller,
+    MemoryChannel,
+    build_channel,
+    changed_client_ids,
+    stream_handler,
+)
+from src.authorizer.authorizer.resources import DYNAMODB, resource_holder
+from src.authorizer.authorizer.types import DynamoModel
+
+from .helpers import root_path
+
+
+def record(client_id: str) -> DynamoModel:
+    return DynamoModel(
+        Client_ID=client_id,
+        Username="user",
+        Password="pass",
+        allow_connect=True,
+        allow_read=False,
+        allow_write=False,
+        read_topic="r",
+        write_topic="w",
+    )
+
+
+def stream_event(*changes) -> dict:
+    return dict(
+        Records=[
+            dict(eventName=name, dynamodb=dict(Keys=dict(Client_ID=dict(S=client_id))))
+            for name, client_id in changes
+        ]
+    )
+
+
+@pytest.fixture
+def channel():
+    channel = MemoryChannel()
+    resource_holder.register(INVALIDATIONS, lambda: channel, depends_on=(DYNAMODB,))
+    yield channel
+    resource_holder.register(INVALIDATIONS, build_channel, depends_on=(DYNAMODB,))
+
+
+@pytest.fixture
+def cache():
+    cache = CredentialCache(ttl=3600, negative_ttl=3600, maxsize=100)
+    for client_id in ("a", "b", "c"):
+        cache.put(client_id, record(client_id))
+    cache.put_missing("new")
+    return cache
+
+
+def test_changed_client_ids():
+    event = stream_event(
+        ("MODIFY", "a"), ("REMOVE", "b"), ("INSERT", "c"), ("MODIFY", "a")
+    )
+    event["Records"].append(dict(eventName="MODIFY", dynamodb=dict(Keys=dict())))
+    assert changed_client_ids(event) == ["a", "b", "c"]
+
+
+def test_stream_to_cache(channel, cache):
+    poller = InvalidationPoller(interval=0, cache=cache, enabled=True)
+    assert stream_handler(
+        stream_event(("REMOVE", "a"), ("INSERT", "new")), None
+    ) == dict(published=2)
+    assert poller.poll() == 2
+    assert cache.get("a") is None
+    assert cache.get("new") is None  # No longer remembered as unknown
+    assert cache.get("b") is not None
+
+
+def test_poll_rate_is_bounded(channel, cache):
+    poller = InvalidationPoller(interval=60, cache=cache, enabled=True)
+    channel.publish(["a"])
+    for _ in range(100):
+        poller.maybe_poll()
+    assert channel.reads == 1
+    assert cache.get("a") is None
+    channel.publish(["b"])
+    poller.maybe_poll()
+    assert cache.get("b") is not None  # Waits for the next interval
+
+
+def test_markers_outside_the_lag_window_are_not_reread(channel, cache):
+    poller = InvalidationPoller(interval=0, lag=0, cache=cache, enabled=True)
+    channel.publish(["a"])
+    assert poller.poll() == 1
+    assert poller.poll() == 0
+
+
+def test_incomplete_channel_fails_when_created():
+    class PublishOnly(invalidation.InvalidationChannel):
+        def publish(self, client_ids):
+            return 0
+
+    with pytest.raises(TypeError):
+        PublishOnly()
+
+
+def test_failing_channel_never_raises(cache):
+    broken = mock.Mock(read_since=mock.Mock(side_effect=RuntimeError("down")))
+    poller = InvalidationPoller(broken, interval=60, cache=cache, enabled=True)
+    assert poller.poll() == 0
+    poller.maybe_poll()
+    assert broken.read_since.call_count == 1
+
+
+def test_disabled_poller_does_nothing(channel, cache):
+    channel.publish(["a"])
+    InvalidationPoller(cache=cache, enabled=False).maybe_poll()
+    assert channel.reads == 0
+
+
+@mock.patch.dict(os.environ, dict(AWS_DEFAULT_REGION="ap-southeast-2"))
+@mock_dynamodb
+def test_dynamo_channel_round_trip():
+    from cfn_tools import load_yaml
+
+    with open(root_path / "template.yaml") as fp:
+        properties = load_yaml(fp)["Resources"]["InvalidationTable"]["Properties"]
+    client = boto3.client("dynamodb")
+    client.create_table(
+        TableName="Invalidations",
+        KeySchema=properties["KeySchema"],
+        AttributeDefinitions=properties["AttributeDefinitions"],
+        BillingMode=properties["BillingMode"],
+    )
+    channel = DynamoChannel(client, "Invalidations")
+    cursor = invalidation.marker_seq(0)
+    assert channel.publish([f"device-{i}" for i in range(60)]) == 60
+    markers = channel.read_since(cursor)
+    assert sorted(markers.client_ids) == sorted(f"device-{i}" for i in range(60))
+    assert markers.resume_after is None
+    assert channel.read_since(invalidation.marker_seq(2**62)).client_ids == []
+
+
+def test_poll_resumes_after_the_last_page(cache):
+    seqs = [invalidation.marker_seq(n, f"device-{n}") for n in range(1, 4)]
+    pages = [
+        dict(
+            Items=[dict(Client_ID=dict(S=f"device-{n}"))],
+            LastEvaluatedKey=dict(Channel=dict(S="credentials"), Seq=dict(S=seq)),
+        )
+        for n, seq in enumerate(seqs, 1)
+    ]
+    client = mock.Mock()
+    client.query.side_effect = pages[:2] + [dict(Items=pages[2]["Items"])]
+    poller = InvalidationPoller(
+        DynamoChannel(client, "Invalidations"), interval=60, cache=cache, enabled=True
+    )
+    with mock.patch.object(invalidation, "INVALIDATION_MAX_PAGES", 2):
+        assert poller.poll() == 2
+        assert poller.cursor == seqs[1]
+        assert poller.due()  # The rest is read straight away, not an interval later
+        assert poller.poll() == 1
+    resumed = client.query.call_args_list[2].kwargs
+    assert resumed["ExpressionAttributeValues"][":cursor"] == dict(S=seqs[1])
+    assert not poller.due()
@@ -0,0 +1,80 @@
+import os
+from base64 import b64encode
+from copy import deepcopy
+from io import StringIO
+from json import loads
+from unittest import mock
+
+from moto import mock_dynamodb
+
+from src.authorizer.authorizer import app, core
+from src.authorizer.authorizer.log import REDACTED, JsonLogger, redact
+
+from .helpers import (
+    PASSWORD_FOR_TESTING,
+    TABLE_NAME_FOR_TESTING,
+    create_table_with_test_data,
+    mqtt_auth,
+)
+
+
+def lines(stream: StringIO) -> list:
+    return [loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_redact_nested():
+    value = dict(a=1, Password="x", nested=[dict(token="y", ok="z")])
+    assert redact(value) == dict(
+        a=1, Password=REDACTED, nested=[dict(token=REDACTED, ok="z")]
+    )
+
+
+def test_level_and_sampling():
+    stream = StringIO()
+    log = JsonLogger(level="INFO", sample_rate=0, stream=stream)
+    log.debug("dropped, below level")
+    log.info("dropped, sampled out")
+    log.warning("kept", password="hunter2")
+    assert lines(stream) == [dict(level="WARNING", message="kept", password=REDACTED)]
+
+
+def test_emf_metrics():
+    stream = StringIO()
+    log = JsonLogger(metrics_format="emf", namespace="Test", stream=stream)
+    log.metrics(
+        dict(Authenticated=1, Latency=2.5),
+        units=dict(Latency="Milliseconds"),
+        dimensions=dict(Function="auth"),
+    )
+    (record,) = lines(stream)
+    (directive,) = record["_aws"]["CloudWatchMetrics"]
+    assert directive["Namespace"] == "Test"
+    assert directive["Dimensions"] == [["Function"]]
+    assert directive["Metrics"] == [
+        dict(Name="Authenticated", Unit="Count"),
+        dict(Name="Latency", Unit="Milliseconds"),
+    ]
+    assert record["Function"] == "auth"
+    assert record["Latency"] == 2.5
+
+
+def test_metrics_off():
+    stream = StringIO()
+    JsonLogger(metrics_format="off", stream=stream).metrics(dict(Authenticated=1))
+    assert stream.getvalue() == ""
+
+
+@mock.patch.dict(os.environ, dict(DYNAMO_TABLE_NAME=TABLE_NAME_FOR_TESTING))
+@mock_dynamodb
+def test_handler_never_logs_password():
+    create_table_with_test_data()
+    event = deepcopy(mqtt_auth)
+    event["protocolData"]["mqtt"]["password"] = b64encode(
+        PASSWORD_FOR_TESTING.encode("utf-8")
+    ).decode("utf-8")
+    stream = StringIO()
+    debug_logger = JsonLogger(level="DEBUG", metrics_format="emf", stream=stream)
+    with mock.patch.object(core, "logger", debug_logger):
+        assert app.lambda_handler(event, None)["isAuthenticated"] is True
+    assert len(lines(stream)) == 3
+    assert PASSWORD_FOR_TESTING not in stream.getvalue()
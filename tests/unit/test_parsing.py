@@ -0,0 +1,98 @@
+from copy import deepcopy
+from unittest import mock
+
+import pytest
+from pydantic import ValidationError
+
+from src.authorizer.authorizer import parsing
+from src.authorizer.authorizer.parsing import (
+    InvalidRequest,
+    parse_event,
+    parse_lean,
+    parse_strict,
+)
+
+from .helpers import event_path, load_json
+
+input_data = [
+    load_json(event_path / "mqtt_auth_no_verify.json"),
+    load_json(event_path / "mqtt_auth_verify.json"),
+]
+
+
+@pytest.mark.parametrize("data", input_data)
+def test_lean_matches_strict(data: dict):
+    assert parse_lean(data) == parse_strict(data)
+
+
+@pytest.mark.parametrize("data", input_data)
+def test_authorizer_name_stripped(data: dict):
+    event = deepcopy(data)
+    event["protocolData"]["mqtt"]["username"] += "?x-amz-customauthorizer-name=auth"
+    assert parse_lean(event).mqtt.username == "USER_NAME"
+    assert parse_strict(event).mqtt.username == "USER_NAME"
+
+
+def _mutations():
+    def protocols(value):
+        def mutate(event):
+            event["protocols"] = value
+
+        return mutate
+
+    def drop(*path):
+        def mutate(event):
+            for key in path[:-1]:
+                event = event[key]
+            del event[path[-1]]
+
+        return mutate
+
+    def set_(key, value):
+        def mutate(event):
+            event[key] = value
+
+        return mutate
+
+    return [
+        protocols([]),
+        protocols([{}]),
+        protocols([["mqtt"]]),
+        protocols(["http"]),
+        protocols(["mqtt", "http"]),
+        drop("protocols"),
+        drop("connectionMetadata"),
+        drop("protocolData", "mqtt"),
+        drop("protocolData", "mqtt", "clientId"),
+        drop("protocolData", "mqtt", "password"),
+        set_("signatureVerified", {}),
+        set_("token", ["a.b.c"]),
+    ]
+
+
+@pytest.mark.parametrize("data", input_data)
+@pytest.mark.parametrize("mutate", _mutations())
+def test_same_rejections(data: dict, mutate):
+    event = deepcopy(data)
+    mutate(event)
+    with pytest.raises(InvalidRequest):
+        parse_lean(event)
+    with pytest.raises(ValidationError):
+        parse_strict(event)
+
+
+def test_signature_verified_must_be_a_bool():
+    event = deepcopy(input_data[1])
+    event["signatureVerified"] = "false"
+    assert parse_strict(event).signatureVerified is False
+    with pytest.raises(InvalidRequest):  # Not taken as verified either way
+        parse_lean(event)
+
+
+@pytest.mark.parametrize("data", input_data)
+def test_strict_setting(data: dict):
+    with mock.patch.object(parsing, "STRICT_INPUT_VALIDATION", True), mock.patch.object(
+        parsing, "parse_strict", wraps=parse_strict
+    ) as strict:
+        parse_event(data)
+    assert strict.call_count == 1
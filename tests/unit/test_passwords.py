@@ -0,0 +1,98 @@
+import os
+from base64 import b64encode
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_dynamodb
+
+from src.authorizer.authorizer import passwords
+from src.authorizer.authorizer.core import check_password
+from src.authorizer.authorizer.parsing import MQTTDetails
+from src.authorizer.authorizer.passwords import (
+    VerifiedMemo,
+    hash_password,
+    is_hashed,
+    migrate_table,
+    verify_password,
+)
+from src.authorizer.authorizer.types import DynamoModel
+
+from .helpers import (
+    CLIENT_ID_FOR_TESTING,
+    PASSWORD_FOR_TESTING,
+    TABLE_NAME_FOR_TESTING,
+    create_table_with_test_data,
+)
+
+
+@pytest.fixture(autouse=True)
+def cheap_kdf():
+    # Real work factors make the test suite crawl
+    with mock.patch.multiple(passwords, PBKDF2_ITERATIONS=1000, SCRYPT_N=2**10):
+        yield
+
+
+@pytest.mark.parametrize("scheme", ["pbkdf2_sha256", "scrypt"])
+def test_round_trip(scheme):
+    stored = hash_password("hunter2", scheme)
+    assert stored.startswith(scheme + "$")
+    assert is_hashed(stored)
+    assert verify_password(stored, b"hunter2")
+    assert not verify_password(stored, b"hunter3")
+    assert hash_password("hunter2", scheme) != stored  # salted
+
+
+def test_plaintext_switch():
+    assert verify_password("hunter2", b"hunter2")
+    with mock.patch.object(passwords, "ALLOW_PLAINTEXT_PASSWORDS", False):
+        assert not verify_password("hunter2", b"hunter2")
+
+
+def test_malformed_hash_never_matches():
+    assert not verify_password("pbkdf2_sha256$nope", b"nope")
+
+
+def test_memo_skips_kdf():
+    memo = VerifiedMemo(ttl=60, maxsize=10)
+    stored = hash_password("hunter2")
+    with mock.patch.object(
+        passwords, "verify_password", wraps=verify_password
+    ) as verify:
+        assert memo.verify("client", stored, b"hunter2")
+        assert memo.verify("client", stored, b"hunter2")
+        assert not memo.verify("client", stored, b"wrong")
+        # A rotated password isn't covered by the old entry
+        assert memo.verify("client", hash_password("hunter2"), b"hunter2")
+    assert verify.call_count == 3
+
+
+def test_check_password_with_hash():
+    record = DynamoModel(
+        Client_ID="c",
+        Username="u",
+        Password=hash_password("p"),
+        read_topic="r",
+        write_topic="w",
+        allow_read=True,
+        allow_write=True,
+        allow_connect=True,
+    )
+
+    def creds(username: str, password: str) -> MQTTDetails:
+        return MQTTDetails(username, b64encode(password.encode()).decode(), "c")
+
+    assert check_password(record, creds("u", "p"))
+    assert not check_password(record, creds("u", "nope"))
+    assert not check_password(record, creds("nope", "p"))
+
+
+@mock.patch.dict(os.environ, dict(DYNAMO_TABLE_NAME=TABLE_NAME_FOR_TESTING))
+@mock_dynamodb
+def test_migrate_table():
+    create_table_with_test_data()
+    table = boto3.resource("dynamodb").Table(TABLE_NAME_FOR_TESTING)
+    assert migrate_table(table) == 1
+    assert migrate_table(table) == 0  # already hashed, nothing to do
+    stored = table.get_item(Key=dict(Client_ID=CLIENT_ID_FOR_TESTING))["Item"]
+    assert verify_password(stored["Password"], PASSWORD_FOR_TESTING.encode())
@@ -0,0 +1,177 @@
+import json
+import re
+from itertools import product
+from unittest import mock
+
+import pytest
+
+from benchmarks.reference_policy import generate_policy
+from src.authorizer.authorizer.policy import (
+    POLICY_DOCUMENT_MAX_CHARS,
+    RESOURCE_KINDS,
+    compile_statements,
+    format_principal,
+    render_policy,
+)
+from src.authorizer.authorizer.records import CachedCredential
+from src.authorizer.authorizer.types import DynamoModel, PolicyDocument
+
+TOPIC_SETS = [
+    ("topic/read/*", "topic/write"),
+    (["a/+/status", "b/#", "a/+/status"], ["a/out", "${iot:ClientId}/out"]),
+    (["shared/${iot:ClientId}"], ["shared/${iot:ClientId}"]),
+]
+
+
+def make_record(
+    allow_connect: bool,
+    allow_read: bool,
+    allow_write: bool,
+    topics=TOPIC_SETS[0],
+    client_id="CLIENT_NAME",
+):
+    read_topic, write_topic = topics
+    return DynamoModel(
+        Client_ID=client_id,
+        Password="PASS_WORD",
+        Username="USER_NAME",
+        allow_read=allow_read,
+        read_topic=read_topic,
+        allow_connect=allow_connect,
+        allow_write=allow_write,
+        write_topic=write_topic,
+    )
+
+
+def without_principal(policy: dict) -> dict:
+    return {
+        k: v for k, v in policy.items() if k not in ("principalId", "policyDocuments")
+    }
+
+
+def as_list(value):
+    return [value] if isinstance(value, str) else value
+
+
+def effective_grants(policy: dict) -> set:
+    # Packing puts actions next to resources they don't apply to, those pairs mean nothing
+    grants = set()
+    for document in policy["policyDocuments"]:
+        for statement in document["Statement"]:
+            for action in as_list(statement["Action"]):
+                for resource in as_list(statement["Resource"]):
+                    kind = resource.split(":", 5)[5].split("/", 1)[0]
+                    if kind == RESOURCE_KINDS[action]:
+                        grants.add((statement["Effect"], action, resource))
+    return grants
+
+
+def statements(policy: dict) -> list:
+    return [s for d in policy["policyDocuments"] for s in d["Statement"]]
+
+
+@pytest.mark.parametrize("topics", TOPIC_SETS)
+@pytest.mark.parametrize("flags", list(product([True, False], repeat=3)))
+@pytest.mark.parametrize("authenticated", [True, False])
+def test_matches_pydantic_path(topics, flags, authenticated):
+    record = make_record(*flags, topics=topics)
+    expected = generate_policy(record, authenticated, record.Client_ID).dict()
+    rendered = render_policy(record, authenticated, record.Client_ID)
+    assert without_principal(rendered) == without_principal(expected)
+    assert effective_grants(rendered) == effective_grants(expected)
+    PolicyDocument(**rendered)  # Check that type matches
+
+
+def test_unknown_client_denied():
+    rendered = render_policy(None, False, "BadClientId")
+    assert rendered["isAuthenticated"] is False
+    assert rendered["password"] is None
+    assert rendered["policyDocuments"][0]["Statement"] == []
+
+
+def test_template_compiled_once():
+    compile_statements.cache_clear()
+    record = make_record(True, True, True)
+    first = render_policy(record, True, record.Client_ID)
+    second = render_policy(record, True, record.Client_ID)
+    assert first["policyDocuments"] is second["policyDocuments"]
+    assert first["principalId"] == second["principalId"]
+    assert compile_statements.cache_info().misses == 1
+
+
+def test_principal_is_stable_and_valid():
+    assert format_principal("device-1") == format_principal("device-1")
+    # Ids that only differ in characters a principal can't hold stay apart
+    assert format_principal("device-1") != format_principal("device_1")
+    for client_id in ("device-1", "a" * 300, "$aws/#+", ""):
+        principal = format_principal(client_id)
+        assert re.fullmatch("[a-zA-Z0-9]{1,128}", principal), principal
+    assert format_principal("device-1").startswith("device1")
+
+
+def test_statements_are_packed():
+    record = make_record(True, True, True, topics=TOPIC_SETS[1])
+    rendered = render_policy(record, True, record.Client_ID)
+    # Connect, Subscribe and Receive share one, Publish can't join Receive on topic/
+    assert len(statements(rendered)) == 2
+    same_topics = make_record(True, True, True, topics=TOPIC_SETS[2])
+    assert len(statements(render_policy(same_topics, True, "CLIENT_NAME"))) == 1
+
+
+def test_topic_lists_and_variables():
+    record = make_record(False, True, True, topics=TOPIC_SETS[1])
+    grants = {r for _, _, r in effective_grants(render_policy(record, True, "x"))}
+    resources = {r.split(":", 5)[5] for r in grants}
+    assert resources == {
+        "topicfilter/a/+/status",
+        "topicfilter/b/#",
+        "topic/a/*/status",  # Receive sees topics, not filters
+        "topic/b/*",
+        "topic/a/out",
+        "topic/CLIENT_NAME/out",
+    }
+
+
+@pytest.mark.parametrize("client_id", ["*", "a/b", "dev+", "dev#", "dev?"])
+def test_unsafe_client_ids_are_not_substituted(client_id):
+    record = make_record(True, True, True, TOPIC_SETS[1], client_id=client_id)
+    grants = effective_grants(render_policy(record, True, client_id))
+    published = {r.split(":", 5)[5] for _, a, r in grants if a == "iot:Publish"}
+    # The ${iot:ClientId} topic is dropped rather than widened, the rest still applies
+    assert published == {"topic/a/out"}
+
+
+def test_large_policies_are_split_across_documents():
+    topics = [f"fleet/{i:04d}/telemetry/with/a/long/path" for i in range(40)]
+    record = make_record(True, True, True, topics=(topics, topics))
+    rendered = render_policy(record, True, record.Client_ID)
+    assert rendered["isAuthenticated"] is True
+    assert len(rendered["policyDocuments"]) > 1
+    for document in rendered["policyDocuments"]:
+        assert (
+            len(json.dumps(document, separators=(",", ":")))
+            <= POLICY_DOCUMENT_MAX_CHARS
+        )
+    expected = generate_policy(record, True, record.Client_ID).dict()
+    assert effective_grants(rendered) == effective_grants(expected)
+
+
+def test_too_large_policy_is_denied():
+    topics = [f"fleet/{i:05d}/telemetry/with/a/long/path" for i in range(2000)]
+    record = make_record(True, True, True, topics=(topics, topics))
+    rendered = render_policy(record, True, record.Client_ID)
+    assert rendered["isAuthenticated"] is False
+    assert rendered["password"] is None
+    assert statements(rendered) == []
+
+
+def test_topic_lists_in_cached_records():
+    record = make_record(True, True, True, topics=({"b", "a"}, ("c",)))
+    assert record.read_topic == ["a", "b"] and record.write_topic == ["c"]
+    cached = CachedCredential.from_model(record)
+    assert cached.read_topic == ("a", "b")
+    assert cached.to_model() == record
+    assert render_policy(cached, True, "CLIENT_NAME") == {
+        **render_policy(record, True, "CLIENT_NAME"),
+        "principalId": mock.ANY,
+    }
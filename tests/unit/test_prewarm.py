@@ -0,0 +1,129 @@
+import json
+from time import time, time_ns
+from unittest import mock
+
+import boto3
+from moto import mock_dynamodb
+
+from src.authorizer.authorizer import invalidation, prewarm
+from src.authorizer.authorizer.credential_cache import CredentialCache, credential_cache
+from src.authorizer.authorizer.invalidation import InvalidationPoller, MemoryChannel
+from src.authorizer.authorizer.prewarm import (
+    Budget,
+    load_snapshot,
+    prewarm_cache,
+    scan_table,
+    write_snapshot,
+)
+from src.authorizer.authorizer.resources import ClientTable
+
+from .helpers import load_table_from_yml
+
+
+def device(i: int) -> dict:
+    return dict(
+        Client_ID=f"device-{i}",
+        Username=f"user-{i}",
+        Password=f"pass-{i}",
+        allow_connect=True,
+        allow_read=True,
+        allow_write=False,
+        read_topic=f"fleet/{i}/*",
+        write_topic=f"fleet/{i}/out",
+    )
+
+
+def big_budget() -> Budget:
+    return Budget(seconds=60, max_bytes=1e9, max_entries=10**6)
+
+
+def write_file(path, rows):
+    with open(path, "w") as fp:
+        fp.writelines(json.dumps(row) + "\n" for row in rows)
+
+
+def test_snapshot_fills_cache(tmp_path):
+    write_file(tmp_path / "snap.jsonl", [device(i) for i in range(50)] + [dict(x=1)])
+    report = load_snapshot(tmp_path / "snap.jsonl", big_budget())
+    assert report.loaded == 50 and report.stopped_by is None
+    assert credential_cache.get("device-49").Username == "user-49"
+
+
+def test_budgets_stop_loading(tmp_path):
+    write_file(tmp_path / "snap.jsonl", [device(i) for i in range(50)])
+    by_entries = load_snapshot(tmp_path / "snap.jsonl", Budget(60, 1e9, 10))
+    assert by_entries.loaded == 10 and by_entries.stopped_by == "entries"
+    by_memory = load_snapshot(tmp_path / "snap.jsonl", Budget(60, 1, 10**6))
+    assert by_memory.loaded == 1 and by_memory.stopped_by == "memory"
+    by_time = load_snapshot(tmp_path / "snap.jsonl", Budget(0, 1e9, 10**6))
+    assert by_time.loaded == 0 and by_time.stopped_by == "time"
+
+
+def test_failed_prewarm_is_not_fatal(tmp_path):
+    assert prewarm_cache(mode="snapshot") is None  # no packaged snapshot here
+
+
+@mock_dynamodb
+def test_segmented_scan_and_snapshot_round_trip(tmp_path):
+    table = boto3.resource("dynamodb").create_table(**load_table_from_yml())
+    with table.batch_writer() as batch:
+        for i in range(120):
+            batch.put_item(Item=device(i))
+
+    # moto ignores Segment and hands every segment the whole table, so only the cache
+    # contents are exact here
+    scanned = mock.Mock(wraps=table)
+    report = scan_table(scanned, segments=3, budget=big_budget())
+    assert report.loaded >= 120 and len(credential_cache) == 120
+    segments = {call.kwargs["Segment"] for call in scanned.scan.call_args_list}
+    assert segments == {0, 1, 2}
+
+    credential_cache.clear()
+    client_table = ClientTable(boto3.client("dynamodb"), table.name)
+    scan_table(client_table, segments=2, budget=big_budget())
+    assert len(credential_cache) == 120
+
+    assert write_snapshot(table, tmp_path / "snap.jsonl") == 120
+    credential_cache.clear()
+    assert load_snapshot(tmp_path / "snap.jsonl", big_budget()).loaded == 120
+
+
+@mock_dynamodb
+def test_snapshot_keeps_string_sets(tmp_path):
+    table = boto3.resource("dynamodb").create_table(**load_table_from_yml())
+    table.put_item(Item=dict(device(1), read_topic={"b/2", "a/1"}))
+    write_snapshot(table, tmp_path / "snap.jsonl")
+    load_snapshot(tmp_path / "snap.jsonl", big_budget())
+    assert credential_cache.get("device-1").read_topic == ("a/1", "b/2")
+
+
+def test_snapshot_older_than_a_revocation(tmp_path):
+    # Taken 100s ago, the device was revoked 50s ago, before this container started
+    taken = time() - 100
+    write_file(
+        tmp_path / "snap.jsonl", [{prewarm.CREATED_AT: taken}, device(1), device(2)]
+    )
+    channel = MemoryChannel()
+    channel.markers.append(
+        (invalidation.marker_seq(time_ns() - 50 * 10**9, "device-1"), "device-1")
+    )
+    cache = CredentialCache(ttl=900)
+    poller = InvalidationPoller(channel, interval=0, lag=0, cache=cache, enabled=True)
+    with mock.patch.object(prewarm, "invalidations", poller), mock.patch.object(
+        prewarm, "credential_cache", cache
+    ), mock.patch.object(prewarm, "PREWARM_SNAPSHOT_MAX_AGE_SECONDS", 900):
+        assert load_snapshot(tmp_path / "snap.jsonl", big_budget()).loaded == 2
+    assert poller.poll() == 1
+    assert cache.get("device-1") is None
+    # What's left expires a TTL after the snapshot was taken, not after it was loaded
+    _, fetched = cache._found["device-2"]
+    assert fetched <= prewarm.monotonic() - 100
+
+
+def test_snapshot_too_old_is_refused(tmp_path):
+    write_file(tmp_path / "snap.jsonl", [{prewarm.CREATED_AT: 0}, device(1)])
+    with mock.patch.object(
+        prewarm, "PREWARM_SNAPSHOT_PATH", str(tmp_path / "snap.jsonl")
+    ):
+        assert prewarm_cache(mode="snapshot") is None
+    assert credential_cache.get("device-1") is None
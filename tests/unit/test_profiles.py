@@ -0,0 +1,157 @@
+import json
+from base64 import b64encode
+from typing import Any, Dict, Optional
+
+import pytest
+
+from benchmarks.reference_policy import generate_policy
+from src.authorizer.authorizer.backends import (
+    CredentialBackend,
+    SQLiteBackend,
+    build_sqlite,
+)
+from src.authorizer.authorizer.core import check_password, lookup_client
+from src.authorizer.authorizer.credential_cache import credential_cache
+from src.authorizer.authorizer.invalidation import InvalidationPoller, MemoryChannel
+from src.authorizer.authorizer.parsing import MQTTDetails
+from src.authorizer.authorizer.policy import render_policy
+from src.authorizer.authorizer.profiles import profile_key
+from src.authorizer.authorizer.provision import load_records, to_item
+from src.authorizer.authorizer.records import CachedCredential
+from src.authorizer.authorizer.resources import resource_holder
+from src.authorizer.authorizer.types import DynamoModel, PolicyProfileModel
+
+SENSOR = PolicyProfileModel(
+    Name="sensor",
+    allow_connect=True,
+    allow_read=True,
+    allow_write=True,
+    read_topic="cmd/${iot:ClientId}/#",
+    write_topic=["telemetry/${iot:ClientId}", "status/${iot:ClientId}"],
+)
+
+
+def device(i: int, profile: str = "sensor") -> DynamoModel:
+    return DynamoModel(
+        Client_ID=f"device-{i}", Username="user", Password="pass", profile=profile
+    )
+
+
+class FakeBackend(CredentialBackend):
+    def __init__(self, items: Dict[str, Dict[str, Any]]):
+        self.items = items
+        self.reads = []
+
+    def get_item(self, client_id: str) -> Optional[Dict[str, Any]]:
+        self.reads.append(client_id)
+        item = self.items.get(client_id)
+        if item is None:
+            return None
+        return {k: v for k, v in item.items() if k != "Client_ID"}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    items = {d.Client_ID: to_item(d) for d in (device(i) for i in range(5))}
+    items[profile_key("sensor")] = to_item(SENSOR)
+    items["device-lost"] = to_item(device(0, profile="gone"))
+    backend = FakeBackend(items)
+    monkeypatch.setattr(resource_holder, "call", lambda name, fn: fn(backend))
+    return backend
+
+
+def test_device_needs_permissions_or_profile():
+    with pytest.raises(ValueError):
+        DynamoModel(Client_ID="a", Username="u", Password="p")
+    assert device(1).allow_connect is None
+
+
+def test_profile_is_read_once_for_many_devices(backend):
+    for i in range(5):
+        record = lookup_client(f"device-{i}")
+        assert record.allow_write and record.write_topic == (
+            "telemetry/${iot:ClientId}",
+            "status/${iot:ClientId}",
+        )
+    assert backend.reads.count(profile_key("sensor")) == 1
+    # The cached device record is the bare one, the profile is applied per request
+    assert credential_cache.get("device-0").profile == "sensor"
+    assert credential_cache.get("device-0").flags == 0
+
+
+def test_profile_policy_matches_reference(backend):
+    record = lookup_client("device-3")
+    policy = render_policy(dynamoData=record, authenticated=True, client_id="device-3")
+    reference = generate_policy(
+        device(3), authenticated=True, client_id="device-3", profile=SENSOR
+    )
+    granted = json.dumps(policy["policyDocuments"])
+    assert "telemetry/device-3" in granted and "cmd/device-3/*" in granted
+    assert policy["isAuthenticated"] == reference.isAuthenticated
+    with pytest.raises(ValueError):
+        generate_policy(device(3), authenticated=True, client_id="device-3")
+
+
+def test_missing_profile_denies(backend):
+    with pytest.raises(KeyError):
+        lookup_client("device-lost")
+    with pytest.raises(KeyError):  # Cached as missing, no second read
+        lookup_client("device-lost")
+    assert backend.reads.count(profile_key("gone")) == 1
+
+
+def test_profile_is_not_a_client(backend):
+    with pytest.raises(KeyError):
+        lookup_client(profile_key("sensor"))
+    assert profile_key("sensor") not in backend.reads
+
+
+def test_profile_invalidation(backend):
+    lookup_client("device-1")
+    backend.items[profile_key("sensor")] = to_item(
+        PolicyProfileModel(Name="sensor", allow_connect=True)
+    )
+    channel = MemoryChannel()
+    poller = InvalidationPoller(channel=channel, interval=0, enabled=True)
+    channel.publish([profile_key("sensor")])
+    assert poller.poll() == 1
+    assert credential_cache.get("device-1") is not None  # devices stay cached
+    record = lookup_client("device-1")
+    assert record.allow_connect and not record.allow_write
+
+
+def test_sqlite_profiles(tmp_path):
+    path = tmp_path / "credentials.db"
+    assert build_sqlite([SENSOR, device(1), device(2)], path) == 3
+    backend = SQLiteBackend(path)
+    stored = backend.get_item(profile_key("sensor"))
+    assert PolicyProfileModel(**stored, Name="sensor") == SENSOR
+    assert DynamoModel(**backend.get_item("device-1"), Client_ID="device-1") == device(
+        1
+    )
+
+
+def test_provision_csv_with_profiles(tmp_path):
+    path = tmp_path / "devices.csv"
+    path.write_text(
+        "Client_ID,Username,Password,allow_connect,allow_read,allow_write,"
+        "read_topic,write_topic,profile\n"
+        "profile#sensor,,,true,false,true,,out/${iot:ClientId},\n"
+        "device-1,user,pass,,,,,,sensor\n"
+        "device-2,user,pass,true,true,false,in,out,\n"
+    )
+    profile, with_profile, plain = load_records(path)
+    assert to_item(profile)["Client_ID"] == "profile#sensor"
+    assert to_item(with_profile) == dict(
+        Client_ID="device-1", Username="user", Password="pass", profile="sensor"
+    )
+    assert plain.profile is None and plain.allow_read is True
+
+
+def test_check_password_ignores_profile(backend):
+    record = lookup_client("device-2")
+    assert isinstance(record, CachedCredential)
+    details = MQTTDetails(
+        username="user", password=b64encode(b"pass").decode(), clientId="device-2"
+    )
+    assert check_password(record, details)
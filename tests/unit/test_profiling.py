@@ -0,0 +1,81 @@
+import json
+import tracemalloc
+from unittest import mock
+
+import pytest
+
+from src.authorizer.authorizer import app, core, profiling
+from src.authorizer.authorizer.profiling import SampledProfiler, profiled
+
+from .helpers import mqtt_auth
+
+retained = []
+
+
+def work(n: int) -> int:
+    retained.append([object() for _ in range(n)])
+    return sum(range(n))
+
+
+def profile_lines(capsys):
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return [line for line in lines if line.get("message") == "profile"]
+
+
+def test_off_leaves_the_handler_alone():
+    assert not profiling.profiler.enabled
+    assert profiled(work) is work
+
+
+def test_samples_one_in_n_and_emits_top_functions(capsys):
+    profiler = SampledProfiler("cpu", sample_every=5, emit_every=2, top_n=3)
+    for _ in range(20):
+        assert profiler.call(work, 1000) == sum(range(1000))
+    lines = profile_lines(capsys)
+    assert len(lines) == 2  # 4 samples, emitted every 2
+    assert lines[0]["samples"] == 2 and lines[1]["invocations"] == 20
+    functions = lines[0]["functions"]
+    assert len(functions) == 3
+    assert any("work" in f["function"] for f in functions)
+    assert "allocations" not in lines[0]
+
+
+def test_memory_sites(capsys):
+    profiler = SampledProfiler("memory", sample_every=1, emit_every=3, top_n=5)
+    for _ in range(3):
+        profiler.call(work, 1000)
+    (line,) = profile_lines(capsys)
+    assert line["peak_kib"] > 0
+    assert any("test_profiling.py" in a["site"] for a in line["allocations"])
+    assert not tracemalloc.is_tracing()
+
+
+def test_existing_tracemalloc_is_left_running():
+    tracemalloc.start()
+    try:
+        profiler = SampledProfiler("both", sample_every=1, emit_every=100)
+        profiler.call(work, 10)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_errors_still_count_as_samples():
+    profiler = SampledProfiler("cpu", sample_every=1, emit_every=100)
+    with pytest.raises(ZeroDivisionError):
+        profiler.call(lambda: 1 / 0)
+    assert profiler.samples == 1
+    assert profiler.call(work, 10) == 45
+
+
+def test_handler_under_profiler(capsys):
+    profiler = SampledProfiler("both", sample_every=1, emit_every=1, top_n=50)
+    with mock.patch.object(core, "lookup_client", mock.Mock(side_effect=KeyError)):
+        profiler.call(app.lambda_handler, mqtt_auth, None)
+    (line,) = profile_lines(capsys)
+    assert any("parse_lean" in f["function"] for f in line["functions"])
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        SampledProfiler("sometimes")
@@ -0,0 +1,109 @@
+import csv
+import json
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_dynamodb
+
+from src.authorizer.authorizer import provision as provision_module
+from src.authorizer.authorizer.passwords import is_hashed
+from src.authorizer.authorizer.provision import (
+    InvalidRecords,
+    load_records,
+    provision,
+    write_chunk,
+)
+
+from .helpers import TABLE_NAME_FOR_TESTING, load_table_from_yml
+
+FIELDS = [
+    "Client_ID",
+    "Username",
+    "Password",
+    "allow_connect",
+    "allow_read",
+    "allow_write",
+    "read_topic",
+    "write_topic",
+]
+
+
+def device(i: int) -> dict:
+    return dict(
+        Client_ID=f"device-{i}",
+        Username=f"user-{i}",
+        Password=f"pass-{i}",
+        allow_connect="true",
+        allow_read="true",
+        allow_write="false",
+        read_topic=f"fleet/{i}/*",
+        write_topic=f"fleet/{i}/out",
+    )
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as fp:
+        writer = csv.DictWriter(fp, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_load_csv_and_jsonl(tmp_path):
+    write_csv(tmp_path / "devices.csv", [device(i) for i in range(3)])
+    with open(tmp_path / "devices.jsonl", "w") as fp:
+        fp.writelines(json.dumps(device(i)) + "\n" for i in range(3))
+    from_csv = load_records(tmp_path / "devices.csv")
+    assert from_csv == load_records(tmp_path / "devices.jsonl")
+    assert from_csv[0].allow_read is True and from_csv[0].allow_write is False
+
+
+def test_invalid_records_reported_with_line(tmp_path):
+    bad = device(1)
+    del bad["Password"]
+    with open(tmp_path / "devices.jsonl", "w") as fp:
+        fp.writelines(json.dumps(row) + "\n" for row in [device(0), bad])
+    with pytest.raises(InvalidRecords) as e:
+        load_records(tmp_path / "devices.jsonl")
+    assert e.value.errors[0][0] == 2
+
+
+def test_unprocessed_items_retried():
+    client = mock.Mock()
+    unprocessed = dict(UnprocessedItems={"t": [dict(PutRequest=dict(Item={}))]})
+    client.batch_write_item.side_effect = [unprocessed, unprocessed, {}]
+    with mock.patch.object(provision_module, "sleep"):
+        assert write_chunk(client, "t", [dict(Client_ID="a")]) == 2
+    assert (
+        client.batch_write_item.call_args.kwargs["RequestItems"]
+        == unprocessed["UnprocessedItems"]
+    )
+
+
+@mock_dynamodb
+def test_provision_and_resume(tmp_path):
+    dynamo = boto3.resource("dynamodb")
+    table = dynamo.create_table(**load_table_from_yml())
+    write_csv(tmp_path / "devices.csv", [device(i) for i in range(60)])
+    records = load_records(tmp_path / "devices.csv")
+    checkpoint = tmp_path / "devices.done"
+    checkpoint.write_text("0\n")  # pretend the first chunk made it before a crash
+
+    client = boto3.client("dynamodb")
+    report = provision(
+        records,
+        TABLE_NAME_FOR_TESTING,
+        client,
+        workers=2,
+        checkpoint=checkpoint,
+        hash_passwords=True,
+    )
+    assert report.written == 35 and report.skipped_chunks == 1
+    assert table.scan(Select="COUNT")["Count"] == 35
+    assert is_hashed(
+        table.get_item(Key=dict(Client_ID="device-59"))["Item"]["Password"]
+    )
+
+    # Running it again with the same checkpoint is a no-op
+    again = provision(records, TABLE_NAME_FOR_TESTING, client, checkpoint=checkpoint)
+    assert again.written == 0 and again.skipped_chunks == 3
@@ -0,0 +1,40 @@
+from itertools import product
+
+import pytest
+
+from src.authorizer.authorizer.policy import render_policy
+from src.authorizer.authorizer.records import CachedCredential
+from src.authorizer.authorizer.types import DynamoModel
+
+
+def make_model(allow_connect=True, allow_read=True, allow_write=False) -> DynamoModel:
+    return DynamoModel(
+        Client_ID="CLIENT_NAME",
+        Password="PASS_WORD",
+        Username="USER_NAME",
+        allow_connect=allow_connect,
+        allow_read=allow_read,
+        allow_write=allow_write,
+        read_topic="".join(["topic/", "read"]),
+        write_topic="".join(["topic/", "write"]),
+    )
+
+
+@pytest.mark.parametrize("flags", list(product([True, False], repeat=3)))
+def test_round_trip(flags):
+    model = make_model(*flags)
+    compact = CachedCredential.from_model(model)
+    assert (compact.allow_connect, compact.allow_read, compact.allow_write) == flags
+    assert compact.to_model() == model
+    policy = render_policy(compact, True, "CLIENT_NAME")
+    expected = render_policy(model, True, "CLIENT_NAME")
+    assert policy["policyDocuments"] == expected["policyDocuments"]
+
+
+def test_compact():
+    first = CachedCredential.from_model(make_model())
+    second = CachedCredential.from_model(make_model())
+    assert not hasattr(first, "__dict__")
+    assert first.read_topic is second.read_topic  # interned
+    assert first == second and hash(first) == hash(second)
+    assert "PASS_WORD" not in repr(first)
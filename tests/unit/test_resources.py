@@ -0,0 +1,121 @@
+import os
+from unittest import mock
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from moto import mock_dynamodb
+
+from src.authorizer.authorizer import core, resources
+from src.authorizer.authorizer.resources import (
+    ClientTable,
+    ResourceHolder,
+    build_resources,
+    dynamo_config,
+    warm_connection,
+)
+
+from .helpers import (
+    CLIENT_ID_FOR_TESTING,
+    TABLE_NAME_FOR_TESTING,
+    create_table_with_test_data,
+)
+
+
+def test_config_from_env():
+    with mock.patch.multiple(
+        resources,
+        DYNAMO_CONNECT_TIMEOUT=0.25,
+        DYNAMO_READ_TIMEOUT=0.75,
+        DYNAMO_MAX_ATTEMPTS=3,
+        DYNAMO_RETRY_MODE="adaptive",
+        DYNAMO_MAX_POOL_CONNECTIONS=4,
+    ):
+        config = dynamo_config()
+    assert config.connect_timeout == 0.25
+    assert config.read_timeout == 0.75
+    assert config.retries == dict(mode="adaptive", total_max_attempts=3)
+    assert config.max_pool_connections == 4
+
+
+@mock.patch.dict(os.environ, dict(DYNAMO_TABLE_NAME=TABLE_NAME_FOR_TESTING))
+@mock_dynamodb
+def test_client_matches_resource():
+    create_table_with_test_data()
+    _, table = build_resources()
+    with mock.patch.object(resources, "DYNAMO_USE_CLIENT", True):
+        _, client_table = build_resources()
+    assert isinstance(client_table, ClientTable)
+
+    key = dict(Client_ID=CLIENT_ID_FOR_TESTING)
+    assert client_table.get_item(Key=key)["Item"] == table.get_item(Key=key)["Item"]
+    assert "Item" not in client_table.get_item(Key=dict(Client_ID="BadClientId"))
+
+    from_client = core.get_details_for_client_id(CLIENT_ID_FOR_TESTING, client_table)
+    core.credential_cache.clear()
+    from_resource = core.get_details_for_client_id(CLIENT_ID_FOR_TESTING, table)
+    assert from_client == from_resource
+
+
+def test_prewarm_never_raises():
+    table = mock.Mock()
+    table.get_item.side_effect = RuntimeError("no network")
+    warm_connection(table)
+    assert table.get_item.call_count == 1
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError(dict(Error=dict(Code=code, Message=code)), "GetItem")
+
+
+def test_holder_builds_once():
+    factory = mock.Mock(side_effect=lambda: object())
+    holder = ResourceHolder()
+    holder.register("thing", factory)
+    assert holder.get("thing") is holder.get("thing")
+    assert factory.call_count == 1
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        client_error("ExpiredTokenException"),
+        EndpointConnectionError(endpoint_url="https://dynamodb"),
+    ],
+)
+def test_holder_rebuilds_on_broken_client(error):
+    factory = mock.Mock(side_effect=lambda: object())
+    holder = ResourceHolder()
+    holder.register("thing", factory)
+    first = holder.get("thing")
+    fn = mock.Mock(side_effect=[error, "ok"])
+    assert holder.call("thing", fn) == "ok"
+    assert factory.call_count == 2
+    assert fn.call_args_list[0].args[0] is first
+    assert fn.call_args_list[1].args[0] is not first
+
+
+@pytest.mark.parametrize(
+    "error", [client_error("ProvisionedThroughputExceededException"), KeyError("id")]
+)
+def test_holder_keeps_client_on_request_errors(error):
+    factory = mock.Mock(side_effect=lambda: object())
+    holder = ResourceHolder()
+    holder.register("thing", factory)
+    with pytest.raises(type(error)):
+        holder.call("thing", mock.Mock(side_effect=error))
+    holder.get("thing")
+    assert factory.call_count == 1
+
+
+def test_holder_rebuilds_dependencies():
+    holder = ResourceHolder()
+    client_factory = mock.Mock(side_effect=lambda: object())
+    holder.register("client", client_factory)
+    holder.register("backend", lambda: (holder.get("client"),), depends_on=("client",))
+    first_backend = holder.get("backend")
+    fn = mock.Mock(side_effect=[client_error("ExpiredToken"), "ok"])
+    assert holder.call("backend", fn) == "ok"
+    # The client under the backend was rebuilt, and the backend on top of it too
+    assert client_factory.call_count == 2
+    assert holder.get("backend") is not first_backend
+    assert holder.get("backend")[0] is holder.get("client")
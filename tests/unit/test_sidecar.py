@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.fake_table import FakeTable
+from src.authorizer.authorizer.async_core import AsyncAuthorizer
+from src.authorizer.authorizer.backends import DynamoBackend
+from src.authorizer.authorizer.core import get_details_for_client_id
+from src.authorizer.authorizer.sidecar import Sidecar
+
+from .helpers import ITEM, event
+
+
+async def request(port: int, method: str, path: str, body=None, close=True):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = b"" if body is None else json.dumps(body).encode()
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode() + payload
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    headers = {}
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode().partition(":")
+        headers[name.lower()] = value.strip()
+    body = json.loads(await reader.readexactly(int(headers["content-length"])))
+    writer.close()
+    return int(status_line.split()[1]), body
+
+
+@pytest.fixture
+def sidecar():
+    backend = DynamoBackend(FakeTable({"CLIENT": ITEM}))
+    authorizer = AsyncAuthorizer(lambda c: get_details_for_client_id(c, backend))
+    yield Sidecar(authorizer)
+    authorizer.close()
+
+
+def run_against(sidecar, *requests):
+    async def run():
+        server = await sidecar.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return [await request(port, *r) for r in requests]
+
+    return asyncio.run(run())
+
+
+def test_authorize_endpoint(sidecar):
+    (status, policy), (_, denied) = run_against(
+        sidecar,
+        ("POST", "/authorize", event()),
+        ("POST", "/authorize", event(password="nope")),
+    )
+    assert status == 200
+    assert policy["isAuthenticated"] is True
+    assert denied["isAuthenticated"] is False
+
+
+def test_mqtt_auth_endpoint(sidecar):
+    creds = dict(username="USER_NAME", password="PASS_WORD", clientid="CLIENT")
+    responses = run_against(
+        sidecar,
+        ("POST", "/mqtt/auth", creds),
+        ("POST", "/mqtt/auth", {**creds, "password": "nope"}),
+        ("POST", "/mqtt/auth", {**creds, "clientid": "nobody"}),
+    )
+    assert [status for status, _ in responses] == [200, 403, 403]
+
+
+def test_mqtt_auth_needs_connect():
+    item = dict(ITEM, allow_connect=False)
+    backend = DynamoBackend(FakeTable({"CLIENT": item}))
+    authorizer = AsyncAuthorizer(lambda c: get_details_for_client_id(c, backend))
+    creds = dict(username="USER_NAME", password="PASS_WORD", clientid="CLIENT")
+    try:
+        (status, body), (_, policy) = run_against(
+            Sidecar(authorizer),
+            ("POST", "/mqtt/auth", creds),
+            ("POST", "/authorize", event()),
+        )
+    finally:
+        authorizer.close()
+    assert policy["isAuthenticated"] is True  # Right password, no iot:Connect
+    assert status == 403 and body == dict(ok=False)
+
+
+def test_bad_requests(sidecar):
+    responses = run_against(
+        sidecar,
+        ("POST", "/authorize", {"protocols": []}),
+        ("POST", "/mqtt/auth", {"username": "USER_NAME"}),
+        ("GET", "/nowhere"),
+        ("GET", "/health"),
+    )
+    assert [status for status, _ in responses] == [400, 400, 404, 200]
+
+
+def test_endless_headers_are_cut_off(sidecar):
+    async def run():
+        server = await sidecar.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"POST /authorize HTTP/1.1\r\n")
+            try:
+                for n in range(10000):  # Never ends the headers
+                    writer.write(f"X-Header-{n}: {'a' * 50}\r\n".encode())
+                    await writer.drain()
+            except ConnectionError:
+                pass  # Answered and closed while we were still sending
+            status_line = await reader.readline()
+            writer.close()
+            return status_line
+
+    assert asyncio.run(run()).split()[1] == b"431"
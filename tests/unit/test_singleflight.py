@@ -0,0 +1,82 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from time import sleep
+
+import pytest
+
+from benchmarks.fake_table import FakeTable
+from src.authorizer.authorizer.core import get_details_for_client_id, lookups
+from src.authorizer.authorizer.singleflight import AsyncSingleFlight, SingleFlight
+
+from .helpers import ITEM
+
+N = 32
+
+
+def test_concurrent_misses_share_one_read():
+    table = FakeTable({"CLIENT": ITEM}, latency_ms=100)
+    barrier = Barrier(N)
+
+    def connect(_):
+        barrier.wait()
+        return get_details_for_client_id("CLIENT", table)
+
+    with ThreadPoolExecutor(max_workers=N) as pool:
+        results = list(pool.map(connect, range(N)))
+    assert table.reads == 1
+    assert all(r is results[0] for r in results)
+    assert lookups.in_flight() == 0
+
+
+def test_unknown_client_error_is_shared():
+    table = FakeTable({}, latency_ms=100)
+    barrier = Barrier(N)
+
+    def connect(_):
+        barrier.wait()
+        with pytest.raises(KeyError):
+            get_details_for_client_id("NOBODY", table)
+
+    with ThreadPoolExecutor(max_workers=N) as pool:
+        list(pool.map(connect, range(N)))
+    assert table.reads == 1
+
+
+def test_errors_reach_every_caller_and_are_not_remembered():
+    flight = SingleFlight()
+    barrier = Barrier(N)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        sleep(0.1)
+        raise RuntimeError("backend down")
+
+    def call(_):
+        barrier.wait()
+        with pytest.raises(RuntimeError):
+            flight.do("key", failing)
+
+    with ThreadPoolExecutor(max_workers=N) as pool:
+        list(pool.map(call, range(N)))
+    assert len(calls) == 1
+    # Once it has finished the next call runs again
+    assert flight.do("key", lambda: "recovered") == "recovered"
+
+
+def test_async_single_flight():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def read():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", read) for _ in range(N)))
+
+    assert asyncio.run(run()) == ["value"] * N
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
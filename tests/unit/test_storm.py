@@ -0,0 +1,61 @@
+import pytest
+
+from benchmarks.storm import histogram, run_storm, schedule
+from src.authorizer.authorizer.resources import (
+    DYNAMODB,
+    build_resources,
+    resource_holder,
+)
+
+
+@pytest.mark.parametrize("pattern", ["herd", "bursty", "churn"])
+def test_schedule(pattern):
+    arrivals = schedule(pattern, devices=10, connects=100, duration=0.5, seed=1)
+    assert len(arrivals) == 100
+    assert arrivals == sorted(arrivals)
+    assert arrivals[0][0] >= 0
+    assert {d for _, d in arrivals} <= set(range(10))
+
+
+def test_herd_reaches_every_device():
+    arrivals = schedule("herd", devices=50, connects=50, duration=0.1)
+    assert sorted(d for _, d in arrivals) == list(range(50))
+
+
+def test_histogram():
+    counts = histogram([0.5, 1, 1.5, 700, 5000])
+    assert counts["<=1ms"] == 2 and counts["<=2ms"] == 1
+    assert counts["<=1000ms"] == 1 and counts[">1000ms"] == 1
+
+
+@pytest.mark.parametrize("target", ["handler", "async"])
+def test_small_storm(target):
+    report = run_storm(
+        devices=20,
+        connects=100,
+        pattern="herd",
+        target=target,
+        duration=0.05,
+        workers=4,
+        latency_ms=1,
+        bad_password_ratio=0.1,
+    )
+    assert report["success_rate"] == 1
+    assert 0 < report["authenticated"] < 100
+    # Each device is read once, however many times it reconnects
+    assert report["table_reads"] == report["distinct_clients"] == 20
+    assert report["read_amplification"] == 1
+    assert sum(report["histogram"].values()) == 100
+    assert resource_holder._factories[DYNAMODB] is build_resources
+
+
+def test_throttled_backend_shows_as_errors():
+    report = run_storm(
+        devices=20, connects=40, duration=0.01, workers=2, throttle_ratio=1
+    )
+    assert report["success_rate"] == 0
+    assert report["table_throttled"] == report["table_reads"] > 0
+    warm = run_storm(
+        devices=20, connects=40, duration=0.01, workers=2, throttle_ratio=1, warm=True
+    )
+    assert warm["success_rate"] == 1 and warm["table_reads"] == 0
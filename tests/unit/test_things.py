@@ -1,39 +1,23 @@
 import os
-from base64 import b64decode, b64encode, standard_b64decode, standard_b64encode
+from base64 import b64encode
 from copy import copy
-from json import dumps, load, loads
-from pathlib import Path
-from uuid import uuid4
+from unittest import mock
 
-import boto3
 import pytest
-from cfn_tools import load_yaml
 from moto import mock_dynamodb
-from mypy_boto3_dynamodb import DynamoDBServiceResource
 from pydantic import ValidationError
 
 from src.authorizer.authorizer.app import lambda_handler as lambda_dynamic
-from src.authorizer.authorizer.types import AuthorizerInput, DynamoModel, PolicyDocument
-
-root_path = Path(__file__).parent.parent.parent
-
-event_path = root_path / "events"
-from unittest import mock
-
-TABLE_NAME_FOR_TESTING = "TestTablePleaseIgnore" + str(uuid4())
-CLIENT_ID_FOR_TESTING = "CLIENT_NAME"
-USERNAME_FOR_TESTING = "USER_NAME"
-PASSWORD_FOR_TESTING = "PASS_WORD"
-TOPIC_FOR_TESTING = "TestTopicPleaseIgnore" + str(uuid4())
-
-
-def load_json(file_path: Path) -> dict:
-    with open(file_path) as fp:
-        return load(fp)
+from src.authorizer.authorizer.types import AuthorizerInput, PolicyDocument
 
-
-mqtt_auth = load_json(event_path / "mqtt_auth_no_verify.json")
-mqtt_auth_verify = load_json(event_path / "mqtt_auth_verify.json")
+from .helpers import (
+    CLIENT_ID_FOR_TESTING,
+    TABLE_NAME_FOR_TESTING,
+    TOPIC_FOR_TESTING,
+    create_table_with_test_data,
+    mqtt_auth,
+    mqtt_auth_verify,
+)
 
 input_data = [mqtt_auth, mqtt_auth_verify]  # so I can parameterize with a list
 
@@ -57,38 +41,6 @@ def test_fail_types(data: dict):
         AuthorizerInput.parse_obj(d2)
 
 
-def load_table_from_yml() -> dict:
-    yaml_path = root_path / "template.yaml"
-    with open(yaml_path) as fp:
-        yaml_doc = load_yaml(fp)
-        table = yaml_doc["Resources"]["Table"]["Properties"]
-        table["TableName"] = TABLE_NAME_FOR_TESTING
-        return table
-
-
-@mock_dynamodb
-def create_table_with_test_data():
-    dynamo: DynamoDBServiceResource = boto3.resource(service_name="dynamodb")
-    table = dynamo.create_table(**load_table_from_yml())
-
-    table.put_item(
-        Item=DynamoModel(
-            **dict(
-                Client_ID=CLIENT_ID_FOR_TESTING,
-                Password=PASSWORD_FOR_TESTING,
-                Username=USERNAME_FOR_TESTING,
-                allow_read=True,
-                read_topic=TOPIC_FOR_TESTING,
-                allow_connect=True,
-                allow_write=True,
-                write_topic=TOPIC_FOR_TESTING,
-            )
-        ).dict()
-    )
-    assert table.scan()["Items"][0]["read_topic"] == TOPIC_FOR_TESTING
-    return table
-
-
 @mock_dynamodb
 def test_basic_gets():
     table = create_table_with_test_data()
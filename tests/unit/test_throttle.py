@@ -0,0 +1,152 @@
+import asyncio
+import os
+from base64 import b64encode
+from unittest import mock
+
+import boto3
+from moto import mock_dynamodb
+
+from src.authorizer.authorizer import core
+from src.authorizer.authorizer.async_core import AsyncAuthorizer
+from src.authorizer.authorizer.parsing import AuthorizerRequest, MQTTDetails
+from src.authorizer.authorizer.resources import resource_holder
+from src.authorizer.authorizer.throttle import (
+    THROTTLE_COUNTERS,
+    ConnectThrottle,
+    DynamoCounter,
+    TokenBuckets,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def request(client_id: str, username: str = "user") -> AuthorizerRequest:
+    return AuthorizerRequest(
+        mqtt=MQTTDetails(
+            username=username,
+            password=b64encode(b"pass").decode(),
+            clientId=client_id,
+        ),
+        signatureVerified=None,
+        token=None,
+    )
+
+
+def test_bucket_refills_at_rate():
+    clock = Clock()
+    buckets = TokenBuckets(rate=2, burst=3, timer=clock)
+    assert [buckets.take("a") for _ in range(4)] == [True, True, True, False]
+    assert buckets.take("b")  # Buckets are per key
+    clock.now += 0.5
+    assert buckets.take("a") and not buckets.take("a")
+    clock.now += 60
+    assert sum(buckets.take("a") for _ in range(10)) == 3  # Never past burst
+
+
+def test_buckets_are_bounded():
+    buckets = TokenBuckets(rate=1, burst=1, max_keys=100)
+    for i in range(10000):
+        buckets.take(f"spray-{i}")
+    assert len(buckets) == 100
+
+
+def test_disabled_buckets_allow_everything():
+    buckets = TokenBuckets(rate=0, burst=1)
+    assert all(buckets.take("a") for _ in range(100))
+    assert len(buckets) == 0
+
+
+def test_most_specific_limit_first():
+    clock = Clock()
+    throttle = ConnectThrottle(
+        client=TokenBuckets(1, 2, timer=clock),
+        source=TokenBuckets(1, 3, timer=clock),
+        global_=TokenBuckets(1, 100, timer=clock),
+        shared=False,
+    )
+    assert throttle.check("a", "user") is None
+    assert throttle.check("a", "user") is None
+    assert throttle.check("a", "user") == "client"
+    assert throttle.check("b", "user") is None
+    assert throttle.check("c", "user") == "source"  # Spraying client ids
+    assert throttle.check("c", "other") is None
+    assert throttle.check("d", None) is None  # No address, no source bucket
+
+
+def test_lambda_events_have_no_source():
+    source = TokenBuckets(1, 1)
+    throttle = ConnectThrottle(client=TokenBuckets(0, 1), source=source, shared=False)
+    lookup = mock.Mock(side_effect=KeyError)
+    with mock.patch.object(core, "throttle", throttle), mock.patch.object(
+        core, "lookup_client", lookup
+    ):
+        for n in range(5):  # One username, many client ids
+            core.authorize(request(f"device-{n}", username="fleet"))
+    assert lookup.call_count == 5 and len(source) == 0
+
+
+def test_throttled_connect_skips_lookup():
+    clock = Clock()
+    throttle = ConnectThrottle(client=TokenBuckets(1, 1, timer=clock), shared=False)
+    lookup = mock.Mock(side_effect=KeyError)
+    with mock.patch.object(core, "throttle", throttle), mock.patch.object(
+        core, "lookup_client", lookup
+    ):
+        assert core.authorize(request("loop"))["isAuthenticated"] is False
+        denied = core.authorize(request("loop"))
+    assert lookup.call_count == 1
+    assert denied["isAuthenticated"] is False and denied["password"] is None
+    assert denied["policyDocuments"][0]["Statement"] == []
+
+
+def test_async_front_end_is_throttled():
+    clock = Clock()
+    throttle = ConnectThrottle(client=TokenBuckets(1, 1, timer=clock), shared=False)
+    lookup = mock.Mock(side_effect=KeyError)
+    authorizer = AsyncAuthorizer(lookup)
+
+    async def connect_twice():
+        await authorizer.authorize(request("loop"))
+        return await authorizer.authorize(request("loop"))
+
+    try:
+        with mock.patch.object(core, "throttle", throttle):
+            assert asyncio.run(connect_twice())["isAuthenticated"] is False
+    finally:
+        authorizer.close()
+    assert lookup.call_count == 1
+
+
+@mock.patch.dict(os.environ, dict(AWS_DEFAULT_REGION="ap-southeast-2"))
+@mock_dynamodb
+def test_dynamo_counter():
+    client = boto3.client("dynamodb")
+    client.create_table(
+        TableName="Throttle",
+        KeySchema=[dict(AttributeName="Key", KeyType="HASH")],
+        AttributeDefinitions=[dict(AttributeName="Key", AttributeType="S")],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    counter = DynamoCounter(client, "Throttle", limit=3, window=3600)
+    assert [counter.take("a") for _ in range(4)] == [True, True, True, False]
+    assert counter.take("b")
+
+
+def test_shared_counter_fails_open():
+    broken = mock.Mock(take=mock.Mock(side_effect=RuntimeError("down")))
+    throttle = ConnectThrottle(shared=True)
+    with mock.patch.object(resource_holder, "call", lambda name, fn: fn(broken)):
+        assert throttle.check("a", "user") is None
+    counter = mock.Mock(take=mock.Mock(return_value=False))
+    with mock.patch.object(
+        resource_holder,
+        "call",
+        lambda name, fn: fn(counter) if name == THROTTLE_COUNTERS else None,
+    ):
+        assert throttle.check("a", "user") == "shared"
@@ -0,0 +1,214 @@
+import asyncio
+import json
+from base64 import b64encode
+from copy import deepcopy
+from time import time
+from unittest import mock
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+from benchmarks.fake_table import FakeTable
+from src.authorizer.authorizer import app, core, tokens
+from src.authorizer.authorizer.async_core import AsyncAuthorizer
+from src.authorizer.authorizer.backends import DynamoBackend
+from src.authorizer.authorizer.parsing import parse_event
+from src.authorizer.authorizer.tokens import (
+    InvalidToken,
+    TokenVerifier,
+    sign_token,
+)
+
+from .helpers import ITEM, mqtt_auth, mqtt_auth_verify
+from .helpers import event as table_event
+
+HMAC_KEY = b"0123456789abcdef0123456789abcdef"
+SIGNING_KEY = Ed25519PrivateKey.generate()
+PUBLIC_KEY = SIGNING_KEY.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+
+def claims(**overrides) -> dict:
+    return {
+        **dict(
+            sub="device-1",
+            exp=int(time()) + 3600,
+            read=["cmd/${iot:ClientId}/#"],
+            write="telemetry/${iot:ClientId}",
+        ),
+        **overrides,
+    }
+
+
+def event(client_id: str = "device-1", password: str = "", token=None) -> dict:
+    event = deepcopy(mqtt_auth)
+    event["protocolData"]["mqtt"] = dict(
+        username="anything",
+        password=b64encode(password.encode()).decode(),
+        clientId=client_id,
+    )
+    if token is not None:
+        event["token"] = token
+    return event
+
+
+@pytest.fixture(autouse=True)
+def keys():
+    environ = dict(
+        TOKEN_HMAC_KEYS=f"k1={b64encode(HMAC_KEY).decode()}",
+        TOKEN_ED25519_KEYS=f"ed={b64encode(PUBLIC_KEY).decode()}",
+    )
+    with mock.patch.dict(tokens.environ, environ):
+        tokens.hmac_keys.cache_clear()
+        tokens.ed25519_keys.cache_clear()
+        tokens.verifier.clear()
+        yield
+    tokens.hmac_keys.cache_clear()
+    tokens.ed25519_keys.cache_clear()
+    tokens.verifier.clear()
+
+
+@pytest.fixture
+def token_mode():
+    lookup = mock.Mock(side_effect=KeyError)
+    with mock.patch.object(core, "TOKEN_MODE", "prefer"), mock.patch.object(
+        core, "lookup_client", lookup
+    ):
+        yield lookup
+
+
+@pytest.mark.parametrize("key,kid", [(HMAC_KEY, "k1"), (SIGNING_KEY, "ed")])
+def test_verify(key, kid):
+    verified = TokenVerifier().verify(sign_token(claims(), key, kid), "device-1")
+    assert verified.sub == "device-1" and verified.connect
+    assert verified.read == ("cmd/${iot:ClientId}/#",)
+    assert verified.write == ("telemetry/${iot:ClientId}",)
+
+
+@pytest.mark.parametrize(
+    "token,client_id",
+    [
+        (sign_token(claims(), HMAC_KEY, "k1"), "device-2"),
+        (sign_token(claims(exp=int(time()) - 3600), HMAC_KEY, "k1"), "device-1"),
+        # Less than IoT Core's shortest connection left
+        (sign_token(claims(exp=int(time()) + 120), HMAC_KEY, "k1"), "device-1"),
+        (sign_token(claims(nbf=int(time()) + 3600), HMAC_KEY, "k1"), "device-1"),
+        (sign_token(claims(), b"wrong key", "k1"), "device-1"),
+        (sign_token(claims(), HMAC_KEY, "unknown"), "device-1"),
+        (sign_token(claims(), Ed25519PrivateKey.generate(), "ed"), "device-1"),
+        (sign_token(claims(), HMAC_KEY, "k1")[:-4], "device-1"),
+        ("a.b", "device-1"),
+        ("é.b.c", "device-1"),
+    ],
+)
+def test_rejected(token, client_id):
+    with pytest.raises(InvalidToken):
+        TokenVerifier().verify(token, client_id)
+
+
+@pytest.mark.parametrize(
+    "header", [dict(alg="HS256", kid=["a"]), dict(alg="HS256", kid={}), dict(alg=[])]
+)
+def test_malformed_header_rejected(header, token_mode):
+    token = sign_token(claims(), HMAC_KEY, "k1")
+    token = ".".join(
+        [tokens._b64url_encode(json.dumps(header).encode()), *token.split(".")[1:]]
+    )
+    with pytest.raises(InvalidToken):
+        TokenVerifier().verify(token, "device-1")
+    # Not a token at all, so a device sending it goes to the table
+    policy = core.authorize(parse_event(event(token=token)))
+    assert policy["isAuthenticated"] is False
+
+
+def test_token_about_to_expire_is_denied(token_mode):
+    token = sign_token(claims(exp=int(time()) + 60), HMAC_KEY, "k1")
+    assert app.lambda_handler(event(password=token), None)["isAuthenticated"] is False
+    token = sign_token(claims(exp=int(time()) + 400), HMAC_KEY, "k1")
+    policy = app.lambda_handler(event(password=token), None)
+    assert 300 <= policy["disconnectAfterInSeconds"] <= 400
+
+
+def test_alg_none_rejected():
+    token = sign_token(claims(), HMAC_KEY, "k1")
+    header = tokens._b64url_encode(json.dumps(dict(alg="none")).encode())
+    with pytest.raises(InvalidToken):
+        TokenVerifier().verify(".".join([header, token.split(".")[1], ""]), "device-1")
+
+
+def test_verified_tokens_are_remembered():
+    verifier = TokenVerifier()
+    token = sign_token(claims(), SIGNING_KEY, "ed")
+    verifier.verify(token, "device-1")
+    with mock.patch.object(tokens, "_check_signature") as check:
+        verifier.verify(token, "device-1")
+        with pytest.raises(InvalidToken):  # Still bound to its client
+            verifier.verify(token, "device-2")
+    check.assert_not_called()
+
+
+def test_token_as_password_skips_lookup(token_mode):
+    token = sign_token(claims(), HMAC_KEY, "k1")
+    policy = app.lambda_handler(event(password=token), None)
+    assert policy["isAuthenticated"] is True
+    granted = json.dumps(policy["policyDocuments"])
+    assert "topic/telemetry/device-1" in granted
+    assert "topicfilter/cmd/device-1/#" in granted
+    assert policy["disconnectAfterInSeconds"] <= 3600
+    token_mode.assert_not_called()
+
+
+def test_signed_authorizer_token(token_mode):
+    token = sign_token(claims(), SIGNING_KEY, "ed")
+    policy = app.lambda_handler(event(token=token), None)
+    assert policy["isAuthenticated"] is True
+    token_mode.assert_not_called()
+
+
+def test_invalid_token_is_denied_without_lookup(token_mode):
+    token = sign_token(claims(sub="device-2"), HMAC_KEY, "k1")
+    assert app.lambda_handler(event(password=token), None)["isAuthenticated"] is False
+    token_mode.assert_not_called()
+
+
+def test_legacy_devices_fall_back_to_table(token_mode):
+    assert app.lambda_handler(event(password="plain"), None)["isAuthenticated"] is False
+    token_mode.assert_called_once_with("device-1")
+    with mock.patch.object(core, "TOKEN_MODE", "require"):
+        app.lambda_handler(event(password="plain"), None)
+    token_mode.assert_called_once()
+
+
+def test_legacy_signed_authorizer_falls_back_to_table(token_mode):
+    # A signed authorizer whose token isn't one of ours, the device is on a password
+    legacy = deepcopy(mqtt_auth_verify)
+    assert app.lambda_handler(legacy, None)["isAuthenticated"] is False
+    assert legacy["token"] == "tokenName"
+    token_mode.assert_called_once_with(legacy["protocolData"]["mqtt"]["clientId"])
+    with mock.patch.object(core, "TOKEN_MODE", "require"):
+        app.lambda_handler(legacy, None)
+    token_mode.assert_called_once()
+
+
+def test_require_signature_verification_denies():
+    lookup = mock.Mock(side_effect=KeyError)
+    with mock.patch.object(
+        core, "REQUIRE_SIGNATURE_VERIFICATION", True
+    ), mock.patch.object(core, "lookup_client", lookup):
+        policy = app.lambda_handler(event(password="plain"), None)
+    assert policy["isAuthenticated"] is False
+    lookup.assert_not_called()
+
+
+def test_require_signature_verification_async():
+    backend = DynamoBackend(FakeTable({"CLIENT": ITEM}))
+    authorizer = AsyncAuthorizer(lambda c: core.get_details_for_client_id(c, backend))
+    try:
+        with mock.patch.object(core, "REQUIRE_SIGNATURE_VERIFICATION", True):
+            denied = asyncio.run(authorizer.handle_event(table_event()))
+            verified = dict(table_event(), signatureVerified=True)
+            allowed = asyncio.run(authorizer.handle_event(verified))
+    finally:
+        authorizer.close()
+    assert denied["isAuthenticated"] is False
+    assert allowed["isAuthenticated"] is True